@@ -1,30 +1,21 @@
 from PyQt6.QtWidgets import QApplication, QMainWindow, QFileDialog
-from PyQt6.QtGui import QPixmap
+from PyQt6.QtGui import QPixmap, QShortcut, QKeySequence
+from PyQt6.QtCore import QTimer
 from Lastest import Ui_MainWindow
-from paddleocr import PaddleOCR, draw_ocr
-from PIL import Image
-import pandas as pd
+import shutil
 import re
 import cv2
 import unicodedata
-
-
-
-# ocr = PaddleOCR(use_angle_cls=True,
-#                 lang='vi',
-#                 det_model_dir="inference/SAST",
-#                 rec_model_dir="inference/SRN_Lastest",
-#                 det_algorithm="SAST",
-#                 rec_char_dict_path="Train/vietnamese/vn_dictionary.txt")
-
-ocr = PaddleOCR(use_angle_cls=True,
-                lang='vi',
-                use_gpu='false',
-                det_model_dir="inference/SAST",
-                rec_model_dir="inference/SRN_Final",
-                rec_image_shape="1, 64, 256",
-                det_algorithm="SAST",
-                rec_char_dict_path="Test/vi_vietnam.txt" )
+from ocr_worker import OcrWorker
+from camera_stream import AutoCapture, draw_status
+from ocr_pipeline import ocr_images
+from ocr_cache import OcrCache
+import metrics
+from export_sink import ExportSink
+from layout import assemble_lines, lines_text
+from ocr_correct import correct_labels
+from image_io import read_image, to_qimage, save_debug_image, save_debug_text
+from preview import preview_enabled, render_preview
 
 
 
@@ -36,31 +27,8 @@ def normalize_text(text):
     return text.strip()
 
 def fix_common_ocr_errors(text):
-    corrections = {
-        'Place of orign': 'Place of origin',
-        'Freadom': 'Freedom',
-        'Ho va tenFull name': 'Ho va ten Full name',
-        'Họ và tên Fuil name':'Ho va ten Full name',
-        'Hovà tên Fullname':'Ho va ten Full name',
-        'Noi thuong truPlace of residence': 'Noi thuong tru Place of residence',
-        'Date ofexpiry': 'Date of expiry',
-        'Quốc tịch Natiohality':'Nationality',
-        'Place of origin:':'Place of origin',
-        'Ngay sinhDate of birth': 'Ngay sinh Date of birth',
-        'Date of birth,':'Ngay sinh Date of birth',
-        'Sex.Nam': 'Sex: Nam',
-        'Sex.Nu': 'Sex: Nu',
-        'Nationality.':'Nationality',
-        'Họ và tên Full Tname':'Ho va ten Full name',
-        'Quê quán Place f onigin':'Place of origin',
-        'Place of ferginn':'Place of origin',
-        'Date of binth':'Date of birth',
-        'Date of bint:':'Date of birth',
-        'Date of birth!':'Date of birth'
-    }
-    for wrong, right in corrections.items():
-        text = text.replace(wrong, right)
-    return text
+    # Sửa nhãn sai chính tả bằng khớp mờ thay cho bảng thay thế cố định
+    return correct_labels(text)
 
 
 def clean_field(value):
@@ -112,78 +80,109 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
+        # Ảnh xem trước được vẽ sẵn đúng cỡ khung lbAnh trên luồng OCR
+        self.preview_size = (self.ui.lbAnh.width(), self.ui.lbAnh.height())
 
         self.ui.btChonAnh.clicked.connect(self.select_image)
         self.ui.btTrichXuat.clicked.connect(self.trich_xuat_thong_tin)
         self.last_text = ""
         self.ui.btQuetAnhCam.clicked.connect(self.quet_anh_camera)
         self.ui.btExport.clicked.connect(self.xuat_excel)
-        self.extracted_data = []  # Danh sách lưu trữ các thông tin đã trích xuất
+        # Ghi nối tiếp từng bản ghi ra file ngay khi trích xuất, tắt ứng dụng giữa chừng vẫn còn dữ liệu
+        self.sink = ExportSink('du_lieu_trich_xuat_my.csv', fields=['CCCD', 'Name', 'Date', 'Sex', 'Nation', 'Place of Origin'])
+        # write() chỉ xét flush_interval khi có bản ghi mới: bản ghi cuối của một lượt quét nằm trong bộ đệm
+        # tới khi đóng cửa sổ, nên ghi xuống đĩa định kỳ bằng QTimer (batch_ocr vẫn gom theo lô)
+        self.flush_timer = QTimer(self)
+        self.flush_timer.timeout.connect(self.sink.flush)
+        self.flush_timer.start(int(self.sink.flush_interval * 1000))
+
+        self.cache = OcrCache()  # Lưu đệm kết quả OCR theo nội dung ảnh
+        metrics.enable()  # Đo thời gian từng công đoạn, hiển thị trên thanh trạng thái
+
+        # OCR chạy ở luồng nền theo hàng đợi (nạp mô hình trước), cửa sổ mở ngay và không bị treo
+        self.worker = OcrWorker(self.xu_ly_anh_ocr)
+        self.worker.engine_ready.connect(lambda: self.ui.statusbar.showMessage("✅ Mô hình đã sẵn sàng."))
+        self.worker.job_progress.connect(lambda job_id, text: self.ui.statusbar.showMessage(f"[#{job_id}] {text}"))
+        self.worker.job_finished.connect(self.hien_thi_ket_qua)
+        self.worker.job_failed.connect(lambda job_id, err: self.ui.txtChu.setPlainText(f"❌ Lỗi OCR: {err}"))
+        self.worker.job_cancelled.connect(lambda job_id: self.ui.statusbar.showMessage(f"[#{job_id}] Đã hủy."))
+        self.worker.queue_changed.connect(self.cap_nhat_hang_doi)
+        self.worker.start()
+        # ESC: hủy các ảnh đang chờ và ảnh đang nhận diện
+        QShortcut(QKeySequence("Esc"), self, activated=self.worker.cancel_all)
+
+        self.cap = None
+        self.auto_capture = None  # AutoCapture khi bật chế độ quét liên tục
+        self.camera_timer = QTimer(self)
+        self.camera_timer.timeout.connect(self.doc_khung_hinh)
 
     def  select_image(self):
         file_path, _ = QFileDialog.getOpenFileName(self,"Chọn ảnh OCR","","Image Files (*.jpg *.jpeg *.png *.bmp)")
         if file_path:
-            result = ocr.ocr(file_path, cls=True)
-            image = Image.open(file_path).convert('RGB')
-            boxes = [line[0] for res in result for line in res]
-            txts = [line[1][0] for res in result for line in res]
-            if not txts:
-                self.ui.txtChu.setPlainText("❌ Không phát hiện ra chữ. Vui lòng chọn lại ảnh.")
-                self.ui.txtChu_2.setPlainText("")
-                return
-            scores = [line[1][1] for res in result for line in res]
-            im_draw = draw_ocr(image, boxes, font_path='PaddleOCR/doc/fonts/latin.ttf')
-            im_draw = Image.fromarray(im_draw)
-            im_draw.save("ocr_result.jpg")  # tạm thời lưu
-            pixmap = QPixmap("ocr_result.jpg")
-            self.ui.lbAnh.setPixmap(pixmap.scaled(self.ui.lbAnh.size()))
-
-            full_text = " ".join(txts)
-            with open("test.txt", "w", encoding="utf-8") as f:
-                f.write(full_text)
-            self.last_text = full_text
-            self.ui.txtChu.setPlainText(full_text)
+            self.worker.submit(read_image(file_path), "❌ Không phát hiện ra chữ. Vui lòng chọn lại ảnh.")
 
     def xuat_excel(self):
-        if not self.extracted_data:
+        self.sink.flush()
+        if not self.sink.count:
             self.ui.txtChu_2.setPlainText("⚠️ Không có dữ liệu để xuất.")
             return
 
-        df = pd.DataFrame(self.extracted_data)
-
         save_path, _ = QFileDialog.getSaveFileName(self, "Lưu file CSV", "thong_tin_ocr.csv", "CSV Files (*.csv)")
         if save_path:
-            df.to_csv(save_path, index=False, encoding='utf-8-sig')
-            self.ui.txtChu_2.append("\n✅ Đã xuất toàn bộ thông tin ra file CSV.")
-
-    def xu_ly_anh_ocr(self,file_path):
-        result = ocr.ocr(file_path, cls=True)
-        image = Image.open(file_path).convert('RGB')
+            with metrics.timer('export'):
+                shutil.copyfile(self.sink.path, save_path)
+            self.ui.txtChu_2.append(f"\n✅ Đã xuất {self.sink.count} bản ghi ra file CSV.")
+
+    def xu_ly_anh_ocr(self, image, progress, thong_bao_loi="❌ Không phát hiện ra chữ. Vui lòng chụp lại ảnh."):
+        # Chạy trên luồng OcrWorker: không được đụng tới widget, chỉ trả kết quả về
+        # image là mảng BGR (từ file hoặc camera), toàn bộ xử lý trong bộ nhớ
+        progress("Đang nhận diện...")
+        with metrics.timer('card'):
+            return self._xu_ly_anh(image, progress, thong_bao_loi)
+
+    def _xu_ly_anh(self, image, progress, thong_bao_loi):
+        # refine: chỉ nhận diện lại các hộp của trường kém tin cậy hoặc sai định dạng; kết quả trong cache
+        # đã refine nên ảnh trúng cache không chạy lại
+        result = ocr_images([image], cache=self.cache, refine=True)[0]
+        stats = self.cache.stats()
+        progress(f"Cache: {stats['hits']} hit / {stats['misses']} miss")
+        if not any(result):
+            return {'error': thong_bao_loi}
+        lines = assemble_lines(result)
         boxes = [line[0] for res in result for line in res]
-        txts = [line[1][0] for res in result for line in res]
-        scores = [line[1][1] for res in result for line in res]
-        txts = [line[1][0] for res in result for line in res]
-        if not txts:
-            self.ui.txtChu.setPlainText("❌ Không phát hiện ra chữ. Vui lòng chụp lại ảnh.")
+        view = None
+        if preview_enabled():
+            with metrics.timer('draw'):
+                view = render_preview(image, boxes, self.preview_size)
+            save_debug_image("ocr_result.jpg", view)
+
+        full_text = lines_text(lines, "\n")
+        save_debug_text("test.txt", full_text)
+        return {'text': full_text, 'lines': lines, 'overlay': to_qimage(view) if view is not None else None}
+
+    def hien_thi_ket_qua(self, job_id, out):
+        self.ui.statusbar.showMessage(metrics.metrics.summary(['detect', 'cls', 'rec', 'draw', 'card']))
+        if 'error' in out:
+            self.ui.txtChu.setPlainText(out['error'])
             self.ui.txtChu_2.setPlainText("")
             return
-        im_draw = draw_ocr(image, boxes, font_path='PaddleOCR/doc/fonts/latin.ttf')
-
-        im_draw = Image.fromarray(im_draw)
+        self.hien_thi_anh(out['overlay'])
+        self.last_text = out['text']
+        self.ui.txtChu.setPlainText(out['text'])
 
-        im_draw.save("ocr_result.jpg")  # tạm thời lưu
-        pixmap = QPixmap("ocr_result.jpg")
-        self.ui.lbAnh.setPixmap(pixmap.scaled(self.ui.lbAnh.size()))
+    def hien_thi_anh(self, overlay):
+        # overlay đã đúng cỡ khung, không scale lại trên luồng giao diện
+        if overlay is not None:
+            self.ui.lbAnh.setPixmap(QPixmap.fromImage(overlay))
 
-        full_text = " ".join(txts)
-        with open("test.txt", "w", encoding="utf-8") as f:
-            f.write(full_text)
-        self.last_text = full_text
-        self.ui.txtChu.setPlainText(full_text)
+    def cap_nhat_hang_doi(self, pending):
+        if pending:
+            self.ui.statusbar.showMessage(f"⏳ Còn {pending} ảnh đang chờ nhận diện.")
 
     def trich_xuat_thong_tin(self):
         text = self.ui.txtChu.toPlainText()
-        info = extract_info(text)
+        with metrics.timer('parse'):
+            info = extract_info(text)
 
         self.ui.txtChu_2.clear()
         if not info:
@@ -194,38 +193,63 @@ class MainWindow(QMainWindow, Ui_MainWindow):
                 result_text += f"{key}: {value}\n"
             self.ui.txtChu_2.setPlainText(result_text)
 
-        self.extracted_data.append(info)
+        if info:
+            self.sink.write(info)
 
 
     def quet_anh_camera(self):
+        if self.cap is not None:
+            return
         cap = cv2.VideoCapture(0)
         if not cap.isOpened():
             self.ui.txtChu.setPlainText("Không mở được camera.")
             return
 
-        self.ui.txtChu.setPlainText("Nhấn SPACE để chụp, ESC để thoát.")
+        self.ui.txtChu.setPlainText("Nhấn SPACE để chụp (chụp tiếp được khi đang nhận diện), "
+                                    "A để bật/tắt tự chụp khi thẻ nét và đứng yên, ESC để thoát.")
+        self.cap = cap
+        # Đọc khung hình bằng QTimer thay cho vòng lặp while để không chặn giao diện
+        self.camera_timer.start(30)
 
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+    def doc_khung_hinh(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            self.dong_camera()
+            return
 
+        if self.auto_capture is not None:
+            # Chế độ tự chụp: chỉ gửi OCR khung nét nhất khi thẻ đã đứng yên
+            best = self.auto_capture.feed(frame)
+            cv2.imshow("Camera - Space to take picture", draw_status(frame, self.auto_capture))
+            if best is not None:
+                save_debug_image("captured_image.jpg", best)
+                self.worker.submit(best)
+        else:
             cv2.imshow("Camera - Space to take picture", frame)
 
-            key = cv2.waitKey(1)
-            if key == 27:  # ESC
-                break
-            elif key == 32:  # SPACE
-                img_path = "captured_image.jpg"
-                cv2.imwrite(img_path, frame)
-                self.xu_ly_anh_ocr(img_path)
-                break
-
-        cap.release()
+        key = cv2.waitKey(1)
+        if key == 27:  # ESC
+            self.dong_camera()
+        elif key == 32:  # SPACE
+            save_debug_image("captured_image.jpg", frame)
+            self.worker.submit(frame.copy())
+        elif key in (ord('a'), ord('A')):  # Bật/tắt tự chụp
+            self.auto_capture = None if self.auto_capture is not None else AutoCapture()
+
+    def dong_camera(self):
+        self.camera_timer.stop()
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
         cv2.destroyAllWindows()
 
-
-
+    def closeEvent(self, event):
+        self.dong_camera()
+        self.worker.stop()
+        self.flush_timer.stop()
+        self.sink.close()
+        self.cache.close()
+        super().closeEvent(event)
 
 
 if __name__ == "__main__":
@@ -1,125 +1,23 @@
 from PyQt6.QtWidgets import QApplication, QMainWindow, QFileDialog
-from PyQt6.QtGui import QPixmap
+from PyQt6.QtGui import QPixmap, QShortcut, QKeySequence
+from PyQt6.QtCore import QTimer
 from Lastest import Ui_MainWindow
-from paddleocr import PaddleOCR, draw_ocr
-from PIL import Image
-import pandas as pd
-import re
+import shutil
+import time
 import cv2
-import unicodedata
-
-
-
-# ocr = PaddleOCR(use_angle_cls=True,
-#                 lang='vi',
-#                 det_model_dir="inference/SAST",
-#                 rec_model_dir="inference/SRN_Lastest",
-#                 det_algorithm="SAST",
-#                 rec_char_dict_path="Train/vietnamese/vn_dictionary.txt")
-
-ocr = PaddleOCR(use_angle_cls=True,
-                lang='vi',
-                use_gpu='false',
-                det_model_dir="inference/SAST",
-                rec_model_dir="inference/SRN_Final",
-                rec_image_shape="1, 64, 256",
-                det_algorithm="SAST",
-                rec_char_dict_path="Test/vi_vietnam.txt" )
-
-
-
-STOP_KEYWORDS = [
-    "Ngày sinh", "Date of birth", "Giới tính", "Sex",
-    "Quốc tịch", "Nationality", "Quê quán", "Place of origin",
-    "Nơi thường trú", "Place of residence", "Có giá trị", "Date", "Ngày hết hạn"
-]
-STOP_PATTERN = r'(?=\b(?:' + '|'.join(map(re.escape, STOP_KEYWORDS)) + r')\b)'
-
-def normalize_text(text: str) -> str:
-    text = unicodedata.normalize('NFC', text)
-    text = text.replace('\n', ' ')
-    text = re.sub(r'\s+', ' ', text)
-    return text.strip()
-
-def fix_common_ocr_errors(text: str) -> str:
-    corrections = [
-        (r'place of orign', 'Place of origin'),
-        (r'freadom', 'freedom'),
-        (r'ho\s*v[aà]\s*t[eê]n\s*full\s*name', 'Họ và tên Full name'),
-        (r'HO\s*v[AÀ]\s*t[eê]n\s*full\s*name', 'Họ và tên Full name'),
-        (r'no[ií]\s*thu[ơo]ng\s*tru\s*place\s*of\s*residence', 'Place of residence'),
-        (r'date of( binth| bint| expiry| birth[!,:]?)', 'Date of birth'),
-        (r'sex[.\s]?(nam|nu)', r'Sex: \1'),
-        (r'qu[ôo]c\s*t[ịi]ch\s*natiohality', 'Nationality'),
-        (r'place of ferginn', 'Place of origin'),
-        (r'place of origin:?', 'Place of origin'),
-        (r'place of forgins?', 'Place of origin'),
-        (r'place of tri residence', 'Place of residence'),
-        (r'date afexpiry', 'Date of expiry'),
-    ]
-    for pattern, repl in corrections:
-        text = re.sub(pattern, repl, text, flags=re.IGNORECASE)
-    return text
-
-def postprocess_info(info: dict) -> dict:
-    if 'Quốc tịch' in info and info['Quốc tịch']:
-        info['Quốc tịch'] = re.split(r'\bQuê quán\b', info['Quốc tịch'], flags=re.IGNORECASE)[0].strip()
-
-    for key in ['Quê quán', 'Nơi thường trú']:
-        if key in info and info[key]:
-            # Xóa nhãn tiếng Anh và cắt nếu dính nhãn sau
-            info[key] = re.sub(r'\b(?:Place of origin|Place of residence)\b', '', info[key], flags=re.IGNORECASE)
-            info[key] = re.split(r'\b(Có giá trị|Ngày hết hạn|Date|CỎ|GIÁ|DATE)\b', info[key])[0].strip()
-
-    if 'Họ và tên' in info and info['Họ và tên']:
-        info['Họ và tên'] = re.sub(r'\b(Họ và tên|Full name)\b[\s:/.-]*', '', info['Họ và tên'], flags=re.IGNORECASE).strip()
-        info['Họ và tên'] = re.split(STOP_PATTERN, info['Họ và tên'])[0].strip()
-
-    return info
-
-def extract_info(text: str) -> dict:
-    result = {}
-    text = normalize_text(text)
-    text = fix_common_ocr_errors(text)
-
-    # CCCD
-    m = re.search(r'\b\d{12}\b', text)
-    result['CCCD'] = m.group() if m else None
-
-    # Họ và tên
-    m = re.search(r'(?:Họ và tên|Ho va ten|Full name)[\s:/.-]*([A-ZÀ-ỴĐ][A-ZÀ-ỴĐ\s]{2,}?)(?=' + STOP_PATTERN + ')', text, re.IGNORECASE)
-    result['Họ và tên'] = m.group(1).strip() if m else None
-
-    # Ngày sinh
-    m = re.search(r'(?:Ngày sinh|Date of birth)[\s:/.-]*([0-3]?\d[/-][01]?\d[/-]\d{4})', text, re.IGNORECASE)
-    result['Ngày sinh'] = m.group(1) if m else None
-
-    # Giới tính
-    m = re.search(r'(?:Giới tính|Sex)[\s:/.-]*([Nn]am|[Nn]ữ|[Nn]u)', text, re.IGNORECASE)
-    result['Giới tính'] = m.group(1).capitalize() if m else None
-
-    # Quốc tịch
-    m = re.search(r'(?:Quốc tịch|Nationality)[\s:/.-]*([A-Za-zÀ-Ỹà-ỹ\s]{3,})(?=' + STOP_PATTERN + ')', text, re.IGNORECASE)
-    result['Quốc tịch'] = m.group(1).strip().title() if m else None
-
-    # Quê quán
-    m = re.search(r'(?:Quê quán|Place of origin)[\s:/.-]*([A-Za-zÀ-Ỹà-ỹ,\s]+?)(?=' + STOP_PATTERN + ')', text, re.IGNORECASE)
-    result['Quê quán'] = m.group(1).strip() if m else None
-
-    # Nơi thường trú
-    m = re.search(r'(?:Nơi thường trú|Place of residence)[\s:/.-]*([A-Za-zÀ-Ỹà-ỹ,\s]+?)(?=' + STOP_PATTERN + ')', text, re.IGNORECASE)
-    result['Nơi thường trú'] = m.group(1).strip() if m else None
-
-    # Ngày hết hạn
-    dates = re.findall(r'\d{2}/\d{2}/\d{4}', text)
-    if len(dates) >= 2:
-        result['Ngày hết hạn'] = dates[-1]
-    elif len(dates) == 1:
-        result['Ngày hết hạn'] = dates[0]
-    else:
-        result['Ngày hết hạn'] = None
-
-    return postprocess_info(result)
+from ocr_worker import OcrWorker
+from camera_stream import AutoCapture, draw_status
+from ocr_pipeline import ocr_images, ocr_and_extract, REFINE_MIN_SCORE
+from ocr_cache import OcrCache
+import metrics
+from export_sink import ExportSink
+from layout import assemble_lines, lines_text
+from image_io import to_qimage, save_debug_image, save_debug_text
+from doc_types import extract as extract_info, extract_scored, all_fields, TYPE_KEY
+from mrz import cross_check
+from sheet_scan import page_count, read_page, split_sheet
+from record_store import RecordStore
+from preview import preview_enabled, render_preview
 
 
 class MainWindow(QMainWindow, Ui_MainWindow):
@@ -128,78 +26,164 @@ class MainWindow(QMainWindow, Ui_MainWindow):
 
         self.ui = Ui_MainWindow()
         self.ui.setupUi(self)
+        # Ảnh xem trước được vẽ sẵn đúng cỡ khung lbAnh trên luồng OCR
+        self.preview_size = (self.ui.lbAnh.width(), self.ui.lbAnh.height())
 
         self.ui.btChonAnh.clicked.connect(self.select_image)
         self.ui.btTrichXuat.clicked.connect(self.trich_xuat_thong_tin)
         self.last_text = ""
+        self.last_lines = []  # Các dòng (kèm tọa độ) của lần OCR gần nhất
+        self.front_info = {}  # Thông tin mặt trước CCCD gần nhất, để đối chiếu với MRZ mặt sau
         self.ui.btQuetAnhCam.clicked.connect(self.quet_anh_camera)
         self.ui.btExport.clicked.connect(self.xuat_excel)
-        self.extracted_data = []  # Danh sách lưu trữ các thông tin đã trích xuất
+        # Ghi nối tiếp từng bản ghi ra file ngay khi trích xuất, tắt ứng dụng giữa chừng vẫn còn dữ liệu
+        self.sink = ExportSink(fields=all_fields())
+        # write() chỉ xét flush_interval khi có bản ghi mới: bản ghi cuối của một lượt quét nằm trong bộ đệm
+        # tới khi đóng cửa sổ, nên ghi xuống đĩa định kỳ bằng QTimer (batch_ocr vẫn gom theo lô)
+        self.flush_timer = QTimer(self)
+        self.flush_timer.timeout.connect(self.sink.flush)
+        self.flush_timer.start(int(self.sink.flush_interval * 1000))
+        # Kho hồ sơ (SQLite, chỉ mục theo CCCD và họ tên + ngày sinh): người đã quét không bị ghi thêm dòng
+        self.store = RecordStore()
+
+        self.cache = OcrCache()  # Lưu đệm kết quả OCR theo nội dung ảnh
+        metrics.enable()  # Đo thời gian từng công đoạn, hiển thị trên thanh trạng thái
+
+        # OCR chạy ở luồng nền theo hàng đợi (nạp mô hình trước), cửa sổ mở ngay và không bị treo
+        self.worker = OcrWorker(self.xu_ly_anh_ocr)
+        self.worker.engine_ready.connect(lambda: self.ui.statusbar.showMessage("✅ Mô hình đã sẵn sàng."))
+        self.worker.job_progress.connect(lambda job_id, text: self.ui.statusbar.showMessage(f"[#{job_id}] {text}"))
+        self.worker.job_finished.connect(self.hien_thi_ket_qua)
+        self.worker.job_failed.connect(lambda job_id, err: self.ui.txtChu.setPlainText(f"❌ Lỗi OCR: {err}"))
+        self.worker.job_cancelled.connect(lambda job_id: self.ui.statusbar.showMessage(f"[#{job_id}] Đã hủy."))
+        self.worker.queue_changed.connect(self.cap_nhat_hang_doi)
+        self.worker.start()
+        # ESC: hủy các ảnh đang chờ và ảnh đang nhận diện
+        QShortcut(QKeySequence("Esc"), self, activated=self.worker.cancel_all)
+
+        self.cap = None
+        self.auto_capture = None  # AutoCapture khi bật chế độ quét liên tục
+        self.camera_timer = QTimer(self)
+        self.camera_timer.timeout.connect(self.doc_khung_hinh)
 
     def  select_image(self):
-        file_path, _ = QFileDialog.getOpenFileName(self,"Chọn ảnh OCR","","Image Files (*.jpg *.jpeg *.png *.bmp)")
-        if file_path:
-            result = ocr.ocr(file_path, cls=True)
-            image = Image.open(file_path).convert('RGB')
-            boxes = [line[0] for res in result for line in res]
-            txts = [line[1][0] for res in result for line in res]
-            if not txts:
-                self.ui.txtChu.setPlainText("❌ Không phát hiện ra chữ. Vui lòng chọn lại ảnh.")
-                self.ui.txtChu_2.setPlainText("")
-                return
-            scores = [line[1][1] for res in result for line in res]
-            im_draw = draw_ocr(image, boxes, font_path='PaddleOCR/doc/fonts/latin.ttf')
-            im_draw = Image.fromarray(im_draw)
-            im_draw.save("ocr_result.jpg")  # tạm thời lưu
-            pixmap = QPixmap("ocr_result.jpg")
-            self.ui.lbAnh.setPixmap(pixmap.scaled(self.ui.lbAnh.size()))
-
-            full_text = " ".join(txts)
-            with open("test.txt", "w", encoding="utf-8") as f:
-                f.write(full_text)
-            self.last_text = full_text
-            self.ui.txtChu.setPlainText(full_text)
+        file_path, _ = QFileDialog.getOpenFileName(self,"Chọn ảnh OCR","",
+                                                   "Image Files (*.jpg *.jpeg *.png *.bmp *.tif *.tiff *.pdf)")
+        if not file_path:
+            return
+        # Mỗi trang một việc, trang chỉ được đọc khi tới lượt nhận diện. Ảnh JPG/PNG là một trang và cũng
+        # được tách thẻ (split_sheet), vì trang scan nhiều thẻ thường được lưu thẳng thành ảnh.
+        for index in range(page_count(file_path)):
+            self.worker.submit((file_path, index), "❌ Không phát hiện ra chữ. Vui lòng chọn lại ảnh.")
 
     def xuat_excel(self):
-        if not self.extracted_data:
+        self.sink.flush()
+        if not self.sink.count:
             self.ui.txtChu_2.setPlainText("⚠️ Không có dữ liệu để xuất.")
             return
 
-        df = pd.DataFrame(self.extracted_data)
-
         save_path, _ = QFileDialog.getSaveFileName(self, "Lưu file CSV", "thong_tin_ocr.csv", "CSV Files (*.csv)")
         if save_path:
-            df.to_csv(save_path, index=False, encoding='utf-8-sig')
-            self.ui.txtChu_2.append("\n✅ Đã xuất toàn bộ thông tin ra file CSV.")
-
-    def xu_ly_anh_ocr(self,file_path):
-        result = ocr.ocr(file_path, cls=True)
-        image = Image.open(file_path).convert('RGB')
+            with metrics.timer('export'):
+                shutil.copyfile(self.sink.path, save_path)
+            self.ui.txtChu_2.append(f"\n✅ Đã xuất {self.sink.count} bản ghi ra file CSV.")
+
+    def xu_ly_anh_ocr(self, image, progress, thong_bao_loi="❌ Không phát hiện ra chữ. Vui lòng chụp lại ảnh."):
+        # Chạy trên luồng OcrWorker: không được đụng tới widget, chỉ trả kết quả về
+        # image là mảng BGR (từ file hoặc camera), toàn bộ xử lý trong bộ nhớ
+        progress("Đang nhận diện...")
+        with metrics.timer('card'):
+            return self._xu_ly_anh(image, progress, thong_bao_loi)
+
+    def _xu_ly_anh(self, image, progress, thong_bao_loi):
+        if isinstance(image, tuple):
+            path, index = image
+            image = read_page(path, index)
+            # Trang scan nhiều thẻ: nhận diện mọi thẻ chung một lượt, mỗi thẻ một bản ghi
+            cards = split_sheet(image)
+            if len(cards) > 1:
+                return self._xu_ly_trang(path, index, image, cards, progress)
+        # refine: chỉ nhận diện lại các hộp của trường kém tin cậy hoặc sai định dạng; kết quả trong cache
+        # đã refine nên ảnh trúng cache không chạy lại
+        result = ocr_images([image], cache=self.cache, refine=True)[0]
+        stats = self.cache.stats()
+        progress(f"Cache: {stats['hits']} hit / {stats['misses']} miss")
+        if not any(result):
+            return {'error': thong_bao_loi}
+        lines = assemble_lines(result)
         boxes = [line[0] for res in result for line in res]
-        txts = [line[1][0] for res in result for line in res]
-        scores = [line[1][1] for res in result for line in res]
-        txts = [line[1][0] for res in result for line in res]
-        if not txts:
-            self.ui.txtChu.setPlainText("❌ Không phát hiện ra chữ. Vui lòng chụp lại ảnh.")
+        view = None
+        if preview_enabled():
+            with metrics.timer('draw'):
+                view = render_preview(image, boxes, self.preview_size)
+            save_debug_image("ocr_result.jpg", view)
+
+        full_text = lines_text(lines, "\n")
+        save_debug_text("test.txt", full_text)
+        return {'text': full_text, 'lines': lines, 'overlay': to_qimage(view) if view is not None else None}
+
+    def _xu_ly_trang(self, path, index, page, cards, progress):
+        progress(f"Trang {index + 1}: {len(cards)} thẻ")
+        out = ocr_and_extract([card for card, _ in cards], extract_info, cache=self.cache, rectify=False)
+        records = []
+        for (_, pos), (_, text, info) in zip(cards, out):
+            records.append({'file': path, 'page': index + 1, 'card': pos['card'], 'row': pos['row'],
+                            'col': pos['col'], 'text': text, 'info': info or {}})
+        overlay = None
+        if preview_enabled():
+            # Xem trước cả trang với khung của từng thẻ đã tách
+            with metrics.timer('draw'):
+                overlay = to_qimage(render_preview(page, [pos['quad'] for _, pos in cards], self.preview_size))
+        return {'cards': records, 'overlay': overlay}
+
+    def hien_thi_ket_qua(self, job_id, out):
+        self.ui.statusbar.showMessage(metrics.metrics.summary(['detect', 'cls', 'rec', 'draw', 'card']))
+        if 'error' in out:
+            self.ui.txtChu.setPlainText(out['error'])
             self.ui.txtChu_2.setPlainText("")
             return
-        im_draw = draw_ocr(image, boxes, font_path='PaddleOCR/doc/fonts/latin.ttf')
-
-        im_draw = Image.fromarray(im_draw)
-
-        im_draw.save("ocr_result.jpg")  # tạm thời lưu
-        pixmap = QPixmap("ocr_result.jpg")
-        self.ui.lbAnh.setPixmap(pixmap.scaled(self.ui.lbAnh.size()))
-
-        full_text = " ".join(txts)
-        with open("test.txt", "w", encoding="utf-8") as f:
-            f.write(full_text)
-        self.last_text = full_text
-        self.ui.txtChu.setPlainText(full_text)
+        if 'cards' in out:
+            self.hien_thi_anh(out['overlay'])
+            self.hien_thi_trang(out['cards'])
+            return
+        self.hien_thi_anh(out['overlay'])
+        self.last_text = out['text']
+        self.last_lines = out['lines']
+        self.ui.txtChu.setPlainText(out['text'])
+
+    def hien_thi_trang(self, records):
+        # Mỗi thẻ trên trang được ghi thành một bản ghi; văn bản OCR hiển thị theo từng thẻ
+        self.last_text, self.last_lines = "", []
+        van_ban, thong_tin = [], []
+        for r in records:
+            tieu_de = f"— Trang {r['page']}, thẻ {r['card']} (hàng {r['row']}, cột {r['col']}) —"
+            van_ban.append(f"{tieu_de}\n{r['text']}")
+            canh_bao = self.luu_ho_so(r['info']) if r['info'] else ""
+            thong_tin.append(tieu_de + "\n" + "".join(f"{k}: {v}\n" for k, v in r['info'].items()) + canh_bao)
+        self.ui.txtChu.setPlainText("\n\n".join(van_ban))
+        self.ui.txtChu_2.setPlainText("\n".join(thong_tin))
+
+    def hien_thi_anh(self, overlay):
+        # overlay đã đúng cỡ khung, không scale lại trên luồng giao diện
+        if overlay is not None:
+            self.ui.lbAnh.setPixmap(QPixmap.fromImage(overlay))
+
+    def cap_nhat_hang_doi(self, pending):
+        if pending:
+            self.ui.statusbar.showMessage(f"⏳ Còn {pending} ảnh đang chờ nhận diện.")
 
     def trich_xuat_thong_tin(self):
         text = self.ui.txtChu.toPlainText()
-        info = extract_info(text)
+        with metrics.timer('parse'):
+            # Số CCCD trong văn bản đã có trong kho thì dùng luôn hồ sơ đã lưu, không trích xuất lại
+            da_luu = self.store.find_in_text(text)
+            if da_luu is not None:
+                info, confidence = da_luu['info'], {}
+            # Văn bản chưa bị sửa tay thì dùng các dòng có tọa độ để ghép nhãn-giá trị theo bố cục
+            elif self.last_lines and text == self.last_text:
+                info, confidence, _ = extract_scored(self.last_lines)
+            else:
+                info, confidence = extract_info(text), {}
 
         self.ui.txtChu_2.clear()
         if not info:
@@ -207,41 +191,93 @@ class MainWindow(QMainWindow, Ui_MainWindow):
         else:
             result_text = "Thông tin trích xuất:\n"
             for key, value in info.items():
-                result_text += f"{key}: {value}\n"
+                score = confidence.get(key)
+                canh_bao = f"  ⚠️ độ tin cậy {score:.2f}" if score is not None and score < REFINE_MIN_SCORE else ""
+                result_text += f"{key}: {value}{canh_bao}\n"
+            if info.get(TYPE_KEY) == 'cccd':
+                self.front_info = info
+            elif info.get('MRZ') and self.front_info:
+                doi_chieu = cross_check(info, self.front_info)
+                if doi_chieu:
+                    result_text += "Đối chiếu MRZ với mặt trước:\n"
+                    for key, khop in doi_chieu.items():
+                        result_text += f"  {'✅' if khop else '❌'} {key}\n"
+            result_text += self.luu_ho_so(info, da_luu)
             self.ui.txtChu_2.setPlainText(result_text)
 
-        self.extracted_data.append(info)
+    def luu_ho_so(self, info, da_luu=None) -> str:
+        # Lưu vào kho; chỉ hồ sơ mới mới được ghi thêm vào file xuất. Trả về dòng cảnh báo trùng (nếu có)
+        if da_luu is not None:
+            trung = 'cccd'
+        else:
+            # Số CCCD lệch một chữ số chỉ cảnh báo, không gộp vào hồ sơ của số khác
+            gan_trung, cach = self.store.find(info)
+            da_luu, trung = self.store.put(info)
+            if trung is None:
+                self.sink.write(info)
+                if cach == 'cccd~1':
+                    return (f"⚠️ Gần trùng hồ sơ #{gan_trung['id']} (CCCD {gan_trung['info'].get('CCCD')}), "
+                            f"kiểm tra lại số CCCD\n")
+                return ""
+        cach = {'cccd': "trùng số CCCD", 'person': "trùng họ tên + ngày sinh"}[trung]
+        ngay = time.strftime('%d/%m/%Y %H:%M', time.localtime(da_luu['created']))
+        return f"⚠️ Đã có trong kho: hồ sơ #{da_luu['id']} ({cach}, lưu lúc {ngay})\n"
 
 
     def quet_anh_camera(self):
+        if self.cap is not None:
+            return
         cap = cv2.VideoCapture(0)
         if not cap.isOpened():
             self.ui.txtChu.setPlainText("Không mở được camera.")
             return
 
-        self.ui.txtChu.setPlainText("Nhấn SPACE để chụp, ESC để thoát.")
+        self.ui.txtChu.setPlainText("Nhấn SPACE để chụp (chụp tiếp được khi đang nhận diện), "
+                                    "A để bật/tắt tự chụp khi thẻ nét và đứng yên, ESC để thoát.")
+        self.cap = cap
+        # Đọc khung hình bằng QTimer thay cho vòng lặp while để không chặn giao diện
+        self.camera_timer.start(30)
 
-        while True:
-            ret, frame = cap.read()
-            if not ret:
-                break
+    def doc_khung_hinh(self):
+        ret, frame = self.cap.read()
+        if not ret:
+            self.dong_camera()
+            return
 
+        if self.auto_capture is not None:
+            # Chế độ tự chụp: chỉ gửi OCR khung nét nhất khi thẻ đã đứng yên
+            best = self.auto_capture.feed(frame)
+            cv2.imshow("Camera - Space to take picture", draw_status(frame, self.auto_capture))
+            if best is not None:
+                save_debug_image("captured_image.jpg", best)
+                self.worker.submit(best)
+        else:
             cv2.imshow("Camera - Space to take picture", frame)
 
-            key = cv2.waitKey(1)
-            if key == 27:  # ESC
-                break
-            elif key == 32:  # SPACE
-                img_path = "captured_image.jpg"
-                cv2.imwrite(img_path, frame)
-                self.xu_ly_anh_ocr(img_path)
-                break
-
-        cap.release()
+        key = cv2.waitKey(1)
+        if key == 27:  # ESC
+            self.dong_camera()
+        elif key == 32:  # SPACE
+            save_debug_image("captured_image.jpg", frame)
+            self.worker.submit(frame.copy())
+        elif key in (ord('a'), ord('A')):  # Bật/tắt tự chụp
+            self.auto_capture = None if self.auto_capture is not None else AutoCapture()
+
+    def dong_camera(self):
+        self.camera_timer.stop()
+        if self.cap is not None:
+            self.cap.release()
+            self.cap = None
         cv2.destroyAllWindows()
 
-
-
+    def closeEvent(self, event):
+        self.dong_camera()
+        self.worker.stop()
+        self.flush_timer.stop()
+        self.sink.close()
+        self.store.close()
+        self.cache.close()
+        super().closeEvent(event)
 
 
 if __name__ == "__main__":
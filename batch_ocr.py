@@ -0,0 +1,237 @@
+import argparse
+import os
+import sys
+from multiprocessing import Pool
+
+import metrics
+from doc_types import all_fields
+from export_sink import ExportSink
+from ocr_cache import DEFAULT_CACHE_PATH
+
+IMAGE_EXTS = ('.jpg', '.jpeg', '.png', '.bmp')
+# Cột vị trí thẻ trên trang khi quét trang nhiều thẻ (--sheet)
+SHEET_COLUMNS = ['page', 'card', 'row', 'col']
+
+# Mỗi tiến trình con giữ một bản mô hình riêng, nạp một lần duy nhất
+_worker = {}
+
+
+def _init_worker(rec_batch, cache_path, zones, with_metrics, refine=False, mrz=False, sheet=False):
+    # Nạp SAST + SRN một lần cho mỗi tiến trình con
+    if with_metrics:
+        metrics.enable()
+        metrics.metrics.forward = True
+    from ocr_engine import warm_up
+    from ocr_pipeline import ocr_and_extract
+    from zone_ocr import extract_with_zones
+    from mrz_ocr import extract_with_mrz
+    from ocr_cache import OcrCache
+    from sheet_scan import scan_pages
+    from doc_types import extract
+    _worker['ocr'] = warm_up()
+    _worker['ocr_and_extract'] = ocr_and_extract
+    _worker['extract_with_zones'] = extract_with_zones if zones else None
+    _worker['extract_with_mrz'] = extract_with_mrz if mrz else None
+    _worker['extract_info'] = extract
+    _worker['rec_batch'] = rec_batch
+    _worker['cache'] = OcrCache(cache_path) if cache_path else None
+    _worker['refine'] = refine
+    _worker['scan_pages'] = scan_pages if sheet else None
+
+
+def _make_record(file_path: str, full_text: str, info, mode: str = 'full') -> dict:
+    record = {'file': file_path, 'text': full_text, 'mode': mode}
+    record.update(info or {})
+    record['error'] = None if full_text or info else 'Không phát hiện ra chữ'
+    return record
+
+
+def _run_full(file_paths: list) -> list:
+    # [(văn bản, thông tin, chế độ)]
+    if _worker['extract_with_zones']:
+        # Đọc theo vùng trên thẻ đã nắn, chỉ thẻ kém tin cậy mới chạy SAST đầy đủ
+        return _worker['extract_with_zones'](file_paths, _worker['extract_info'], _worker['ocr'],
+                                             batch_size=_worker['rec_batch'], cache=_worker['cache'])
+    out = _worker['ocr_and_extract'](file_paths, _worker['extract_info'], _worker['ocr'],
+                                     batch_size=_worker['rec_batch'], cache=_worker['cache'],
+                                     refine=_worker['refine'])
+    return [(text, info, 'full') for _, text, info in out]
+
+
+def _run(file_paths: list) -> list:
+    if _worker['extract_with_mrz']:
+        # Mặt sau có MRZ đúng số kiểm tra thì dùng luôn, các ảnh còn lại đi đường thường
+        out = _worker['extract_with_mrz'](file_paths, _worker['extract_info'], _worker['ocr'],
+                                          batch_size=_worker['rec_batch'], fallback=_run_full)
+    else:
+        out = _run_full(file_paths)
+    return [_make_record(path, text or '', info, mode) for path, (text, info, mode) in zip(file_paths, out)]
+
+
+def _process_chunk(items: list):
+    # Cả nhóm ảnh (hoặc trang) đi chung các lô nhận diện; lỗi thì xử lý lại từng ảnh
+    cache = _worker['cache']
+    before = (cache.hits, cache.misses) if cache else (0, 0)
+    if _worker['scan_pages']:
+        records = _process_pages(items)
+    else:
+        try:
+            records = _run(items)
+        except Exception:
+            records = [_process_image(path) for path in items]
+    after = (cache.hits, cache.misses) if cache else (0, 0)
+    return records, after[0] - before[0], after[1] - before[1], metrics.metrics.drain()
+
+
+def _process_image(file_path: str) -> dict:
+    try:
+        return _run([file_path])[0]
+    except Exception as e:
+        return {'file': file_path, 'error': f'{type(e).__name__}: {e}'}
+
+
+def _process_pages(refs: list) -> list:
+    # Mọi thẻ trên các trang của nhóm nhận diện chung; lỗi thì xử lý lại từng trang
+    scan = _worker['scan_pages']
+    try:
+        return scan(refs, _worker['extract_info'], _worker['ocr'], batch_size=_worker['rec_batch'])
+    except Exception:
+        records = []
+        for path, index in refs:
+            try:
+                records.extend(scan([(path, index)], _worker['extract_info'], _worker['ocr'],
+                                    batch_size=_worker['rec_batch']))
+            except Exception as e:
+                records.append({'file': path, 'page': index + 1, 'error': f'{type(e).__name__}: {e}'})
+        return records
+
+
+def _chunks(items, size: int):
+    chunk = []
+    for item in items:
+        chunk.append(item)
+        if len(chunk) == size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+def iter_images(inputs, exts=IMAGE_EXTS):
+    # Nhận thư mục, file ảnh hoặc file .txt chứa danh sách đường dẫn
+    for item in inputs:
+        if os.path.isdir(item):
+            for root, _, files in os.walk(item):
+                for name in sorted(files):
+                    if name.lower().endswith(exts):
+                        yield os.path.join(root, name)
+        elif item.lower().endswith('.txt'):
+            with open(item, encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line:
+                        yield line
+        else:
+            yield item
+
+
+def run_batch(inputs, output: str, fmt: str = None, workers: int = None, chunksize: int = 8,
+              rec_batch: int = 32, cache_path: str = None, zones: bool = False,
+              metrics_path: str = None, refine: bool = False, mrz: bool = False, sheet: bool = False,
+              stage_workers: dict = None) -> int:
+    count = hits = misses = 0
+    if metrics_path:
+        metrics.enable()
+    if stage_workers:
+        return _run_staged(inputs, output, fmt, rec_batch, metrics_path, stage_workers)
+    if sheet:
+        # Trang scan nhiều thẻ (ảnh, TIFF/PDF nhiều trang): mỗi việc là một trang, tiến trình con tự đọc trang
+        from sheet_scan import PAGE_EXTS, iter_page_refs
+        jobs = iter_page_refs(iter_images(inputs, IMAGE_EXTS + PAGE_EXTS))
+        columns = ['file'] + SHEET_COLUMNS + all_fields() + ['text', 'error']
+    else:
+        jobs = iter_images(inputs)
+        columns = ['file'] + all_fields() + ['text', 'error']
+    with ExportSink(output, fmt, columns, append=False) as writer:
+        with Pool(processes=workers, initializer=_init_worker,
+                  initargs=(rec_batch, cache_path, zones, bool(metrics_path), refine, mrz, sheet)) as pool:
+            # Ghi kết quả ngay khi từng nhóm ảnh xong, không gom vào bộ nhớ
+            for records, h, m, stage_metrics in pool.imap_unordered(_process_chunk, _chunks(jobs, chunksize)):
+                hits += h
+                misses += m
+                metrics.metrics.merge(stage_metrics)
+                for record in records:
+                    with metrics.timer('export'):
+                        writer.write(record)
+                    count += 1
+                    if record.get('error'):
+                        print(f"⚠️ {record['file']}: {record['error']}", file=sys.stderr)
+    if cache_path:
+        print(f"Cache: {hits} hit / {misses} miss", file=sys.stderr)
+    if metrics_path:
+        metrics.write(metrics_path)
+    return count
+
+
+def _run_staged(inputs, output: str, fmt: str, rec_batch: int, metrics_path: str, stage_workers: dict) -> int:
+    # Dây chuyền nhiều tiến trình (staged_pipeline.py): mỗi công đoạn một nhóm tiến trình riêng
+    from staged_pipeline import iter_staged
+    count = 0
+    with ExportSink(output, fmt, ['file'] + all_fields() + ['text', 'error'], append=False) as writer:
+        for record in iter_staged(iter_images(inputs), stage_workers, rec_batch, with_metrics=bool(metrics_path)):
+            with metrics.timer('export'):
+                writer.write(record)
+            count += 1
+            if record.get('error'):
+                print(f"⚠️ {record['file']}: {record['error']}", file=sys.stderr)
+    if metrics_path:
+        metrics.write(metrics_path)
+    return count
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Trích xuất thông tin CCCD hàng loạt (không cần giao diện)")
+    parser.add_argument('inputs', nargs='+', help="Thư mục ảnh, file ảnh hoặc file .txt liệt kê đường dẫn")
+    parser.add_argument('-o', '--output', required=True, help="File kết quả .csv hoặc .jsonl")
+    parser.add_argument('--format', choices=['csv', 'jsonl'], help="Mặc định đoán theo đuôi file")
+    parser.add_argument('-j', '--workers', type=int, default=None, help="Số tiến trình (mặc định = số CPU)")
+    parser.add_argument('--chunksize', type=int, default=8, help="Số ảnh mỗi tiến trình nhận diện chung một lượt")
+    parser.add_argument('--rec-batch', type=int, default=32, help="Số hộp chữ mỗi lô nhận diện SRN")
+    parser.add_argument('--cache', default=DEFAULT_CACHE_PATH, help="File SQLite lưu đệm kết quả OCR")
+    parser.add_argument('--no-cache', action='store_true', help="Không dùng bộ nhớ đệm")
+    parser.add_argument('--metrics', help="Ghi thời gian từng công đoạn ra file (.json, hoặc .prom cho Prometheus)")
+    parser.add_argument('--zones', action='store_true',
+                        help="Đọc trực tiếp theo vùng trường trên thẻ đã nắn, bỏ qua SAST khi đủ tin cậy")
+    parser.add_argument('--refine', action='store_true',
+                        help="Nhận diện lại (TTA + phân loại góc) các hộp của trường thiếu, sai hoặc kém tin cậy")
+    parser.add_argument('--mrz', action='store_true',
+                        help="Mặt sau CCCD gắn chip: chỉ đọc 3 dòng MRZ, đúng số kiểm tra thì bỏ qua SAST")
+    parser.add_argument('--sheet', action='store_true',
+                        help="Mỗi trang (ảnh, TIFF/PDF nhiều trang) chứa nhiều thẻ: tách từng thẻ rồi trích xuất")
+    parser.add_argument('--staged', nargs='?', const='', metavar='decode=1,detect=2,rec=1,parse=1',
+                        help="Chạy dây chuyền nhiều tiến trình: giải mã/nắn, SAST, SRN, trích xuất song song, "
+                             "ảnh chuyển qua shared memory; có thể đặt số tiến trình từng công đoạn "
+                             "(không dùng cache/--zones/--mrz/--refine/--sheet)")
+    parser.add_argument('--adaptive-det', action='store_true',
+                        help="Chọn kích thước đầu vào SAST theo chiều cao chữ của từng ảnh (như OCR_ADAPTIVE_DET=1)")
+    args = parser.parse_args(argv)
+    if args.adaptive_det:
+        # Tiến trình con đọc cấu hình từ biến môi trường khi nạp det_resize
+        os.environ['OCR_ADAPTIVE_DET'] = '1'
+    if args.staged is not None:
+        from staged_pipeline import parse_stage_workers
+        try:
+            stage_workers = parse_stage_workers(args.staged)
+        except ValueError as e:
+            parser.error(str(e))
+    else:
+        stage_workers = None
+
+    count = run_batch(args.inputs, args.output, args.format, args.workers, args.chunksize, args.rec_batch,
+                      None if args.no_cache else args.cache, args.zones, args.metrics, args.refine, args.mrz,
+                      args.sheet, stage_workers)
+    print(f"✅ Đã xử lý {count} ảnh -> {args.output}")
+
+
+if __name__ == "__main__":
+    main()
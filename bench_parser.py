@@ -0,0 +1,88 @@
+import argparse
+import json
+import os
+import random
+import time
+
+from cccd_parser import CccdExtractor, parse_cccd_text
+
+# Mẫu văn bản OCR điển hình (có lỗi OCR) dùng khi không truyền corpus
+SAMPLES = [
+    "CỘNG HÒA XÃ HỘI CHỦ NGHĨA VIỆT NAM Độc lập - Tự do - Hạnh phúc SOCIALIST REPUBLIC OF VIET NAM "
+    "Independence - Freadom - Happiness CĂN CƯỚC CÔNG DÂN Citizen Identity Card Số / No: 001203012345 "
+    "Họ và tên Full name: NGUYỄN VĂN AN Ngày sinh Date of birth: 12/05/2003 Giới tính / Sex: Nam "
+    "Quốc tịch Natiohality: Việt Nam Quê quán Place of orign: Đông Anh, Hà Nội "
+    "Nơi thường trú Place of residence: Thôn Đông, Xã Uy Nỗ, Đông Anh, Hà Nội "
+    "Có giá trị đến: 12/05/2028 Date of expiry",
+    "CĂN CƯỚC CÔNG DÂN Số/No: 079199004567 Ho va ten Full name TRẦN THỊ BÌNH "
+    "Date of binth 01/01/1999 Sex.Nu Quốc tịch Nationality Việt Nam Place of ferginn Quận 1, TP Hồ Chí Minh "
+    "Noi thuong tru Place of residence 12 Lê Lợi, Bến Nghé, Quận 1, TP Hồ Chí Minh Date afexpiry 01/01/2039",
+    "Số 036095001122 Họ và tên Fullname LÊ HOÀNG Ngày sinh 3-7-1995 Giới tính Nam Quốc tịch: Việt Nam "
+    "Quê quán Place of origin: Nam Định Nơi thường trú: Ý Yên, Nam Định Có giá trị đến 03/07/2035",
+    "No 00120301 Full name PHẠM MINH ĐỨC Date of birth! 30/12/1988 Sex Nam Nationality Việt Nam "
+    "Place of forgins: Hải Phòng Place of tri residence Lê Chân, Hải Phòng",
+    "Họ và tên HOÀNG 123 LAN Date of birth 2/2/2000 Quê quán Place of origin Nơi thường trú Huế Date",
+]
+
+
+def load_corpus(paths):
+    # Mỗi file .txt là một chuỗi OCR (như test.txt), file .jsonl lấy trường 'text'
+    corpus = []
+    for path in paths:
+        files = [os.path.join(path, n) for n in sorted(os.listdir(path))] if os.path.isdir(path) else [path]
+        for file in files:
+            with open(file, encoding='utf-8') as f:
+                if file.endswith('.jsonl'):
+                    corpus.extend(json.loads(line)['text'] for line in f if line.strip())
+                elif file.endswith('.txt'):
+                    corpus.append(f.read())
+    return corpus
+
+
+def mutate(text: str, rng: random.Random) -> str:
+    # Cắt ghép ngẫu nhiên theo từ để tạo thêm biến thể thứ tự nhãn
+    words = text.split(' ')
+    i, j = sorted(rng.sample(range(len(words) + 1), 2))
+    return ' '.join(words[:i] + words[j:] + words[i:j])
+
+
+def check_parity(extractor, corpus) -> list:
+    return [text for text in corpus if extractor.extract(text) != parse_cccd_text(text)]
+
+
+def throughput(func, corpus, repeat: int) -> float:
+    start = time.perf_counter()
+    for _ in range(repeat):
+        for text in corpus:
+            func(text)
+    return repeat * len(corpus) / (time.perf_counter() - start)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Đo tốc độ bộ trích xuất CCCD trên corpus văn bản OCR")
+    parser.add_argument('corpus', nargs='*', help="File/thư mục .txt hoặc .jsonl (mặc định: mẫu dựng sẵn)")
+    parser.add_argument('--variants', type=int, default=200, help="Số biến thể sinh thêm từ mẫu dựng sẵn")
+    parser.add_argument('--repeat', type=int, default=20)
+    parser.add_argument('--seed', type=int, default=0)
+    args = parser.parse_args(argv)
+
+    corpus = load_corpus(args.corpus)
+    if not corpus:
+        rng = random.Random(args.seed)
+        corpus = SAMPLES + [mutate(rng.choice(SAMPLES), rng) for _ in range(args.variants)]
+
+    extractor = CccdExtractor()
+    mismatches = check_parity(extractor, corpus)
+    print(f"Corpus: {len(corpus)} chuỗi, khác biệt so với parse_cccd_text: {len(mismatches)}")
+    for text in mismatches[:5]:
+        print(f"  ❌ {text[:120]}")
+
+    old = throughput(parse_cccd_text, corpus, args.repeat)
+    new = throughput(extractor.extract, corpus, args.repeat)
+    print(f"parse_cccd_text : {old:10.0f} văn bản/s")
+    print(f"CccdExtractor   : {new:10.0f} văn bản/s  (x{new / old:.2f})")
+    return 1 if mismatches else 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
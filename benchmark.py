@@ -0,0 +1,259 @@
+import argparse
+import json
+import os
+import random
+import statistics
+import sys
+import time
+
+import metrics
+from metrics import percentiles
+from cccd_parser import extract
+
+# Bộ ký tự của mô hình nhận diện; chữ ngoài bộ này bị bỏ khi vẽ thẻ tổng hợp
+CHARSET_PATH = "vi_vietnam.txt"
+FONT_PATH = 'PaddleOCR/doc/fonts/latin.ttf'
+FIELDS = ['CCCD', 'Họ và tên', 'Ngày sinh', 'Giới tính', 'Quốc tịch', 'Quê quán', 'Nơi thường trú', 'Ngày hết hạn']
+
+# Sai lệch cho phép so với baseline trước khi báo chậm/kém đi
+SPEED_TOLERANCE = 0.10
+ACCURACY_TOLERANCE = 0.01
+# Số lần chạy mỗi kịch bản; thông lượng lấy theo lần chạy trung vị để một lần máy bận không bị báo chậm
+DEFAULT_REPEAT = 3
+
+_HO = ['NGUYỄN', 'TRẦN', 'LÊ', 'PHẠM', 'HOÀNG', 'PHAN', 'VŨ', 'ĐẶNG', 'BÙI', 'ĐỖ', 'HỒ', 'NGÔ', 'DƯƠNG', 'LÝ']
+_DEM = ['VĂN', 'THỊ', 'HỮU', 'ĐỨC', 'MINH', 'NGỌC', 'THANH', 'QUỐC', 'XUÂN', 'THU']
+_TEN = ['AN', 'BÌNH', 'CƯỜNG', 'DŨNG', 'GIANG', 'HÀ', 'HẢI', 'HÙNG', 'LAN', 'LINH', 'MAI', 'NAM', 'PHƯƠNG', 'QUÂN',
+        'SƠN', 'THẢO', 'TRANG', 'TUẤN', 'VY', 'YẾN']
+_NOI = ['Đông Anh, Hà Nội', 'Ý Yên, Nam Định', 'Lê Chân, Hải Phòng', 'Quận 1, TP Hồ Chí Minh', 'Hương Thủy, Huế',
+        'Thanh Khê, Đà Nẵng', 'Ninh Kiều, Cần Thơ', 'Thái Thụy, Thái Bình', 'Nghi Lộc, Nghệ An']
+_XA = ['Thôn Đông, Xã Uy Nỗ', 'Số 12 Lê Lợi, Phường Bến Nghé', 'Xóm 3, Xã Nghi Phong', 'Tổ 5, Phường Hòa Khê']
+# Lỗi OCR thường gặp trên nhãn, để corpus văn bản giống thực tế
+_LABEL_NOISE = {
+    'Place of origin': ['Place of orign', 'Place of ferginn', 'Place of origin:'],
+    'Date of birth': ['Date of binth', 'Date of birth!', 'Date of bint'],
+    'Nationality': ['Natiohality'],
+    'Sex': ['Sex.'],
+}
+
+
+def load_charset(path: str = CHARSET_PATH) -> set:
+    with open(path, encoding='utf-8') as f:
+        return {line.rstrip('\n') for line in f if line.rstrip('\n')} | {' '}
+
+
+def synth_fields(rng: random.Random) -> dict:
+    dob = f"{rng.randint(1, 28):02d}/{rng.randint(1, 12):02d}/{rng.randint(1950, 2005)}"
+    return {
+        'CCCD': ''.join(str(rng.randint(0, 9)) for _ in range(12)),
+        'Họ và tên': f"{rng.choice(_HO)} {rng.choice(_DEM)} {rng.choice(_TEN)}",
+        'Ngày sinh': dob,
+        'Giới tính': rng.choice(['Nam', 'Nữ']),
+        'Quốc tịch': 'Việt Nam',
+        'Quê quán': rng.choice(_NOI),
+        'Nơi thường trú': f"{rng.choice(_XA)}, {rng.choice(_NOI)}",
+        'Ngày hết hạn': dob[:6] + str(int(dob[6:]) + rng.choice([25, 40, 60])),
+    }
+
+
+def synth_lines(fields: dict, rng: random.Random = None) -> list:
+    # Các dòng chữ theo bố cục mặt trước thẻ; rng != None thì chèn lỗi nhãn
+    def label(text):
+        return rng.choice(_LABEL_NOISE[text]) if rng and text in _LABEL_NOISE and rng.random() < 0.3 else text
+    return [
+        "CỘNG HÒA XÃ HỘI CHỦ NGHĨA VIỆT NAM",
+        "CĂN CƯỚC CÔNG DÂN",
+        f"Số / No: {fields['CCCD']}",
+        f"Họ và tên / Full name: {fields['Họ và tên']}",
+        f"Ngày sinh / {label('Date of birth')}: {fields['Ngày sinh']}",
+        f"Giới tính / {label('Sex')} {fields['Giới tính']} Quốc tịch / {label('Nationality')}: {fields['Quốc tịch']}",
+        f"Quê quán / {label('Place of origin')} {fields['Quê quán']}",
+        f"Nơi thường trú / Place of residence: {fields['Nơi thường trú']}",
+        f"Có giá trị đến: {fields['Ngày hết hạn']}",
+    ]
+
+
+def render_card(lines: list, font_path: str = FONT_PATH, charset: set = None):
+    # Vẽ thẻ tổng hợp (BGR) trên nền tối để bước tìm thẻ hoạt động như ảnh chụp thật
+    import numpy as np
+    from PIL import Image, ImageDraw, ImageFont
+
+    if charset:
+        lines = [''.join(c for c in line if c in charset) for line in lines]
+    font = ImageFont.truetype(font_path, 26)
+    card = Image.new('RGB', (1000, 630), (236, 240, 232))
+    draw = ImageDraw.Draw(card)
+    for i, line in enumerate(lines):
+        draw.text((40 if i < 2 else 290, 30 + i * 64), line, fill=(20, 20, 20), font=font)
+    page = Image.new('RGB', (1200, 830), (45, 45, 50))
+    page.paste(card, (100, 100))
+    return np.array(page)[:, :, ::-1].copy()
+
+
+def latency_ms(values: list) -> dict:
+    # Độ trễ (giây) -> p50_ms/p95_ms/p99_ms của báo cáo
+    return {f'{k}_ms': v * 1000 for k, v in percentiles(values).items()}
+
+
+def peak_rss_mb():
+    try:
+        import resource
+    except ImportError:
+        return None
+    rss = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return rss / (1024 * 1024) if sys.platform == 'darwin' else rss / 1024
+
+
+def field_accuracy(pairs: list) -> dict:
+    # pairs: [(thông tin trích xuất, đáp án)] -> tỉ lệ đúng từng trường
+    acc = {}
+    for field in FIELDS:
+        ok = sum(1 for got, truth in pairs if (got or {}).get(field) == truth[field])
+        acc[field] = ok / len(pairs) if pairs else 0.0
+    acc['all'] = sum(acc[f] for f in FIELDS) / len(FIELDS)
+    return acc
+
+
+def _timed(func, items, repeat: int = 1):
+    # Chạy repeat lần: trả về kết quả lần cuối, độ trễ của mọi lần và thời gian trung vị của một lần chạy
+    latencies, runs = [], []
+    for _ in range(max(1, repeat)):
+        outputs = []
+        start = time.perf_counter()
+        for item in items:
+            t = time.perf_counter()
+            outputs.append(func(item))
+            latencies.append(time.perf_counter() - t)
+        runs.append(time.perf_counter() - start)
+    return outputs, latencies, statistics.median(runs)
+
+
+def bench_parser(n: int, seed: int, repeat: int = DEFAULT_REPEAT) -> dict:
+    rng = random.Random(seed)
+    truths = [synth_fields(rng) for _ in range(n)]
+    texts = [" ".join(synth_lines(t, rng)) for t in truths]
+    outputs, latencies, total = _timed(extract, texts, repeat)
+    return {'config': {'n': n, 'seed': seed}, 'items': n, 'throughput': n / total, **latency_ms(latencies),
+            'accuracy': field_accuracy(list(zip(outputs, truths)))}
+
+
+def bench_recognition(crops_dir: str, engine_kwargs: dict, batch_size: int, repeat: int = DEFAULT_REPEAT) -> dict:
+    # Thư mục gồm các ảnh crop và labels.txt dạng "tên_file<TAB>nội dung"
+    from ocr_engine import warm_up
+    from ocr_pipeline import recognize
+    from image_io import read_image
+
+    with open(os.path.join(crops_dir, 'labels.txt'), encoding='utf-8') as f:
+        items = [line.rstrip('\n').split('\t', 1) for line in f if '\t' in line]
+    crops = [read_image(os.path.join(crops_dir, name)) for name, _ in items]
+    engine = warm_up(**engine_kwargs)
+    batches = [crops[i:i + batch_size] for i in range(0, len(crops), batch_size)]
+    outputs, latencies, total = _timed(lambda batch: recognize(engine, batch, batch_size), batches, repeat)
+    # Độ trễ tính trên mỗi crop của lô
+    latencies = [t / len(batch) for t, batch in zip(latencies, batches * max(1, repeat))]
+    outputs = [res for batch_res in outputs for res in batch_res]
+    correct = sum(1 for (_, label), (txt, _) in zip(items, outputs) if txt == label)
+    return {'config': {'crops': crops_dir, 'engine': engine_kwargs, 'batch_size': batch_size},
+            'items': len(crops), 'throughput': len(crops) / total if total else 0.0, **latency_ms(latencies),
+            'accuracy': {'exact': correct / len(crops) if crops else 0.0}}
+
+
+def bench_end_to_end(n: int, seed: int, engine_kwargs: dict, font_path: str, batch_size: int,
+                     adaptive: bool = False, repeat: int = DEFAULT_REPEAT) -> dict:
+    from ocr_engine import DEFAULT_CONFIG, warm_up
+    from ocr_pipeline import ocr_and_extract
+
+    rng = random.Random(seed)
+    dict_path = {**DEFAULT_CONFIG, **engine_kwargs}['rec_char_dict_path']
+    charset = load_charset(dict_path if os.path.exists(dict_path) else CHARSET_PATH)
+    truths = [synth_fields(rng) for _ in range(n)]
+    images = [render_card(synth_lines(t), font_path, charset) for t in truths]
+    engine = warm_up(**engine_kwargs)
+    metrics.enable()
+    metrics.metrics.reset()
+    outputs, latencies, total = _timed(
+        lambda img: ocr_and_extract([img], extract, engine, batch_size=batch_size, adaptive=adaptive)[0][2], images,
+        repeat)
+    snapshot = metrics.metrics.snapshot()
+    config = {'cards': n, 'seed': seed, 'engine': engine_kwargs, 'font': font_path, 'batch_size': batch_size,
+              'adaptive': adaptive}
+    return {'config': config, 'items': n, 'throughput': n / total, **latency_ms(latencies),
+            'accuracy': field_accuracy(list(zip(outputs, truths))),
+            'stages': snapshot['stages'], 'counters': snapshot['counters']}
+
+
+def compare(report: dict, baseline: dict) -> list:
+    # Trả về danh sách cảnh báo khi chậm hơn hoặc kém chính xác hơn baseline.
+    # Kịch bản chạy với cấu hình khác baseline (số mẫu, seed, mô hình...) thì không so sánh mà báo lỗi.
+    problems = []
+    for name, cur in report['scenarios'].items():
+        base = baseline.get('scenarios', {}).get(name)
+        if not base:
+            continue
+        if cur.get('config') != base.get('config'):
+            problems.append(f"{name}: cấu hình {cur.get('config')} khác baseline {base.get('config')}, "
+                            "không so sánh được")
+            continue
+        if cur['throughput'] < base['throughput'] * (1 - SPEED_TOLERANCE):
+            problems.append(f"{name}: throughput {cur['throughput']:.1f} < baseline {base['throughput']:.1f}")
+        for key, value in cur.get('accuracy', {}).items():
+            if value < base.get('accuracy', {}).get(key, 0.0) - ACCURACY_TOLERANCE:
+                problems.append(f"{name}: accuracy[{key}] {value:.3f} < baseline {base['accuracy'][key]:.3f}")
+    return problems
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Bộ đo hiệu năng: phân tích văn bản, nhận diện, toàn trình")
+    parser.add_argument('--scenario', action='append', choices=['parser', 'rec', 'e2e'],
+                        help="Có thể lặp lại; mặc định chỉ chạy parser")
+    parser.add_argument('-n', type=int, default=2000, help="Số mẫu văn bản cho parser")
+    parser.add_argument('--cards', type=int, default=50, help="Số thẻ tổng hợp cho e2e")
+    parser.add_argument('--crops', help="Thư mục crop + labels.txt cho kịch bản rec")
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--repeat', type=int, default=DEFAULT_REPEAT,
+                        help="Số lần chạy mỗi kịch bản, thông lượng lấy trung vị")
+    parser.add_argument('--font', default=FONT_PATH)
+    parser.add_argument('--rec-batch', type=int, default=32)
+    parser.add_argument('--rec-model-dir', help="So sánh mô hình khác, ví dụ inference/SRN_Lastest")
+    parser.add_argument('--rec-image-shape')
+    parser.add_argument('--adaptive-det', action='store_true',
+                        help="e2e: chọn kích thước SAST theo từng ảnh (det_resize) để so với kích thước cố định")
+    parser.add_argument('-o', '--output', help="Ghi báo cáo JSON")
+    parser.add_argument('--baseline', help="So sánh với báo cáo JSON đã lưu, trả mã lỗi 1 nếu kém đi")
+    args = parser.parse_args(argv)
+
+    engine_kwargs = {k: v for k, v in (('rec_model_dir', args.rec_model_dir),
+                                       ('rec_image_shape', args.rec_image_shape)) if v}
+    scenarios = args.scenario or ['parser']
+    report = {'seed': args.seed, 'engine': engine_kwargs, 'scenarios': {}}
+    if 'parser' in scenarios:
+        report['scenarios']['parser'] = bench_parser(args.n, args.seed, args.repeat)
+    if 'rec' in scenarios:
+        if not args.crops:
+            parser.error("--scenario rec cần --crops")
+        report['scenarios']['rec'] = bench_recognition(args.crops, engine_kwargs, args.rec_batch, args.repeat)
+    if 'e2e' in scenarios:
+        report['scenarios']['e2e'] = bench_end_to_end(args.cards, args.seed, engine_kwargs, args.font,
+                                                      args.rec_batch, args.adaptive_det, args.repeat)
+    report['peak_rss_mb'] = peak_rss_mb()
+
+    for name, r in report['scenarios'].items():
+        acc = r['accuracy'].get('all', r['accuracy'].get('exact'))
+        print(f"{name:7s} {r['items']:6d} mẫu  {r['throughput']:9.1f}/s  p50 {r['p50_ms']:.2f}ms  "
+              f"p95 {r['p95_ms']:.2f}ms  p99 {r['p99_ms']:.2f}ms  đúng {acc:.1%}")
+    print(f"Peak RSS: {report['peak_rss_mb']:.0f} MB" if report['peak_rss_mb'] else "Peak RSS: n/a")
+
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+    if args.baseline:
+        with open(args.baseline, encoding='utf-8') as f:
+            problems = compare(report, json.load(f))
+        for p in problems:
+            print(f"❌ {p}")
+        return 1 if problems else 0
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
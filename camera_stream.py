@@ -0,0 +1,79 @@
+import cv2
+import numpy as np
+
+from card_detect import find_card_quad
+
+# Chiều rộng ảnh thu nhỏ dùng để chấm điểm khung hình (rẻ hơn nhiều so với SAST)
+SCORE_WIDTH = 320
+
+
+def frame_features(frame: np.ndarray):
+    # Trả về (ảnh xám thu nhỏ, độ nét = phương sai Laplacian, tứ giác thẻ hoặc None)
+    scale = SCORE_WIDTH / frame.shape[1]
+    small = cv2.resize(frame, (SCORE_WIDTH, max(1, int(frame.shape[0] * scale))), interpolation=cv2.INTER_AREA)
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    sharpness = cv2.Laplacian(gray, cv2.CV_64F).var()
+    quad = find_card_quad(gray)
+    if quad is not None:
+        quad = quad / scale
+    return gray, sharpness, quad
+
+
+class AutoCapture:
+    # Chế độ quét liên tục: chỉ trả về khung hình nét nhất trong một chuỗi khung ổn định
+    # có thẻ, các khung còn lại bị bỏ mà không chạy phát hiện chữ.
+    def __init__(self, min_sharpness: float = 120.0, max_motion: float = 6.0, window: int = 8):
+        self.min_sharpness = min_sharpness
+        self.max_motion = max_motion
+        self.window = window
+        self.last = None  # (sharpness, motion, quad) của khung gần nhất, để vẽ lên màn hình
+        self._prev_gray = None
+        self._stable = 0
+        self._best = None
+        self._best_score = -1.0
+        self._fired = False
+
+    def reset(self):
+        self._stable = 0
+        self._best = None
+        self._best_score = -1.0
+
+    def feed(self, frame: np.ndarray):
+        gray, sharpness, quad = frame_features(frame)
+        motion = float(np.mean(cv2.absdiff(gray, self._prev_gray))) if self._prev_gray is not None \
+            and self._prev_gray.shape == gray.shape else float('inf')
+        self._prev_gray = gray
+        self.last = (sharpness, motion, quad)
+
+        if quad is None or motion > self.max_motion:
+            # Thẻ rời khung hoặc đang di chuyển: cho phép chụp thẻ tiếp theo
+            if quad is None:
+                self._fired = False
+            self.reset()
+            return None
+        if self._fired:
+            return None
+
+        self._stable += 1
+        if sharpness >= self.min_sharpness and sharpness > self._best_score:
+            self._best = frame.copy()
+            self._best_score = sharpness
+        if self._stable >= self.window and self._best is not None:
+            best = self._best
+            self._fired = True
+            self.reset()
+            return best
+        return None
+
+
+def draw_status(frame: np.ndarray, capture: AutoCapture) -> np.ndarray:
+    # Vẽ khung thẻ và điểm số lên ảnh xem trước của camera
+    if capture.last is None:
+        return frame
+    sharpness, motion, quad = capture.last
+    view = frame.copy()
+    if quad is not None:
+        cv2.polylines(view, [quad.astype(np.int32)], True, (0, 255, 0), 2)
+    cv2.putText(view, f"AUTO net:{sharpness:.0f} dich:{motion:.1f}", (10, 25),
+                cv2.FONT_HERSHEY_SIMPLEX, 0.6, (0, 255, 255), 2)
+    return view
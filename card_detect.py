@@ -0,0 +1,85 @@
+import cv2
+import numpy as np
+
+# Tỉ lệ rộng/cao của thẻ CCCD (85.6mm x 53.98mm)
+CARD_ASPECT = 85.6 / 53.98
+# Kích thước chuẩn của thẻ sau khi nắn (rộng x cao), giữ đúng tỉ lệ thẻ
+CANONICAL_SIZE = (1000, 630)
+# Ảnh được thu nhỏ về chiều rộng này trước khi tìm thẻ
+DETECT_WIDTH = 480
+
+
+def order_quad(pts) -> np.ndarray:
+    # Sắp 4 đỉnh theo thứ tự: trên-trái, trên-phải, dưới-phải, dưới-trái
+    pts = np.asarray(pts, dtype=np.float32).reshape(4, 2)
+    s = pts.sum(axis=1)
+    d = np.diff(pts, axis=1).ravel()
+    return np.array([pts[np.argmin(s)], pts[np.argmin(d)], pts[np.argmax(s)], pts[np.argmax(d)]], dtype=np.float32)
+
+
+def find_card_quad(gray: np.ndarray, min_area_ratio: float = 0.15, aspect_tol: float = 0.35):
+    # Tìm tứ giác lớn nhất có tỉ lệ gần với thẻ CCCD; trả về 4 đỉnh (float32) hoặc None
+    blur = cv2.GaussianBlur(gray, (5, 5), 0)
+    edges = cv2.Canny(blur, 50, 150)
+    edges = cv2.dilate(edges, None, iterations=1)
+    contours, _ = cv2.findContours(edges, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    min_area = min_area_ratio * gray.shape[0] * gray.shape[1]
+
+    best, best_area = None, 0
+    for c in contours:
+        area = cv2.contourArea(c)
+        if area < min_area or area <= best_area:
+            continue
+        approx = cv2.approxPolyDP(c, 0.02 * cv2.arcLength(c, True), True)
+        if len(approx) != 4 or not cv2.isContourConvex(approx):
+            continue
+        quad = order_quad(approx)
+        w = (np.linalg.norm(quad[1] - quad[0]) + np.linalg.norm(quad[2] - quad[3])) / 2
+        h = (np.linalg.norm(quad[3] - quad[0]) + np.linalg.norm(quad[2] - quad[1])) / 2
+        if h == 0:
+            continue
+        aspect = max(w, h) / min(w, h)
+        if abs(aspect - CARD_ASPECT) / CARD_ASPECT > aspect_tol:
+            continue
+        best, best_area = quad, area
+    return best
+
+
+def locate_card(img: np.ndarray):
+    # Tìm tứ giác thẻ trên ảnh thu nhỏ, trả về tọa độ trên ảnh gốc hoặc None
+    scale = min(1.0, DETECT_WIDTH / img.shape[1])
+    small = cv2.resize(img, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else img
+    gray = cv2.cvtColor(small, cv2.COLOR_BGR2GRAY) if small.ndim == 3 else small
+    quad = find_card_quad(gray)
+    return None if quad is None else quad / scale
+
+
+def rectify_card(img: np.ndarray, size=CANONICAL_SIZE):
+    # Nắn thẻ về kích thước chuẩn và cắt bỏ nền.
+    # Trả về (ảnh thẻ, ma trận biến đổi gốc -> thẻ); không tìm thấy thẻ thì (ảnh gốc, None).
+    quad = locate_card(img)
+    if quad is None:
+        return img, None
+    return warp_quad(img, quad, size)
+
+
+def warp_quad(img: np.ndarray, quad, size=CANONICAL_SIZE):
+    # Nắn vùng tứ giác (4 đỉnh đã sắp theo order_quad, tọa độ trên img) về size; trả về (ảnh thẻ, ma trận)
+    quad = np.asarray(quad, dtype=np.float32)
+    w = np.linalg.norm(quad[1] - quad[0])
+    h = np.linalg.norm(quad[3] - quad[0])
+    if h > w:
+        # Thẻ nằm dọc: xoay thứ tự đỉnh để cạnh dài nằm ngang
+        quad = np.roll(quad, -1, axis=0)
+    dst = np.array([[0, 0], [size[0] - 1, 0], [size[0] - 1, size[1] - 1], [0, size[1] - 1]], dtype=np.float32)
+    M = cv2.getPerspectiveTransform(quad.astype(np.float32), dst)
+    return cv2.warpPerspective(img, M, size, flags=cv2.INTER_LINEAR), M
+
+
+def unwarp_boxes(boxes, M) -> list:
+    # Đưa tọa độ hộp chữ trên ảnh thẻ đã nắn về lại ảnh gốc
+    if not len(boxes):
+        return []
+    pts = np.asarray(boxes, dtype=np.float32).reshape(-1, 1, 2)
+    back = cv2.perspectiveTransform(pts, np.linalg.inv(M))
+    return list(back.reshape(len(boxes), -1, 2))
@@ -1,6 +1,11 @@
+import bisect
+import datetime
 import re
 import unicodedata
 
+from layout import compile_labels, label_values, lines_text
+from ocr_correct import correct_address, correct_labels
+
 STOP_KEYWORDS = [
     "Ngày sinh", "Date of birth", "Giới tính", "Sex",
     "Quốc tịch", "Nationality", "Quê quán", "Place of origin",
@@ -15,24 +20,8 @@ def normalize_text(text: str) -> str:
     return text.strip()
 
 def fix_common_ocr_errors(text: str) -> str:
-    corrections = [
-        (r'place of orign', 'Place of origin'),
-        (r'freadom', 'freedom'),
-        (r'ho\s*v[aà]\s*t[eê]n\s*full\s*name', 'Họ và tên Full name'),
-        (r'HO\s*v[AÀ]\s*t[eê]n\s*full\s*name', 'Họ và tên Full name'),
-        (r'no[ií]\s*thu[ơo]ng\s*tru\s*place\s*of\s*residence', 'Place of residence'),
-        (r'date of( binth| bint| expiry| birth[!,:]?)', 'Date of birth'),
-        (r'sex[.\s]?(nam|nu)', r'Sex: \1'),
-        (r'qu[ôo]c\s*t[ịi]ch\s*natiohality', 'Nationality'),
-        (r'place of ferginn', 'Place of origin'),
-        (r'place of origin:?', 'Place of origin'),
-        (r'place of forgins?', 'Place of origin'),
-        (r'place of tri residence', 'Place of residence'),
-        (r'date afexpiry', 'Date of expiry'),
-    ]
-    for pattern, repl in corrections:
-        text = re.sub(pattern, repl, text, flags=re.IGNORECASE)
-    return text
+    # Đưa các nhãn bị OCR sai/dính liền về dạng chuẩn (khớp mờ, xem ocr_correct)
+    return correct_labels(text)
 
 def postprocess_info(info: dict) -> dict:
     if 'Quốc tịch' in info and info['Quốc tịch']:
@@ -43,6 +32,7 @@ def postprocess_info(info: dict) -> dict:
             # Xóa nhãn tiếng Anh và cắt nếu dính nhãn sau
             info[key] = re.sub(r'\b(?:Place of origin|Place of residence)\b', '', info[key], flags=re.IGNORECASE)
             info[key] = re.split(r'\b(Có giá trị|Ngày hết hạn|Date|CỎ|GIÁ|DATE)\b', info[key])[0].strip()
+            info[key] = correct_address(info[key])
 
     if 'Họ và tên' in info and info['Họ và tên']:
         info['Họ và tên'] = re.sub(r'\b(Họ và tên|Full name)\b[\s:/.-]*', '', info['Họ và tên'], flags=re.IGNORECASE).strip()
@@ -93,3 +83,258 @@ def parse_cccd_text(text: str) -> dict:
         result['Ngày hết hạn'] = None
 
     return postprocess_info(result)
+
+
+# ---------------------------------------------------------------------------
+# Bộ trích xuất biên dịch sẵn: cho kết quả giống parse_cccd_text nhưng chỉ
+# sửa lỗi OCR trong một lượt và tìm tất cả nhãn trong một lần quét duy nhất.
+# ---------------------------------------------------------------------------
+
+_PREFIX = r'[\s:/.-]'
+
+# (tên trường, các nhãn, lớp ký tự đầu, lớp ký tự sau, độ dài tối thiểu, tham lam?)
+_STOP_FIELDS = [
+    ('Họ và tên', ['Họ và tên', 'Ho va ten', 'Full name'], r'[A-ZÀ-ỴĐ]', r'[A-ZÀ-ỴĐ\s]', 3, False),
+    ('Quốc tịch', ['Quốc tịch', 'Nationality'], r'[A-Za-zÀ-Ỹà-ỹ\s]', r'[A-Za-zÀ-Ỹà-ỹ\s]', 3, True),
+    ('Quê quán', ['Quê quán', 'Place of origin'], r'[A-Za-zÀ-Ỹà-ỹ,\s]', r'[A-Za-zÀ-Ỹà-ỹ,\s]', 1, False),
+    ('Nơi thường trú', ['Nơi thường trú', 'Place of residence'], r'[A-Za-zÀ-Ỹà-ỹ,\s]', r'[A-Za-zÀ-Ỹà-ỹ,\s]', 1, False),
+]
+
+# Trường không cần nhãn dừng: giá trị khớp ngay sau nhãn
+_MATCH_FIELDS = [
+    ('Ngày sinh', ['Ngày sinh', 'Date of birth'], r'([0-3]?\d[/-][01]?\d[/-]\d{4})'),
+    ('Giới tính', ['Giới tính', 'Sex'], r'([Nn]am|[Nn]ữ|[Nn]u)'),
+]
+
+# Nhãn dùng khi ghép nhãn-giá trị theo bố cục (layout.label_values)
+_LAYOUT_LABELS = {
+    **{name: labels for name, labels, *_ in _STOP_FIELDS + _MATCH_FIELDS},
+    'Ngày hết hạn': ['Có giá trị đến', 'Có giá trị', 'Date of expiry'],
+}
+_LAYOUT_MULTILINE = ('Quê quán', 'Nơi thường trú')
+
+# Giá trị hợp lệ của từng trường khi đã tách đúng khỏi nhãn
+_LAYOUT_VALUES = {
+    'Họ và tên': re.compile(r'[A-ZÀ-ỴĐ][A-ZÀ-ỴĐ\s]{2,}', re.IGNORECASE),
+    'Ngày sinh': re.compile(r'[0-3]?\d[/-][01]?\d[/-]\d{4}'),
+    'Giới tính': re.compile(r'[Nn]am|[Nn]ữ|[Nn]u'),
+    'Quốc tịch': re.compile(r'[A-Za-zÀ-Ỹà-ỹ\s]{3,}'),
+    'Quê quán': re.compile(r'.+'),
+    'Nơi thường trú': re.compile(r'.+'),
+}
+
+
+def _is_word(ch: str) -> bool:
+    return ch.isalnum() or ch == '_'
+
+
+def _first_char_guard(words) -> str:
+    # Lookahead theo ký tự đầu giúp re bỏ qua nhanh các vị trí không thể khớp
+    chars = sorted({c for w in words for c in (w[0].lower(), w[0].upper())})
+    return '(?=[' + ''.join(map(re.escape, chars)) + '])'
+
+
+class CccdExtractor:
+    def __init__(self):
+        # Một mẫu duy nhất tìm mọi nhãn và từ khóa dừng (kể cả chồng lấn), mỗi nhãn một nhóm
+        kinds = {}
+        for name, labels, *_ in _STOP_FIELDS + _MATCH_FIELDS:
+            for label in labels:
+                kinds[label.lower()] = name
+        anchors = sorted(set(kinds) | {k.lower() for k in STOP_KEYWORDS}, key=len, reverse=True)
+        self._anchor_re = re.compile(_first_char_guard(anchors) + '(?=('
+                                     + '|'.join(map(re.escape, anchors)) + '))', re.IGNORECASE)
+        # Với mỗi nhãn: tên trường (nếu có) và độ dài các từ khóa dừng là tiền tố của nó
+        self._anchor_info = {
+            a: (kinds.get(a), [len(k) for k in STOP_KEYWORDS if a.startswith(k.lower())])
+            for a in anchors
+        }
+        self._anchor_exact = [(re.compile(re.escape(a), re.IGNORECASE), a) for a in anchors]
+
+        self._prefix_re = re.compile(_PREFIX + '*')
+        self._stop_fields = [
+            (name, re.compile(first + rest + '*', re.IGNORECASE), min_len, greedy)
+            for name, _, first, rest, min_len, greedy in _STOP_FIELDS
+        ]
+        self._match_fields = [
+            (name, re.compile(_PREFIX + '*' + value, re.IGNORECASE))
+            for name, _, value in _MATCH_FIELDS
+        ]
+        self._cccd_re = re.compile(r'\b\d{12}\b')
+        self._date_re = re.compile(r'\d{2}/\d{2}/\d{4}')
+        self._label_re, self._label_names = compile_labels(_LAYOUT_LABELS)
+
+    def prepare(self, text: str) -> str:
+        text = unicodedata.normalize('NFC', text)
+        text = ' '.join(text.split())
+        return correct_labels(text)
+
+    def _scan(self, text: str):
+        labels = {}
+        stops = []
+        n = len(text)
+        for m in self._anchor_re.finditer(text):
+            pos = m.start()
+            anchor = m.group(1)
+            info = self._anchor_info.get(anchor.lower())
+            if info is None:
+                # Ký tự có cách gập chữ hoa/thường đặc biệt, dò lại từng nhãn
+                info = next(self._anchor_info[a] for r, a in self._anchor_exact if r.fullmatch(anchor))
+            kind, stop_lengths = info
+            if kind:
+                labels.setdefault(kind, []).append((pos, pos + len(anchor)))
+            # Tương đương \b(?:STOP_KEYWORDS)\b tại vị trí này
+            if stop_lengths and (pos == 0 or not _is_word(text[pos - 1])):
+                if any(pos + k == n or not _is_word(text[pos + k]) for k in stop_lengths):
+                    stops.append(pos)
+        return labels, stops
+
+    def _stop_value(self, text, starts, stops, value_re, min_len, greedy):
+        for _, label_end in starts:
+            prefix_end = self._prefix_re.match(text, label_end).end()
+            # Giống regex gốc: thử tiền tố dài nhất trước, rồi lùi dần
+            for p in range(prefix_end, label_end - 1, -1):
+                m = value_re.match(text, p)
+                if not m:
+                    continue
+                lo = bisect.bisect_left(stops, p + min_len)
+                hi = bisect.bisect_right(stops, m.end())
+                if lo < hi:
+                    q = stops[hi - 1] if greedy else stops[lo]
+                    return text[p:q]
+        return None
+
+    def extract(self, text: str) -> dict:
+        text = self.prepare(text)
+        labels, stops = self._scan(text)
+        found = {}
+
+        for name, value_re in self._match_fields:
+            for _, label_end in labels.get(name, ()):
+                m = value_re.match(text, label_end)
+                if m:
+                    found[name] = m.group(1)
+                    break
+        for name, value_re, min_len, greedy in self._stop_fields:
+            value = self._stop_value(text, labels.get(name, ()), stops, value_re, min_len, greedy)
+            found[name] = value.strip() if value is not None else None
+
+        m = self._cccd_re.search(text)
+        dates = self._date_re.findall(text)
+        result = {
+            'CCCD': m.group() if m else None,
+            'Họ và tên': found['Họ và tên'],
+            'Ngày sinh': found.get('Ngày sinh'),
+            'Giới tính': found['Giới tính'].capitalize() if found.get('Giới tính') else None,
+            'Quốc tịch': found['Quốc tịch'].title() if found['Quốc tịch'] is not None else None,
+            'Quê quán': found['Quê quán'],
+            'Nơi thường trú': found['Nơi thường trú'],
+            'Ngày hết hạn': dates[-1] if dates else None,
+        }
+        return postprocess_info(result)
+
+    def extract_lines(self, lines) -> dict:
+        return self.extract_scored(lines)[0]
+
+    def extract_scored(self, lines):
+        # Đầu vào là các dòng theo thứ tự đọc (layout.assemble_lines): sửa lỗi OCR từng dòng,
+        # lấy giá trị theo vị trí nhãn; chỉ khi thiếu trường mới quét lại toàn văn bản.
+        # Trả về (thông tin, {trường: độ tin cậy thấp nhất của các hộp}, {trường: [vị trí hộp trong result]}).
+        fixed = [{**line, 'text': self.prepare(line['text'])} for line in lines]
+        text = lines_text(fixed)
+        used = {}
+        values = label_values(fixed, self._label_re, self._label_names, _LAYOUT_MULTILINE, used)
+
+        result = {}
+        m = self._cccd_re.search(text)
+        result['CCCD'] = m.group() if m else None
+        for name, value_re in _LAYOUT_VALUES.items():
+            m = value_re.match(values.get(name, ''))
+            result[name] = m.group().strip() if m else None
+        if result['Giới tính']:
+            result['Giới tính'] = result['Giới tính'].capitalize()
+        if result['Quốc tịch']:
+            result['Quốc tịch'] = result['Quốc tịch'].title()
+        dates = self._date_re.findall(values.get('Ngày hết hạn', '')) or self._date_re.findall(text)
+        result['Ngày hết hạn'] = dates[-1] if dates else None
+
+        result = postprocess_info(result)
+        missing = [k for k, v in result.items() if not v]
+        if missing:
+            fallback = self.extract(text)
+            for k in missing:
+                result[k] = fallback.get(k)
+
+        sources = {}
+        for name, value in result.items():
+            # Giá trị lấy đúng từ vị trí nhãn thì dùng các hộp đã ghép, còn lại dò theo nội dung
+            if used.get(name) and value and value.lower() in values.get(name, '').lower():
+                sources[name] = used[name]
+            else:
+                sources[name] = _locate(lines, name, value)
+        confidence = {name: min((lines[li]['segments'][k][3] for li, k in src), default=None)
+                      for name, src in sources.items()}
+        index = {name: [lines[li]['index'][k] for li, k in src] for name, src in sources.items()}
+        return result, confidence, index
+
+
+def _locate(lines, name: str, value) -> list:
+    # Tìm các hộp chứa giá trị lấy từ toàn văn bản; CCCD thiếu/sai thì lấy hộp có dãy số dài
+    found = []
+    for li, line in enumerate(lines):
+        for k, (txt, *_) in enumerate(line['segments']):
+            txt = txt.strip()
+            if value and txt and (txt in value or value in txt):
+                found.append((li, k))
+            elif value is None and name == 'CCCD' and sum(c.isdigit() for c in txt) >= 9:
+                found.append((li, k))
+    return found
+
+
+def _valid_date(value: str) -> bool:
+    try:
+        d = datetime.datetime.strptime(value.replace('-', '/'), '%d/%m/%Y')
+    except ValueError:
+        return False
+    return 1900 <= d.year <= 2100
+
+
+# Kiểm tra giá trị từng trường; trường không có ở đây chỉ cần khác rỗng
+FIELD_CHECKS = {
+    'CCCD': lambda v: len(v) == 12 and v.isdigit(),
+    'Ngày sinh': _valid_date,
+    'Ngày hết hạn': lambda v: _valid_date(v) or v.lower() == 'không thời hạn',
+    'Giới tính': lambda v: v in ('Nam', 'Nữ', 'Nu'),
+}
+
+
+def weak_fields(info: dict, confidence: dict, min_score: float) -> list:
+    # Trường cần nhận diện lại: thiếu, sai định dạng hoặc có hộp độ tin cậy thấp
+    weak = []
+    for name, value in info.items():
+        check = FIELD_CHECKS.get(name, bool)
+        score = confidence.get(name)
+        if not value or not check(value) or (score is not None and score < min_score):
+            weak.append(name)
+    return weak
+
+
+_default_extractor = None
+
+
+def extract(text) -> dict:
+    # text: chuỗi OCR, hoặc danh sách dòng từ layout.assemble_lines
+    global _default_extractor
+    if _default_extractor is None:
+        _default_extractor = CccdExtractor()
+    if isinstance(text, str):
+        return _default_extractor.extract(text)
+    return _default_extractor.extract_lines(text)
+
+
+def extract_scored(lines):
+    # (thông tin, độ tin cậy từng trường, vị trí các hộp của từng trường) từ các dòng có tọa độ
+    global _default_extractor
+    if _default_extractor is None:
+        _default_extractor = CccdExtractor()
+    return _default_extractor.extract_scored(lines)
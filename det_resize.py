@@ -0,0 +1,144 @@
+import json
+import os
+import sys
+import threading
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+
+from metrics import incr
+
+# Chọn kích thước đầu vào SAST (cạnh dài, bội của 128) theo từng ảnh thay vì cố định det_limit_side_len=960.
+# Bật bằng biến môi trường OCR_ADAPTIVE_DET=1 hoặc tham số adaptive=True của ocr_pipeline.
+ADAPTIVE = os.environ.get('OCR_ADAPTIVE_DET', '') not in ('', '0')
+# Ghi thống kê từng ảnh (kích thước chọn, số hộp, thời gian, độ tin cậy) ra file JSONL để chỉnh chính sách
+STATS_ENV = 'OCR_DET_STATS'
+
+DET_SIZES = (512, 640, 768, 896, 960, 1152, 1280, 1600)
+DEFAULT_DET_SIZE = 960
+# Chiều cao chữ (px) mong muốn sau khi resize: đủ cho SAST tách dòng, thấp hơn nữa thì hộp bị dính/mất
+TARGET_TEXT_PX = 14
+# Thẻ đã nắn về CANONICAL_SIZE: chiều cao chữ ~ 3% chiều cao thẻ, khỏi phải ước lượng
+CARD_TEXT_RATIO = 0.03
+# Ước lượng chiều cao chữ trên ảnh thu nhỏ về chiều rộng này
+ESTIMATE_WIDTH = 800
+MIN_COMPONENTS = 20
+# Dấu hiệu cần thử lại ở độ phân giải cao hơn
+MIN_BOXES = 5
+MIN_BOX_PX = 8
+RETRY_MIN_SCORE = 0.75
+
+_lock = threading.Lock()
+
+
+def estimate_text_height(img: np.ndarray):
+    # Trung vị chiều cao các thành phần liên thông cỡ ký tự trên ảnh nhị phân ngưỡng thích nghi (px ảnh gốc);
+    # None nếu quá ít thành phần (ảnh trống, mờ)
+    gray = cv2.cvtColor(img, cv2.COLOR_BGR2GRAY) if img.ndim == 3 else img
+    scale = min(1.0, ESTIMATE_WIDTH / gray.shape[1])
+    if scale < 1.0:
+        gray = cv2.resize(gray, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+    bw = cv2.adaptiveThreshold(gray, 255, cv2.ADAPTIVE_THRESH_MEAN_C, cv2.THRESH_BINARY_INV, 25, 15)
+    _, _, stats, _ = cv2.connectedComponentsWithStats(bw, connectivity=8)
+    w, h, area = stats[1:, cv2.CC_STAT_WIDTH], stats[1:, cv2.CC_STAT_HEIGHT], stats[1:, cv2.CC_STAT_AREA]
+    keep = (h >= 4) & (h <= 0.1 * gray.shape[0]) & (w <= 3 * h) & (area >= 0.15 * w * h)
+    if keep.sum() < MIN_COMPONENTS:
+        return None
+    return float(np.median(h[keep])) / scale
+
+
+def choose_det_size(img: np.ndarray, rectified: bool = False):
+    # Trả về (kích thước đầu vào SAST, chiều cao chữ ước lượng hoặc None)
+    text_h = CARD_TEXT_RATIO * img.shape[0] if rectified else estimate_text_height(img)
+    if not text_h:
+        return DEFAULT_DET_SIZE, None
+    wanted = max(img.shape[:2]) * TARGET_TEXT_PX / text_h
+    return next((s for s in DET_SIZES if s >= wanted), DET_SIZES[-1]), text_h
+
+
+def next_size(size: int):
+    return next((s for s in DET_SIZES if s > size), None)
+
+
+def _resize_op(detector):
+    for op in getattr(detector, 'preprocess_op', ()):
+        if type(op).__name__ == 'DetResizeForTest':
+            return op
+    return None
+
+
+@contextmanager
+def det_size(detector, size: int):
+    # Đặt tạm kích thước resize của TextDetector (SAST dùng resize_long, DB dùng limit_side_len).
+    # Giữ khóa suốt lần phát hiện vì bộ tiền xử lý dùng chung giữa các luồng.
+    op = _resize_op(detector)
+    with _lock:
+        if op is None:
+            yield
+            return
+        attr = 'resize_long' if hasattr(op, 'resize_long') else 'limit_side_len'
+        old = getattr(op, attr)
+        old_type = getattr(op, 'limit_type', None)
+        setattr(op, attr, size)
+        if attr == 'limit_side_len':
+            op.limit_type = 'max'
+        try:
+            yield
+        finally:
+            setattr(op, attr, old)
+            if old_type is not None:
+                op.limit_type = old_type
+
+
+def looks_wrong(boxes, size: int, img: np.ndarray):
+    # Lý do cần thử lại ở độ phân giải cao hơn, hoặc None
+    if len(boxes) < MIN_BOXES:
+        return 'boxes'
+    heights = [np.ptp(np.asarray(b, dtype=np.float32)[:, 1]) for b in boxes]
+    if np.median(heights) * size / max(img.shape[:2]) < MIN_BOX_PX:
+        return 'small'
+    return None
+
+
+def record(stat: dict):
+    # Bộ đếm theo kích thước/lý do thử lại vào metrics, và một dòng JSON nếu đặt OCR_DET_STATS
+    incr(f"det_size_{stat['size']}")
+    if stat.get('retry'):
+        incr(f"det_retry_{stat['retry']}")
+    path = os.environ.get(STATS_ENV)
+    if path:
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(stat, ensure_ascii=False) + '\n')
+
+
+def summarize(path: str) -> dict:
+    # Gộp file thống kê theo kích thước cuối cùng: số ảnh, thời gian phát hiện TB, số hộp TB,
+    # độ tin cậy TB và tỉ lệ phải thử lại
+    groups = {}
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            stat = json.loads(line)
+            g = groups.setdefault(stat['size'], {'images': 0, 'detect_ms': 0.0, 'boxes': 0, 'score': 0.0,
+                                                 'scored': 0, 'retries': 0})
+            g['images'] += 1
+            g['detect_ms'] += stat.get('detect_ms', 0.0)
+            g['boxes'] += stat.get('boxes', 0)
+            g['retries'] += bool(stat.get('retry'))
+            if stat.get('score') is not None:
+                g['score'] += stat['score']
+                g['scored'] += 1
+    out = {}
+    for size, g in sorted(groups.items()):
+        n = g['images']
+        out[size] = {'images': n, 'detect_ms': g['detect_ms'] / n, 'boxes': g['boxes'] / n,
+                     'score': g['score'] / g['scored'] if g['scored'] else None, 'retry_rate': g['retries'] / n}
+    return out
+
+
+if __name__ == '__main__':
+    # python det_resize.py det_stats.jsonl
+    for size, s in summarize(sys.argv[1]).items():
+        score = f"{s['score']:.3f}" if s['score'] is not None else '-'
+        print(f"{size:5d}  {s['images']:6d} ảnh  detect {s['detect_ms']:7.1f}ms  {s['boxes']:5.1f} hộp  "
+              f"tin cậy {score}  thử lại {s['retry_rate']:.1%}")
@@ -0,0 +1,264 @@
+import re
+
+import cccd_parser
+from cccd_parser import FIELD_CHECKS
+from export_sink import FIELDS
+from layout import compile_labels, label_values, lines_text, text_lines
+from mrz import find_mrz_lines, parse_mrz, valid
+from ocr_correct import LabelCorrector, correct_address, fold
+
+# Phiên bản bộ trích xuất, là một phần khóa của thông tin trích xuất trong OcrCache.
+# Tăng mỗi khi sửa layout, cccd_parser, doc_types hoặc ocr_correct làm đổi kết quả trích xuất.
+PARSER_VERSION = 2
+# Khóa ghi loại giấy tờ vào kết quả trích xuất
+TYPE_KEY = 'Loại giấy tờ'
+# Số dòng đầu (theo thứ tự đọc) dùng để nhận loại giấy tờ
+CLASSIFY_LINES = 5
+# Loại mặc định khi không thấy từ khóa nào
+DEFAULT_TYPE = 'cccd'
+
+_DATE = r'[0-3]?\d[/-][01]?\d[/-]\d{4}'
+# Nhãn số giấy tờ ('Số', 'No') chỉ là nhãn khi theo sau là dãy 9 hoặc 12 chữ số
+_ID_FOLLOW = r'[\s:/.-]*(?:\d{12}|\d{9})(?!\d)'
+_NAME = r'[A-ZÀ-ỴĐ][A-ZÀ-ỴĐ\s]{2,}'
+
+
+class DocParser:
+    # Bộ trích xuất khai báo cho một loại giấy tờ:
+    #   labels:    {trường: [các nhãn in trên giấy]}, giá trị lấy theo bố cục (layout.label_values)
+    #   values:    {trường: mẫu giá trị}, khớp ở đầu giá trị sau nhãn (nhóm 1 nếu có)
+    #   search:    {trường: mẫu}, tìm trên toàn văn bản khi trường không có nhãn hoặc thiếu giá trị
+    #   multiline: các trường được nối thêm dòng bên dưới
+    #   follow:    {trường: mẫu}, nhãn của trường chỉ được tính khi ngay sau nó khớp mẫu
+    #   checks:    {trường: hàm kiểm tra}, giá trị không hợp lệ bị bỏ (None)
+    #   clean:     {trường: hàm chuẩn hóa giá trị}
+    #   extra:     hàm(các dòng văn bản) -> {trường: giá trị} bổ sung trường không theo nhãn (vd. MRZ),
+    #              extra_fields là danh sách các trường đó
+    def __init__(self, labels: dict, values: dict, search: dict = None, multiline=(), checks: dict = None,
+                 clean: dict = None, extra=None, extra_fields=(), follow: dict = None):
+        self.labels = labels
+        self.values = {k: re.compile(v, re.IGNORECASE) for k, v in values.items()}
+        self.search = {k: re.compile(v, re.IGNORECASE) for k, v in (search or {}).items()}
+        self.multiline = tuple(multiline)
+        self.checks = checks or {}
+        self.clean = clean or {}
+        self.extra = extra
+        self.fields = list(dict.fromkeys(list(labels) + list(self.search) + list(extra_fields)))
+        self._label_re, self._label_names = compile_labels(labels, follow)
+        self._corrector = LabelCorrector([l for ls in labels.values() for l in ls], aliases={})
+
+    def extract(self, text) -> dict:
+        return self.extract_scored(text_lines(text) if isinstance(text, str) else text)[0]
+
+    def extract_scored(self, lines):
+        # Giống cccd_parser.extract_scored: (thông tin, độ tin cậy từng trường, vị trí hộp từng trường)
+        fixed = [{**line, 'text': self._corrector.correct(' '.join(line['text'].split()))} for line in lines]
+        used = {}
+        values = label_values(fixed, self._label_re, self._label_names, self.multiline, used)
+        text = lines_text(fixed)
+
+        result, sources = {}, {}
+        for name in self.fields:
+            value = None
+            pattern = self.values.get(name)
+            m = pattern.match(values.get(name, '')) if pattern else None
+            if m:
+                value = (m.group(1) if m.re.groups else m.group()).strip()
+                sources[name] = used.get(name, [])
+            elif name in self.search:
+                m = self.search[name].search(text)
+                if m:
+                    value = (m.group(1) if m.re.groups else m.group()).strip()
+                    sources[name] = cccd_parser._locate(lines, name, value)
+            if value and name in self.clean:
+                value = self.clean[name](value)
+            if value and not self.checks.get(name, bool)(value):
+                value = None
+            result[name] = value or None
+        if self.extra is not None:
+            for name, value in self.extra([line['text'] for line in lines]).items():
+                if result.get(name) is None:
+                    result[name] = value
+        confidence = {name: min((lines[li]['segments'][k][3] for li, k in sources.get(name, ())), default=None)
+                      for name in result}
+        index = {name: [lines[li]['index'][k] for li, k in sources.get(name, ())] for name in result}
+        return result, confidence, index
+
+
+class CccdParser:
+    # Mặt trước CCCD dùng bộ trích xuất đã tối ưu trong cccd_parser
+    fields = FIELDS
+    checks = FIELD_CHECKS
+
+    def extract(self, text) -> dict:
+        return cccd_parser.extract(text)
+
+    def extract_scored(self, lines):
+        return cccd_parser.extract_scored(lines)
+
+
+def _id_number(*lengths):
+    return lambda v: v.isdigit() and len(v) in lengths
+
+
+MRZ_FIELDS = ['CCCD', 'Họ và tên', 'Ngày sinh', 'Giới tính', 'Quốc tịch', 'Ngày hết hạn', 'MRZ']
+
+
+def _mrz_fields(texts) -> dict:
+    # Trường đọc từ MRZ trong văn bản OCR mặt sau; MRZ ghi rõ có đúng số kiểm tra hay không
+    parsed = parse_mrz(find_mrz_lines(texts))
+    if parsed is None:
+        return {}
+    info, checks = parsed
+    return {**info, 'MRZ': 'hợp lệ' if valid(checks) else 'sai số kiểm tra'}
+
+
+DOC_TYPES = {}
+
+
+def register(name: str, title: str, keywords, parser):
+    # Từ khóa so khớp không dấu, bỏ khoảng trắng (ocr_correct.fold) trên vài dòng đầu của giấy tờ
+    DOC_TYPES[name] = (title, [fold(k) for k in keywords], parser)
+
+
+register('cccd', 'Căn cước công dân', [
+    'Căn cước công dân', 'Citizen Identity Card', 'Căn cước', 'Identity Card',
+], CccdParser())
+
+register('cccd_back', 'Căn cước công dân (mặt sau)', [
+    'Đặc điểm nhân dạng', 'Personal identification', 'Ngón trỏ trái', 'Left index finger',
+    'Ngón trỏ phải', 'Right index finger', 'IDVNM',
+], DocParser(
+    labels={
+        'Đặc điểm nhân dạng': ['Đặc điểm nhân dạng', 'Personal identification'],
+        'Ngày cấp': ['Ngày, tháng, năm', 'Ngày tháng năm', 'Date, month, year', 'Date month year'],
+    },
+    values={
+        'Đặc điểm nhân dạng': r'.+',
+        'Ngày cấp': rf'({_DATE})',
+    },
+    search={
+        'Nơi cấp': r'(?:CỤC CẢNH SÁT QUẢN LÝ HÀNH CHÍNH VỀ TRẬT TỰ XÃ HỘI|BỘ CÔNG AN)',
+    },
+    checks={'Ngày cấp': FIELD_CHECKS['Ngày sinh']},
+    clean={'Nơi cấp': str.upper},
+    extra=_mrz_fields,
+    extra_fields=MRZ_FIELDS,
+))
+
+register('cmnd', 'Chứng minh nhân dân', [
+    'Chứng minh nhân dân', 'Giấy chứng minh', 'Nơi ĐKHK thường trú', 'Nguyên quán',
+], DocParser(
+    labels={
+        'CMND': ['Số'],
+        'Họ và tên': ['Họ tên', 'Họ và tên'],
+        'Ngày sinh': ['Sinh ngày', 'Ngày sinh'],
+        'Quê quán': ['Nguyên quán', 'Quê quán'],
+        'Nơi thường trú': ['Nơi ĐKHK thường trú', 'Nơi thường trú'],
+    },
+    values={
+        'CMND': r'(\d{12}|\d{9})(?!\d)',
+        'Họ và tên': _NAME,
+        'Ngày sinh': rf'({_DATE})',
+        'Quê quán': r'.+',
+        'Nơi thường trú': r'.+',
+    },
+    search={'CMND': r'(?<!\d)(\d{12}|\d{9})(?!\d)'},
+    multiline=('Quê quán', 'Nơi thường trú'),
+    follow={'CMND': _ID_FOLLOW},
+    checks={'CMND': _id_number(9, 12), 'Ngày sinh': FIELD_CHECKS['Ngày sinh']},
+    clean={'Quê quán': correct_address, 'Nơi thường trú': correct_address},
+))
+
+register('gplx', 'Giấy phép lái xe', [
+    'Giấy phép lái xe', "Driver's license", 'Driver license', 'Hạng Class', 'Ngày trúng tuyển',
+], DocParser(
+    labels={
+        'Số GPLX': ['Số', 'No'],
+        'Họ và tên': ['Họ tên', 'Họ và tên', 'Full name'],
+        'Ngày sinh': ['Ngày sinh', 'Date of birth'],
+        'Quốc tịch': ['Quốc tịch', 'Nationality'],
+        'Nơi cư trú': ['Nơi cư trú', 'Address'],
+        'Hạng': ['Hạng', 'Class'],
+        'Ngày trúng tuyển': ['Ngày trúng tuyển', 'Beginning date'],
+        'Ngày hết hạn': ['Có giá trị đến', 'Giá trị đến', 'Expires'],
+    },
+    values={
+        'Số GPLX': r'(\d{12}|\d{9})(?!\d)',
+        'Họ và tên': _NAME,
+        'Ngày sinh': rf'({_DATE})',
+        'Quốc tịch': r'[A-Za-zÀ-Ỹà-ỹ\s]{3,}',
+        'Nơi cư trú': r'.+',
+        'Hạng': r'(A[1-4]|B[12E]?|C1?E?|D[12]?E?|F[B-E]2?|[E])(?!\w)',
+        'Ngày trúng tuyển': rf'({_DATE})',
+        'Ngày hết hạn': rf'({_DATE}|Không thời hạn)',
+    },
+    search={'Số GPLX': r'(?<!\d)(\d{12})(?!\d)'},
+    multiline=('Nơi cư trú',),
+    follow={'Số GPLX': _ID_FOLLOW},
+    checks={
+        'Số GPLX': _id_number(9, 12),
+        'Ngày sinh': FIELD_CHECKS['Ngày sinh'],
+        'Ngày trúng tuyển': FIELD_CHECKS['Ngày sinh'],
+        'Ngày hết hạn': FIELD_CHECKS['Ngày hết hạn'],
+    },
+    clean={'Quốc tịch': str.title, 'Hạng': str.upper, 'Nơi cư trú': correct_address},
+))
+
+
+def classify(lines) -> str:
+    # Chọn loại giấy tờ theo số từ khóa xuất hiện trong CLASSIFY_LINES dòng đầu; không thấy thì xét
+    # toàn văn bản, vẫn không thấy thì coi là DEFAULT_TYPE. Chỉ bộ trích xuất của loại được chọn chạy.
+    if isinstance(lines, str):
+        texts = [t for t in lines.splitlines() if t.strip()]
+    else:
+        texts = [line['text'] for line in lines]
+    head, rest = texts[:CLASSIFY_LINES], texts[CLASSIFY_LINES:]
+    if len(texts) == 1:
+        # Văn bản OCR ghép thành một dòng: xét 200 ký tự đầu trước
+        head, rest = [texts[0][:200]], texts
+    for part in (head, rest):
+        key = fold(' '.join(part))
+        if not key:
+            continue
+        scores = {name: sum(k in key for k in keywords) for name, (_, keywords, _) in DOC_TYPES.items()}
+        best = max(scores, key=scores.get)
+        if scores[best]:
+            return best
+    return DEFAULT_TYPE
+
+
+def parser_for(name: str):
+    return DOC_TYPES[name][2]
+
+
+def extract(text) -> dict:
+    # text: chuỗi OCR hoặc danh sách dòng (layout.assemble_lines); kết quả kèm TYPE_KEY
+    name = classify(text)
+    return {TYPE_KEY: name, **parser_for(name).extract(text)}
+
+
+def extract_scored(lines):
+    name = classify(lines)
+    info, confidence, index = parser_for(name).extract_scored(lines)
+    return {TYPE_KEY: name, **info}, confidence, index
+
+
+def weak_fields(info: dict, confidence: dict, min_score: float) -> list:
+    # Như cccd_parser.weak_fields nhưng theo kiểm tra của đúng loại giấy tờ
+    parser = parser_for(info.get(TYPE_KEY, DEFAULT_TYPE))
+    weak = []
+    for name in parser.fields:
+        value = info.get(name)
+        score = confidence.get(name)
+        if not value or not parser.checks.get(name, bool)(value) or (score is not None and score < min_score):
+            weak.append(name)
+    return weak
+
+
+def all_fields() -> list:
+    # Cột xuất dữ liệu: loại giấy tờ, các trường CCCD rồi các trường riêng của loại khác
+    fields = [TYPE_KEY]
+    for _, _, parser in DOC_TYPES.values():
+        fields += [f for f in parser.fields if f not in fields]
+    return fields
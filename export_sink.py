@@ -0,0 +1,160 @@
+import csv
+import glob
+import io
+import json
+import os
+import time
+
+FIELDS = ['CCCD', 'Họ và tên', 'Ngày sinh', 'Giới tính', 'Quốc tịch',
+          'Quê quán', 'Nơi thường trú', 'Ngày hết hạn']
+
+# File ghi nối tiếp mặc định của giao diện
+DEFAULT_EXPORT_PATH = 'du_lieu_trich_xuat.csv'
+
+
+def _repair_tail(path: str):
+    # Lần chạy trước bị tắt ngang có thể để lại dòng ghi dở: cắt về ký tự xuống dòng cuối cùng
+    if not os.path.exists(path) or os.path.getsize(path) == 0:
+        return
+    with open(path, 'rb+') as f:
+        f.seek(-1, os.SEEK_END)
+        if f.read(1) == b'\n':
+            return
+        size = f.seek(0, os.SEEK_END)
+        pos = max(0, size - 65536)
+        f.seek(pos)
+        tail = f.read()
+        f.truncate(pos + tail.rfind(b'\n') + 1)
+
+
+def _read_csv_header(path: str):
+    with open(path, newline='', encoding='utf-8-sig') as f:
+        return next(csv.reader(f), None)
+
+
+def _count_rows(path: str, fmt: str) -> int:
+    with open(path, 'rb') as f:
+        lines = sum(1 for line in f if line.strip())
+    return max(0, lines - 1) if fmt == 'csv' else lines
+
+
+class RotatingWriter:
+    # Gom bản ghi rồi ghi thành từng file Parquet/XLSX riêng (prefix-0001.parquet, ...),
+    # mỗi file đủ rotate_rows dòng; file đã ghi xong thì không bao giờ mở lại.
+    def __init__(self, prefix: str, fmt: str, fields: list, rotate_rows: int = 1000):
+        if fmt not in ('parquet', 'xlsx'):
+            raise ValueError(f"Định dạng xoay vòng không hỗ trợ: {fmt}")
+        # Báo thiếu thư viện ngay khi mở, không đợi tới lúc ghi phần đầu tiên
+        __import__('pyarrow.parquet' if fmt == 'parquet' else 'openpyxl')
+        self.prefix = prefix
+        self.fmt = fmt
+        self.fields = fields
+        self.rotate_rows = rotate_rows
+        self.rows = []
+        # Tiếp tục đánh số sau các phần đã có từ lần chạy trước
+        self.part = len(glob.glob(glob.escape(prefix) + f'-[0-9][0-9][0-9][0-9].{fmt}'))
+
+    def write(self, record: dict):
+        self.rows.append(record)
+        if len(self.rows) >= self.rotate_rows:
+            self.roll()
+
+    def roll(self):
+        if not self.rows:
+            return None
+        self.part += 1
+        path = f"{self.prefix}-{self.part:04d}.{self.fmt}"
+        tmp = path + '.tmp'
+        if self.fmt == 'parquet':
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+            columns = {f: [None if r.get(f) is None else str(r.get(f)) for r in self.rows] for f in self.fields}
+            pq.write_table(pa.table(columns), tmp)
+        else:
+            from openpyxl import Workbook
+            wb = Workbook(write_only=True)
+            ws = wb.create_sheet()
+            ws.append(self.fields)
+            for r in self.rows:
+                ws.append([r.get(f) for f in self.fields])
+            wb.save(tmp)
+        os.replace(tmp, path)
+        self.rows = []
+        return path
+
+    def close(self):
+        self.roll()
+
+
+class ExportSink:
+    # Ghi nối tiếp từng bản ghi ra CSV hoặc JSONL ngay khi có kết quả, không giữ toàn bộ trong bộ nhớ.
+    # Bản ghi được gom và ghi xuống đĩa mỗi batch_size dòng hoặc sau flush_interval giây;
+    # mở lại file cũ thì ghi tiếp (append=True), dữ liệu các lần chạy trước vẫn còn.
+    def __init__(self, path: str = DEFAULT_EXPORT_PATH, fmt: str = None, fields: list = None,
+                 batch_size: int = 20, flush_interval: float = 2.0, append: bool = True,
+                 rotate_format: str = None, rotate_rows: int = 1000):
+        self.path = path
+        self.fmt = fmt or ('jsonl' if path.endswith('.jsonl') else 'csv')
+        self.batch_size = batch_size
+        self.flush_interval = flush_interval
+        self._buffer = []
+        self._last_flush = time.monotonic()
+
+        exists = append and os.path.exists(path) and os.path.getsize(path) > 0
+        if exists:
+            _repair_tail(path)
+            exists = os.path.getsize(path) > 0
+        if exists and self.fmt == 'csv':
+            # Giữ đúng thứ tự cột của file đã có
+            fields = _read_csv_header(path) or fields
+        self.fields = list(fields or FIELDS)
+        self.count = _count_rows(path, self.fmt) if exists else 0
+
+        encoding = 'utf-8-sig' if self.fmt == 'csv' and not exists else 'utf-8'
+        self._file = open(path, 'a' if exists else 'w', newline='', encoding=encoding)
+        if self.fmt == 'csv' and not exists:
+            csv.writer(self._file).writerow(self.fields)
+            self._file.flush()
+        self.rotating = RotatingWriter(os.path.splitext(path)[0], rotate_format, self.fields,
+                                       rotate_rows) if rotate_format else None
+
+    def write(self, record: dict):
+        self._buffer.append(record)
+        self.count += 1
+        if self.rotating:
+            self.rotating.write(record)
+        if len(self._buffer) >= self.batch_size or time.monotonic() - self._last_flush >= self.flush_interval:
+            self.flush()
+
+    def _encode(self, records) -> str:
+        if self.fmt == 'jsonl':
+            return ''.join(json.dumps(r, ensure_ascii=False) + '\n' for r in records)
+        buf = io.StringIO()
+        writer = csv.DictWriter(buf, fieldnames=self.fields, extrasaction='ignore')
+        writer.writerows(records)
+        return buf.getvalue()
+
+    def flush(self):
+        self._last_flush = time.monotonic()
+        if not self._buffer:
+            return
+        # Ghi cả lô bằng một lần write rồi fsync để tắt máy đột ngột cũng không mất lô đã ghi
+        self._file.write(self._encode(self._buffer))
+        self._file.flush()
+        os.fsync(self._file.fileno())
+        self._buffer = []
+
+    def close(self):
+        if self._file.closed:
+            return
+        self.flush()
+        self._file.close()
+        if self.rotating:
+            self.rotating.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+        return False
@@ -0,0 +1,67 @@
+import os
+import time
+
+import cv2
+import numpy as np
+
+# Đặt biến môi trường OCR_DEBUG_DIR để lưu ảnh/văn bản trung gian khi cần gỡ lỗi
+DEBUG_DIR_ENV = 'OCR_DEBUG_DIR'
+
+
+def read_bytes(path: str) -> np.ndarray:
+    # Đọc nguyên file ảnh (hỗ trợ cả đường dẫn có dấu tiếng Việt)
+    return np.fromfile(path, dtype=np.uint8)
+
+
+def decode_image(data: np.ndarray, source: str = "") -> np.ndarray:
+    img = cv2.imdecode(data, cv2.IMREAD_COLOR) if data.size else None
+    if img is None:
+        raise ValueError(f"Không đọc được ảnh: {source}")
+    return img
+
+
+def read_image(path: str) -> np.ndarray:
+    # Đọc ảnh thành mảng BGR
+    return decode_image(read_bytes(path), path)
+
+
+def to_qimage(img: np.ndarray, bgr: bool = True):
+    # Chuyển mảng numpy thành QImage (có copy để không phụ thuộc vùng nhớ của mảng)
+    from PyQt6.QtGui import QImage
+
+    if img.ndim == 2:
+        img = np.ascontiguousarray(img)
+        h, w = img.shape
+        return QImage(img.data, w, h, img.strides[0], QImage.Format.Format_Grayscale8).copy()
+    if bgr:
+        img = cv2.cvtColor(img, cv2.COLOR_BGR2RGB)
+    img = np.ascontiguousarray(img)
+    h, w = img.shape[:2]
+    return QImage(img.data, w, h, img.strides[0], QImage.Format.Format_RGB888).copy()
+
+
+def debug_path(name: str):
+    # Trả về đường dẫn duy nhất trong thư mục gỡ lỗi, hoặc None nếu không bật
+    debug_dir = os.environ.get(DEBUG_DIR_ENV)
+    if not debug_dir:
+        return None
+    os.makedirs(debug_dir, exist_ok=True)
+    stem, ext = os.path.splitext(name)
+    return os.path.join(debug_dir, f"{stem}_{os.getpid()}_{time.time_ns()}{ext}")
+
+
+def save_debug_image(name: str, img: np.ndarray, bgr: bool = True):
+    path = debug_path(name)
+    if path:
+        ok, buf = cv2.imencode(os.path.splitext(path)[1], img if bgr else cv2.cvtColor(img, cv2.COLOR_RGB2BGR))
+        if ok:
+            buf.tofile(path)
+    return path
+
+
+def save_debug_text(name: str, text: str):
+    path = debug_path(name)
+    if path:
+        with open(path, "w", encoding="utf-8") as f:
+            f.write(text)
+    return path
@@ -0,0 +1,124 @@
+import re
+
+import numpy as np
+
+# Hai hộp thuộc cùng một dòng khi tâm lệch nhau không quá Y_TOL lần chiều cao chữ
+Y_TOL = 0.6
+# Dòng giá trị nằm dưới nhãn phải cách dòng trước không quá LINE_GAP lần chiều cao chữ
+LINE_GAP = 2.2
+
+
+def assemble_lines(result, y_tol: float = Y_TOL) -> list:
+    # Gom các hộp chữ của một thẻ (kết quả dạng ocr.ocr: [[box, (txt, score)], ...])
+    # thành các dòng theo thứ tự đọc, tính toàn bộ hình học trên mảng NumPy một lượt.
+    # Trả về [{'text', 'y', 'h', 'segments': [(txt, x0, x1, score)], 'index': [vị trí hộp trong result]}],
+    # tọa độ đã xoay thẳng.
+    items = [line for res in result if res for line in res]
+    if not items:
+        return []
+    boxes = np.array([item[0] for item in items], dtype=np.float32).reshape(-1, 4, 2)
+
+    # Xoay ngược theo góc nghiêng chủ đạo (cạnh trên của các hộp) để dòng chữ nằm ngang
+    top = boxes[:, 1] - boxes[:, 0]
+    angle = float(np.median(np.arctan2(top[:, 1], top[:, 0])))
+    c, s = np.cos(angle), np.sin(angle)
+    pts = boxes @ np.array([[c, -s], [s, c]], dtype=np.float32)
+
+    x0, x1 = pts[..., 0].min(axis=1), pts[..., 0].max(axis=1)
+    y0, y1 = pts[..., 1].min(axis=1), pts[..., 1].max(axis=1)
+    cy = (y0 + y1) / 2
+    h = y1 - y0
+
+    # Tách dòng ở các khoảng nhảy tâm dọc lớn, rồi sắp theo (dòng, x)
+    by_y = np.argsort(cy, kind='stable')
+    breaks = np.diff(cy[by_y]) > y_tol * max(float(np.median(h)), 1.0)
+    line_of = np.empty(len(items), dtype=np.int64)
+    line_of[by_y] = np.concatenate([[0], np.cumsum(breaks)])
+    order = np.lexsort((x0, line_of))
+    bounds = np.flatnonzero(np.diff(line_of[order])) + 1
+
+    lines = []
+    for idx in np.split(order, bounds):
+        segments = [(items[i][1][0], float(x0[i]), float(x1[i]), float(items[i][1][1])) for i in idx]
+        lines.append({
+            'text': " ".join(seg[0] for seg in segments),
+            'y': float(cy[idx].mean()),
+            'h': float(np.median(h[idx])),
+            'segments': segments,
+            'index': idx.tolist(),
+        })
+    return lines
+
+
+def lines_text(lines, sep: str = " ") -> str:
+    return sep.join(line['text'] for line in lines)
+
+
+def text_lines(text: str) -> list:
+    # Văn bản thuần (vd. người dùng sửa tay) -> các dòng giả, mỗi dòng một hộp, để dùng chung label_values
+    lines = []
+    for i, t in enumerate(t.strip() for t in text.splitlines()):
+        if t:
+            lines.append({'text': t, 'y': float(i), 'h': 1.0, 'segments': [(t, 0.0, float(len(t)), 1.0)],
+                          'index': [i]})
+    return lines
+
+
+def compile_labels(labels: dict, follow: dict = None):
+    # labels: {tên trường: [các nhãn]} -> mẫu tìm nhãn (một hoặc nhiều nhãn liền nhau của cùng trường)
+    # follow: {tên trường: mẫu} - nhãn chỉ được tính khi ngay sau nó khớp mẫu (vd. nhãn ngắn 'Số' chỉ là
+    # nhãn khi đứng trước dãy số giấy tờ, không phải chữ 'Số' của số nhà trong địa chỉ)
+    groups, names = [], {}
+    for i, (field, alternatives) in enumerate(labels.items()):
+        alt = '|'.join(map(re.escape, sorted(alternatives, key=len, reverse=True)))
+        after = rf'(?={follow[field]})' if follow and field in follow else ''
+        groups.append(rf'(?P<f{i}>(?:{alt})(?!\w)(?:[\s/:.-]*(?:{alt})(?!\w))*){after}[\s:/.-]*')
+        names[f'f{i}'] = field
+    return re.compile(r'(?<!\w)(?:' + '|'.join(groups) + ')', re.IGNORECASE), names
+
+
+def _segments_in(line, start: int, end: int) -> list:
+    # Thứ tự các hộp phủ đoạn ký tự [start, end) của line['text'] (gần đúng nếu text đã được sửa lỗi)
+    found, pos = [], 0
+    for k, (txt, _, _, _) in enumerate(line['segments']):
+        if pos < end and pos + len(txt) > start:
+            found.append(k)
+        pos += len(txt) + 1
+    return found or [len(line['segments']) - 1]
+
+
+def label_values(lines, label_re, names: dict, multiline=(), sources: dict = None) -> dict:
+    # Ghép nhãn với giá trị theo hình học: giá trị nằm bên phải nhãn trên cùng dòng (tới nhãn kế tiếp),
+    # nếu trống thì lấy các hộp ở dòng ngay dưới, lệch trái không quá một chiều cao chữ.
+    # Trường trong multiline được nối thêm các dòng tiếp theo không chứa nhãn.
+    # sources (nếu có) nhận {trường: [(dòng, thứ tự hộp)]} của các hộp tạo nên giá trị.
+    values = {}
+    for li, line in enumerate(lines):
+        text = line['text']
+        matches = list(label_re.finditer(text))
+        for k, m in enumerate(matches):
+            field = names[m.lastgroup]
+            if field in values:
+                continue
+            end = matches[k + 1].start() if k + 1 < len(matches) else len(text)
+            value = text[m.end():end].strip()
+            used = [(li, k) for k in _segments_in(line, m.end(), end)] if value else []
+            if not value or field in multiline:
+                left = line['segments'][_segments_in(line, m.start(), m.start() + 1)[0]][1] - line['h']
+                prev_y = line['y']
+                for bi, below in enumerate(lines[li + 1:], li + 1):
+                    if below['y'] - prev_y > LINE_GAP * max(line['h'], below['h']):
+                        break
+                    keep = [k for k, seg in enumerate(below['segments']) if seg[1] >= left]
+                    extra = " ".join(below['segments'][k][0] for k in keep)
+                    if not extra or label_re.search(extra):
+                        break
+                    value = f"{value} {extra}".strip()
+                    used += [(bi, k) for k in keep]
+                    prev_y = below['y']
+                    if field not in multiline:
+                        break
+            values[field] = value
+            if sources is not None:
+                sources[field] = used
+    return values
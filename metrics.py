@@ -0,0 +1,169 @@
+import json
+import os
+import threading
+import time
+from collections import deque
+
+# Bật bằng biến môi trường OCR_METRICS=1 hoặc gọi enable(); khi tắt, timer() gần như không tốn gì
+_enabled = os.environ.get('OCR_METRICS', '') not in ('', '0')
+
+# Thứ tự các công đoạn khi hiển thị
+STAGES = ['decode', 'rectify', 'detect', 'cls', 'rec', 'refine', 'layout', 'draw', 'parse', 'export', 'card']
+
+MAX_SAMPLES = 4096
+
+
+def percentiles(values) -> dict:
+    # p50/p95/p99 (cùng đơn vị với values) theo hạng gần nhất; rỗng thì trả {}
+    values = sorted(values)
+    if not values:
+        return {}
+    pick = lambda q: values[min(len(values) - 1, int(q * len(values)))]
+    return {'p50': pick(0.50), 'p95': pick(0.95), 'p99': pick(0.99)}
+
+
+class _NullTimer:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+
+_NULL = _NullTimer()
+
+
+class _Timer:
+    __slots__ = ('registry', 'stage', 'start')
+
+    def __init__(self, registry, stage):
+        self.registry = registry
+        self.stage = stage
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.registry.observe(self.stage, time.perf_counter() - self.start)
+        return False
+
+
+class Metrics:
+    # Thời gian từng công đoạn (giữ MAX_SAMPLES mẫu gần nhất để tính p50/p95/p99) và bộ đếm
+    def __init__(self, max_samples: int = MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.forward = False  # True ở tiến trình con: giữ lại mẫu mới cho drain()
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.samples = {}
+            self.count = {}
+            self.total = {}
+            self.counters = {}
+            self._pending = {'samples': {}, 'counters': {}}
+
+    def observe(self, stage: str, seconds: float):
+        with self._lock:
+            self._observe(stage, seconds)
+            if self.forward:
+                self._pending['samples'].setdefault(stage, []).append(seconds)
+
+    def _observe(self, stage, seconds):
+        samples = self.samples.get(stage)
+        if samples is None:
+            samples = self.samples[stage] = deque(maxlen=self.max_samples)
+        samples.append(seconds)
+        self.count[stage] = self.count.get(stage, 0) + 1
+        self.total[stage] = self.total.get(stage, 0.0) + seconds
+
+    def incr(self, name: str, n: int = 1):
+        with self._lock:
+            self.counters[name] = self.counters.get(name, 0) + n
+            if self.forward:
+                self._pending['counters'][name] = self._pending['counters'].get(name, 0) + n
+
+    def drain(self) -> dict:
+        # Lấy các mẫu mới từ lần drain trước (tiến trình con gửi về tiến trình chính)
+        with self._lock:
+            pending = self._pending
+            self._pending = {'samples': {}, 'counters': {}}
+        return pending
+
+    def merge(self, pending: dict):
+        with self._lock:
+            for stage, values in pending.get('samples', {}).items():
+                for seconds in values:
+                    self._observe(stage, seconds)
+            for name, n in pending.get('counters', {}).items():
+                self.counters[name] = self.counters.get(name, 0) + n
+
+    def percentiles(self, stage: str) -> dict:
+        with self._lock:
+            values = list(self.samples.get(stage, ()))
+        return percentiles(values)
+
+    def _stages(self):
+        return [s for s in STAGES if s in self.count] + sorted(s for s in self.count if s not in STAGES)
+
+    def snapshot(self) -> dict:
+        stages = {}
+        for stage in self._stages():
+            stages[stage] = {'count': self.count[stage], 'total_s': self.total[stage], **self.percentiles(stage)}
+        return {'stages': stages, 'counters': dict(self.counters)}
+
+    def to_json(self) -> str:
+        return json.dumps(self.snapshot(), ensure_ascii=False, indent=2)
+
+    def to_prometheus(self) -> str:
+        lines = ['# TYPE ocr_stage_seconds summary']
+        for stage, s in self.snapshot()['stages'].items():
+            for q in ('p50', 'p95', 'p99'):
+                lines.append(f'ocr_stage_seconds{{stage="{stage}",quantile="0.{q[1:]}"}} {s[q]:.6f}')
+            lines.append(f'ocr_stage_seconds_sum{{stage="{stage}"}} {s["total_s"]:.6f}')
+            lines.append(f'ocr_stage_seconds_count{{stage="{stage}"}} {s["count"]}')
+        if self.counters:
+            lines.append('# TYPE ocr_events_total counter')
+            lines += [f'ocr_events_total{{name="{k}"}} {v}' for k, v in sorted(self.counters.items())]
+        return '\n'.join(lines) + '\n'
+
+    def summary(self, stages=None) -> str:
+        # Một dòng ngắn cho thanh trạng thái: thời gian gần nhất và p95 của từng công đoạn
+        parts = []
+        for stage in stages or self._stages():
+            samples = self.samples.get(stage)
+            if samples:
+                p95 = self.percentiles(stage)['p95']
+                parts.append(f"{stage} {samples[-1] * 1000:.0f}ms (p95 {p95 * 1000:.0f})")
+        return " | ".join(parts)
+
+
+metrics = Metrics()
+
+
+def enable(flag: bool = True):
+    global _enabled
+    _enabled = flag
+
+
+def enabled() -> bool:
+    return _enabled
+
+
+def timer(stage: str):
+    # with timer('detect'): ...
+    return _Timer(metrics, stage) if _enabled else _NULL
+
+
+def incr(name: str, n: int = 1):
+    if _enabled:
+        metrics.incr(name, n)
+
+
+def write(path: str):
+    # Xuất ra file: .prom/.txt theo định dạng Prometheus, còn lại là JSON
+    text = metrics.to_prometheus() if path.endswith(('.prom', '.txt')) else metrics.to_json()
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(text)
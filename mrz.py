@@ -0,0 +1,119 @@
+import datetime
+import re
+import unicodedata
+
+from ocr_correct import fold
+
+# Vùng đọc máy (MRZ) mặt sau CCCD gắn chip: chuẩn TD1 (ICAO 9303), 3 dòng x 30 ký tự OCR-B
+MRZ_LINES = 3
+MRZ_LEN = 30
+MRZ_CHARSET = frozenset('ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789<')
+
+# Ký tự OCR-B hay bị đọc nhầm, sửa theo loại vị trí (chỉ chứa số / chỉ chứa chữ)
+_TO_DIGIT = str.maketrans('OQDIlLZSBGT', '00011125867')
+_TO_ALPHA = str.maketrans('0125863', 'OIZSBGE')
+_FILLER_RE = re.compile(r'[«‹\[\](){}]')
+_WEIGHTS = (7, 3, 1)
+# Trường có trên cả MRZ và mặt trước, dùng để đối chiếu hai mặt
+COMPARE_FIELDS = ('CCCD', 'Họ và tên', 'Ngày sinh', 'Giới tính', 'Ngày hết hạn')
+
+# Vị trí các phần của TD1 trên CCCD: (dòng, đầu, cuối, loại) - 'd' số, 'a' chữ
+_LAYOUT = [
+    (0, 0, 5, 'a'), (0, 5, 15, 'd'), (0, 15, 27, 'd'),
+    (1, 0, 7, 'd'), (1, 7, 8, 'a'), (1, 8, 15, 'd'), (1, 15, 18, 'a'), (1, 29, 30, 'd'),
+    (2, 0, 30, 'a'),
+]
+
+
+def normalize_line(text: str) -> str:
+    # Về đúng bộ ký tự MRZ và độ dài 30: bỏ dấu/khoảng trắng, ký tự giống '<' coi là '<', thiếu thì đệm '<'
+    text = unicodedata.normalize('NFD', text.replace('«', '<<')).upper().replace('Đ', 'D')
+    text = ''.join(c for c in _FILLER_RE.sub('<', text) if c in MRZ_CHARSET)
+    return (text + '<' * MRZ_LEN)[:MRZ_LEN]
+
+
+def _fix_positions(lines: list) -> list:
+    lines = [list(line) for line in lines]
+    for li, start, end, kind in _LAYOUT:
+        table = _TO_DIGIT if kind == 'd' else _TO_ALPHA
+        for k in range(start, end):
+            if lines[li][k] != '<':
+                lines[li][k] = lines[li][k].translate(table)
+    return [''.join(line) for line in lines]
+
+
+def check_digit(data: str) -> str:
+    total = 0
+    for i, c in enumerate(data):
+        value = 0 if c == '<' else int(c) if c.isdigit() else ord(c) - 55
+        total += value * _WEIGHTS[i % 3]
+    return str(total % 10)
+
+
+def _date(yymmdd: str, past: bool):
+    # Năm 2 chữ số: ngày sinh lấy thế kỷ gần nhất trong quá khứ, ngày hết hạn luôn là 20xx
+    if not yymmdd.isdigit():
+        return None
+    yy = int(yymmdd[:2])
+    year = (1900 + yy if yy > datetime.date.today().year % 100 else 2000 + yy) if past else 2000 + yy
+    try:
+        return datetime.date(year, int(yymmdd[2:4]), int(yymmdd[4:6])).strftime('%d/%m/%Y')
+    except ValueError:
+        return None
+
+
+def parse_mrz(lines):
+    # 3 dòng MRZ (đã nhận diện) -> (thông tin theo tên trường của CCCD, {phần: đúng số kiểm tra?})
+    # Trả về None nếu không phải MRZ của thẻ căn cước (dòng 1 không bắt đầu bằng 'ID')
+    if len(lines) != MRZ_LINES:
+        return None
+    l1, l2, l3 = _fix_positions([normalize_line(line) for line in lines])
+    if not l1.startswith('ID'):
+        return None
+    doc, cccd = l1[5:14], l1[15:27]
+    checks = {
+        'doc': check_digit(doc) == l1[14],
+        'dob': check_digit(l2[0:6]) == l2[6],
+        'expiry': check_digit(l2[8:14]) == l2[14],
+        'composite': check_digit(l1[5:30] + l2[0:7] + l2[8:15] + l2[18:29]) == l2[29],
+        # Số trên MRZ là 9 số cuối của số CCCD 12 số ở phần dữ liệu tùy chọn
+        'cccd': cccd.isdigit() and cccd[-9:] == doc,
+    }
+    surname, _, given = l3.rstrip('<').partition('<<')
+    name = ' '.join(part for part in (surname + '<' + given).split('<') if part)
+    nation = l2[15:18]
+    info = {
+        'CCCD': cccd if cccd.isdigit() else None,
+        'Họ và tên': name or None,
+        'Ngày sinh': _date(l2[0:6], past=True),
+        'Giới tính': {'M': 'Nam', 'F': 'Nữ'}.get(l2[7]),
+        'Quốc tịch': 'Việt Nam' if nation == 'VNM' else nation.strip('<') or None,
+        'Ngày hết hạn': _date(l2[8:14], past=False),
+    }
+    return info, checks
+
+
+def find_mrz_lines(texts) -> list:
+    # Tìm 3 dòng MRZ liên tiếp trong các dòng OCR của mặt sau (dòng 1 bắt đầu bằng IDVNM)
+    for i, text in enumerate(texts):
+        if fold(text).upper().startswith('IDVNM') and i + MRZ_LINES <= len(texts):
+            return list(texts[i:i + MRZ_LINES])
+    return []
+
+
+def valid(checks: dict) -> bool:
+    return bool(checks) and all(checks.values())
+
+
+def _same(field: str, a: str, b: str) -> bool:
+    if field in ('Ngày sinh', 'Ngày hết hạn'):
+        return a.replace('-', '/') == b.replace('-', '/')
+    # MRZ không có dấu tiếng Việt: so sánh dạng không dấu
+    return fold(a) == fold(b)
+
+
+def cross_check(mrz_info: dict, front_info: dict) -> dict:
+    # Đối chiếu MRZ mặt sau với kết quả trích xuất mặt trước: {trường: khớp?} cho các trường cả hai đều có
+    return {field: _same(field, mrz_info[field], front_info[field])
+            for field in COMPARE_FIELDS
+            if mrz_info.get(field) and front_info.get(field)}
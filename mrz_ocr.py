@@ -0,0 +1,100 @@
+import cv2
+import numpy as np
+
+from ocr_engine import get_engine
+from ocr_pipeline import REC_BATCH_SIZE, recognize, ocr_and_extract
+from image_io import read_image
+from card_detect import rectify_card
+from doc_types import TYPE_KEY
+from mrz import MRZ_LINES, parse_mrz, valid
+from metrics import timer, incr
+
+# Dòng MRZ phủ gần hết bề ngang thẻ và nằm ở nửa dưới mặt sau
+MIN_WIDTH = 0.6
+MIN_TOP = 0.45
+
+
+def find_mrz_band(card) -> list:
+    # Tìm 3 dòng MRZ trên thẻ đã nắn: chữ tối trên nền sáng (blackhat), gradient ngang,
+    # đóng hình thái theo chiều ngang để mỗi dòng thành một khối; lấy 3 khối rộng thấp nhất.
+    # Trả về [crop dòng 1, 2, 3] hoặc [] nếu không thấy.
+    gray = cv2.cvtColor(card, cv2.COLOR_BGR2GRAY) if card.ndim == 3 else card
+    h, w = gray.shape
+    blackhat = cv2.morphologyEx(gray, cv2.MORPH_BLACKHAT, cv2.getStructuringElement(cv2.MORPH_RECT, (15, 7)))
+    grad = np.abs(cv2.Sobel(blackhat, cv2.CV_32F, 1, 0, ksize=3))
+    grad = cv2.normalize(grad, None, 0, 255, cv2.NORM_MINMAX).astype(np.uint8)
+    grad = cv2.morphologyEx(grad, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (w // 25, 3)))
+    _, mask = cv2.threshold(grad, 0, 255, cv2.THRESH_BINARY | cv2.THRESH_OTSU)
+    mask = cv2.erode(mask, None, iterations=1)
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    rows = [cv2.boundingRect(c) for c in contours]
+    rows = sorted((r for r in rows if r[2] >= MIN_WIDTH * w and r[1] >= MIN_TOP * h and r[3] < h / 6),
+                  key=lambda r: r[1])
+    if len(rows) < MRZ_LINES:
+        return []
+    crops = []
+    for x, y, bw, bh in rows[-MRZ_LINES:]:
+        pad = max(2, bh // 4)
+        crops.append(card[max(0, y - pad):y + bh + pad, max(0, x - pad):x + bw + pad])
+    return crops
+
+
+def mrz_extract(images, engine=None, batch_size: int = REC_BATCH_SIZE):
+    # Chỉ nhận diện 3 dòng MRZ của mỗi thẻ (không chạy SAST), kiểm tra số kiểm tra.
+    # Trả về [(thông tin hoặc None, {phần: đúng?})]; None nghĩa là cần chạy đường đầy đủ.
+    engine = engine or get_engine()
+    all_crops, owners = [], []
+    for i, image in enumerate(images):
+        if not hasattr(image, 'shape'):
+            with timer('decode'):
+                image = read_image(image)
+        with timer('rectify'):
+            card, M = rectify_card(image)
+        if M is None:
+            continue
+        with timer('detect'):
+            crops = find_mrz_band(card)
+        all_crops.extend(crops)
+        owners.extend([i] * len(crops))
+
+    with timer('rec'):
+        rec_res = recognize(engine, all_crops, batch_size) if all_crops else []
+    per_card = {}
+    for i, (txt, _) in zip(owners, rec_res):
+        per_card.setdefault(i, []).append(txt)
+
+    out = []
+    for i in range(len(images)):
+        parsed = parse_mrz(per_card.get(i, []))
+        if parsed is None:
+            out.append((None, {}))
+            continue
+        info, checks = parsed
+        out.append((info if valid(checks) else None, checks))
+    return out
+
+
+def extract_with_mrz(images, extract_info, engine=None, batch_size: int = REC_BATCH_SIZE, cache=None,
+                     fallback=None):
+    # Đường nhanh cho mặt sau CCCD gắn chip: đọc MRZ, đủ số kiểm tra thì dùng luôn;
+    # thẻ khác (mặt trước, CMND...) hoặc MRZ sai mới chạy fallback (mặc định ocr_and_extract).
+    # Trả về [(văn bản OCR hoặc None, thông tin, 'mrz' | chế độ của fallback)]
+    engine = engine or get_engine()
+    mrz_res = mrz_extract(images, engine, batch_size)
+    rest = [i for i, (info, _) in enumerate(mrz_res) if info is None]
+    incr('mrz_ok', len(images) - len(rest))
+    incr('mrz_fallback', len(rest))
+    out = [(None, {TYPE_KEY: 'cccd_back', **info, 'MRZ': 'hợp lệ'} if info else None, 'mrz')
+           for info, _ in mrz_res]
+    if not rest:
+        return out
+    subset = [images[i] for i in rest]
+    if fallback is not None:
+        full = fallback(subset)
+    else:
+        full = [(text, info, 'full') for _, text, info in
+                ocr_and_extract(subset, extract_info, engine, batch_size=batch_size, cache=cache)]
+    for i, item in zip(rest, full):
+        out[i] = item
+    return out
@@ -0,0 +1,127 @@
+import hashlib
+import json
+import sqlite3
+import threading
+import time
+
+import numpy as np
+
+from ocr_engine import engine_key
+
+DEFAULT_CACHE_PATH = "ocr_cache.sqlite"
+DEFAULT_MAX_BYTES = 256 * 1024 * 1024
+# Số lần đọc trúng được gom lại trước khi ghi last_used xuống file (đọc không phải commit mỗi lần)
+TOUCH_BATCH = 256
+
+
+def model_id(key: tuple = None) -> str:
+    # Định danh mô hình từ engine_key: thư mục det/rec, bộ ký tự, rec_image_shape
+    return hashlib.sha256(repr(key or engine_key()).encode('utf-8')).hexdigest()[:16]
+
+
+def image_hash(data) -> str:
+    # data: bytes của file ảnh hoặc mảng numpy đã giải mã
+    h = hashlib.sha256()
+    if isinstance(data, np.ndarray):
+        h.update(f"{data.shape}{data.dtype}".encode('ascii'))
+        data = np.ascontiguousarray(data).data
+    h.update(data)
+    return h.hexdigest()
+
+
+def cache_key(data, model: str = None) -> str:
+    return f"{model or model_id()}:{image_hash(data)}"
+
+
+class OcrCache:
+    # Bộ nhớ đệm kết quả OCR + extract_info trên SQLite, xóa theo LRU khi vượt dung lượng
+    def __init__(self, path: str = DEFAULT_CACHE_PATH, max_bytes: int = DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+        self._touched = {}
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS ocr_cache (
+            key TEXT PRIMARY KEY,
+            result TEXT NOT NULL,
+            info TEXT,
+            info_version TEXT,
+            size INTEGER NOT NULL,
+            last_used REAL NOT NULL)""")
+        if 'info_version' not in [c[1] for c in self._conn.execute("PRAGMA table_info(ocr_cache)")]:
+            # File cache cũ: thông tin đã lưu không có phiên bản nên sẽ không được dùng lại
+            self._conn.execute("ALTER TABLE ocr_cache ADD COLUMN info_version TEXT")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_ocr_cache_last_used ON ocr_cache(last_used)")
+        self._conn.commit()
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+
+    def get(self, key: str, info_version: str = ''):
+        # Trả về (kết quả OCR, thông tin trích xuất hoặc None); None nếu chưa có.
+        # Thông tin chỉ được trả khi lưu cùng info_version (cùng bộ trích xuất, cùng phiên bản)
+        with self._lock:
+            row = self._conn.execute("SELECT result, info, info_version FROM ocr_cache WHERE key = ?",
+                                     (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # Cập nhật LRU được gom lại, ghi cùng put/set_info/close hoặc khi đủ TOUCH_BATCH
+            self._touched[key] = time.time()
+            if len(self._touched) >= TOUCH_BATCH:
+                self._flush_touched()
+                self._conn.commit()
+        return json.loads(row[0]), json.loads(row[1]) if row[1] and row[2] == info_version else None
+
+    def put(self, key: str, result, info: dict = None, info_version: str = ''):
+        result_json = json.dumps(result, ensure_ascii=False)
+        info_json = json.dumps(info, ensure_ascii=False) if info is not None else None
+        size = len(key) + len(result_json) + len(info_json or '')
+        with self._lock:
+            self._flush_touched()
+            old = self._conn.execute("SELECT size FROM ocr_cache WHERE key = ?", (key,)).fetchone()
+            self._conn.execute("INSERT OR REPLACE INTO ocr_cache (key, result, info, info_version, size, last_used) "
+                               "VALUES (?, ?, ?, ?, ?, ?)",
+                               (key, result_json, info_json, info_version, size, time.time()))
+            self._total += size - (old[0] if old else 0)
+            if self._total > self.max_bytes:
+                self._evict()
+            self._conn.commit()
+
+    def set_info(self, key: str, info: dict, info_version: str = ''):
+        with self._lock:
+            self._flush_touched()
+            self._conn.execute("UPDATE ocr_cache SET info = ?, info_version = ? WHERE key = ?",
+                               (json.dumps(info, ensure_ascii=False), info_version, key))
+            self._conn.commit()
+
+    def _flush_touched(self):
+        # Ghi các last_used đang chờ vào giao dịch hiện tại (người gọi giữ khóa và commit)
+        if self._touched:
+            self._conn.executemany("UPDATE ocr_cache SET last_used = ? WHERE key = ?",
+                                   [(t, key) for key, t in self._touched.items()])
+            self._touched.clear()
+
+    def _evict(self):
+        # Tính lại tổng vì nhiều tiến trình có thể cùng ghi vào một file
+        self._total = self._conn.execute("SELECT COALESCE(SUM(size), 0) FROM ocr_cache").fetchone()[0]
+        target = self.max_bytes * 0.9
+        rows = self._conn.execute("SELECT key, size FROM ocr_cache ORDER BY last_used").fetchall()
+        for key, size in rows:
+            if self._total <= target:
+                break
+            self._conn.execute("DELETE FROM ocr_cache WHERE key = ?", (key,))
+            self._total -= size
+
+    def stats(self) -> dict:
+        total = self.hits + self.misses
+        return {'hits': self.hits, 'misses': self.misses,
+                'hit_rate': self.hits / total if total else 0.0, 'bytes': self._total}
+
+    def close(self):
+        with self._lock:
+            self._flush_touched()
+            self._conn.commit()
+            self._conn.close()
@@ -0,0 +1,376 @@
+import functools
+import itertools
+import os
+import re
+import unicodedata
+
+# Nhãn in sẵn trên thẻ (dạng chuẩn). Các cụm song ngữ dùng khi OCR dính liền hai nhãn (vd. "Ho va tenFull name").
+LABELS = [
+    'Họ và tên', 'Full name', 'Họ và tên Full name',
+    'Ngày sinh', 'Date of birth', 'Ngày sinh Date of birth',
+    'Giới tính', 'Sex',
+    'Quốc tịch', 'Nationality', 'Quốc tịch Nationality',
+    'Quê quán', 'Place of origin', 'Quê quán Place of origin',
+    'Nơi thường trú', 'Place of residence', 'Nơi thường trú Place of residence',
+    'Có giá trị đến', 'Date of expiry',
+    'Căn cước công dân', 'Citizen Identity Card',
+    'Cộng hòa xã hội chủ nghĩa Việt Nam', 'Socialist Republic of Viet Nam',
+    'Độc lập - Tự do - Hạnh phúc', 'Independence - Freedom - Happiness', 'Freedom',
+]
+
+# Các cách OCR đọc sai gặp thường xuyên trên ảnh thật: quá xa nhãn gốc để khớp mờ, hoặc giữ lại từ danh sách
+# sửa lỗi cũ để không phụ thuộc vào ngưỡng khớp mờ
+ALIASES = {
+    'Place of ferginn': 'Place of origin',
+    'Place f onigin': 'Place of origin',
+    'Place of orign': 'Place of origin',
+    'Place of forgin': 'Place of origin',
+    'Place of forgins': 'Place of origin',
+    'Place of tri residence': 'Place of residence',
+    'Date of binth': 'Date of birth',
+    'Date of bint': 'Date of birth',
+    'Date afexpiry': 'Date of expiry',
+    'Natiohality': 'Nationality',
+    'Quốc tịch Natiohality': 'Quốc tịch Nationality',
+    'Freadom': 'Freedom',
+}
+
+# Nhãn địa chỉ: mẫu giá trị Quê quán/Nơi thường trú không cho phép ':' nên bỏ luôn dấu ':' sau nhãn
+COLON_LABELS = {'Place of origin', 'Place of residence',
+                'Quê quán Place of origin', 'Nơi thường trú Place of residence'}
+
+# Cây địa danh mặc định tỉnh > huyện > xã (mỗi dòng một tên, thụt dòng theo cấp), nằm cạnh module
+GAZETTEER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'vn_gazetteer.txt')
+
+_TOKEN_RE = re.compile(r'\w+')
+_NOISE_RE = re.compile(r'[!,;|]*')
+_COLON_RE = re.compile(r'[!,;:|]*')
+_ADMIN_PREFIX_RE = re.compile(r'^((?:Thành phố|Thị trấn|Thị xã|Tỉnh|TP\.?|Quận|Huyện|Phường|Xã)\s+)?(.*)$',
+                              re.IGNORECASE)
+_PROVINCE_PREFIX_RE = re.compile(r'^(?:Thành phố|Tỉnh|TP\.?)\s+$', re.IGNORECASE)
+
+
+@functools.lru_cache(maxsize=65536)
+def fold(text: str) -> str:
+    # Khóa so khớp: chữ thường, bỏ dấu (đ -> d), chỉ giữ chữ và số
+    text = unicodedata.normalize('NFD', text.lower()).replace('đ', 'd')
+    return ''.join(c for c in text if c.isalnum())
+
+
+def _marked(text: str) -> str:
+    # Như fold nhưng giữ dấu: chữ thường, chỉ giữ chữ và số
+    return ''.join(c for c in unicodedata.normalize('NFC', text.lower()) if c.isalnum())
+
+
+def has_diacritics(text: str) -> bool:
+    # Đã có dấu tiếng Việt (kể cả đ): khóa fold khác với chuỗi chữ thường giữ nguyên
+    return fold(text) != _marked(text)
+
+
+def max_distance(n: int) -> int:
+    # Số lỗi cho phép theo độ dài khóa: từ ngắn phải khớp đúng
+    return 0 if n <= 3 else 1 if n <= 8 else 2
+
+
+def edit_distance(a: str, b: str, limit: int = None) -> int:
+    # Levenshtein; có limit thì chỉ tính dải chéo rộng limit và trả về limit + 1 khi vượt ngưỡng
+    if limit is None:
+        prev = list(range(len(b) + 1))
+        for i, ca in enumerate(a, 1):
+            cur = [i]
+            for j, cb in enumerate(b, 1):
+                cur.append(min(prev[j] + 1, cur[j - 1] + 1, prev[j - 1] + (ca != cb)))
+            prev = cur
+        return prev[-1]
+
+    n, m = len(a), len(b)
+    if abs(n - m) > limit:
+        return limit + 1
+    big = limit + 1
+    prev = [j if j <= limit else big for j in range(m + 1)]
+    for i in range(1, n + 1):
+        lo, hi = max(1, i - limit), min(m, i + limit)
+        cur = [big] * (m + 1)
+        cur[0] = i if i <= limit else big
+        ca = a[i - 1]
+        best = cur[0]
+        for j in range(lo, hi + 1):
+            v = prev[j - 1] + (ca != b[j - 1])
+            if prev[j] + 1 < v:
+                v = prev[j] + 1
+            if cur[j - 1] + 1 < v:
+                v = cur[j - 1] + 1
+            cur[j] = v if v < big else big
+            if v < best:
+                best = v
+        if best > limit:
+            return big
+        prev = cur
+    return prev[m]
+
+
+@functools.lru_cache(maxsize=65536)
+def _bounded_distance(a: str, b: str, limit: int) -> int:
+    return edit_distance(a, b, limit)
+
+
+def _deletes(word: str, depth: int) -> set:
+    out = {word}
+    frontier = {word}
+    for _ in range(depth):
+        frontier = {w[:i] + w[i + 1:] for w in frontier for i in range(len(w))}
+        out |= frontier
+    return out
+
+
+class SymSpellIndex:
+    # Chỉ mục xóa ký tự kiểu SymSpell: tra một khóa chỉ cần sinh các biến thể xóa tối đa d ký tự
+    # của chính nó (chi phí theo độ dài khóa, không theo kích thước từ điển).
+    def __init__(self, terms: dict, distance=max_distance):
+        self.terms = terms
+        self.distance = distance
+        self._index = {}
+        for key in terms:
+            for variant in _deletes(key, distance(len(key))):
+                self._index.setdefault(variant, []).append(key)
+
+    def lookup(self, key: str):
+        # Trả về (khóa gần nhất, khoảng cách) hoặc None
+        if key in self.terms:
+            return key, 0
+        hits = self.matches(key)
+        return hits[0] if hits else None
+
+    def matches(self, key: str) -> list:
+        # Mọi khóa trong ngưỡng: [(khóa, khoảng cách)] theo khoảng cách tăng dần
+        found = {key: 0} if key in self.terms else {}
+        d = self.distance(len(key))
+        if d == 0:
+            return list(found.items())
+        for variant in _deletes(key, d):
+            for term in self._index.get(variant, ()):
+                if term in found:
+                    continue
+                limit = min(d, self.distance(len(term)))
+                dist = edit_distance(key, term, limit)
+                if dist <= limit:
+                    found[term] = dist
+        return sorted(found.items(), key=lambda hit: hit[1])
+
+
+class LabelCorrector:
+    # Sửa nhãn bị OCR sai trong một lượt quét token: token đầu được tra mờ trong chỉ mục từ đầu nhãn
+    # (hoặc dính liền với từ đầu nhãn), chỉ khi khớp mới so phần còn lại của nhãn với vài token kế tiếp.
+    # Kết quả tra theo token được lưu đệm nên chi phí mỗi token gần như cố định.
+    def __init__(self, labels=LABELS, aliases=None):
+        self.by_first = {}
+        for variant, label in [(l, l) for l in labels] + list((ALIASES if aliases is None else aliases).items()):
+            words = [fold(w) for w in variant.split() if fold(w)]
+            rest_key = ''.join(words)[len(words[0]):]
+            limit = max_distance(len(rest_key)) if len(rest_key) <= 8 else len(rest_key) // 4
+            self.by_first.setdefault(words[0], []).append((rest_key, label, len(words), limit))
+        for entries in self.by_first.values():
+            # Nhãn dài trước: khi đã khớp một nhãn thì các nhãn ngắn hơn không cần so nữa
+            entries.sort(key=lambda e: len(e[0]), reverse=True)
+        self.max_hi = {first: max(len(e[0]) + e[3] for e in entries) for first, entries in self.by_first.items()}
+        self.width = max(e[2] for entries in self.by_first.values() for e in entries) + 1
+        self.firsts = sorted(self.by_first, key=len, reverse=True)
+        self.index = SymSpellIndex({k: k for k in self.by_first})
+        self._candidates = functools.lru_cache(maxsize=65536)(self._lookup)
+        self._window = functools.lru_cache(maxsize=65536)(self._match_window)
+
+    def _lookup(self, key: str) -> tuple:
+        # [(từ đầu nhãn, khoảng cách, phần dư của token sau từ đầu)]
+        if not key or not key[0].isalpha():
+            return ()
+        found = []
+        hit = self.index.lookup(key)
+        if hit is not None:
+            found.append((hit[0], hit[1], ''))
+        for first in self.firsts:
+            if len(key) > len(first) >= 2 and key.startswith(first):
+                glued = key[len(first):]
+                # Lọc rẻ trước khi so cửa sổ: phần dính phải mở đầu như phần còn lại của nhãn ('Hovà' -> 'va'),
+                # hoặc là giá trị dính sau nhãn một từ ('SexNam'); tên riêng như 'Hoàng' bị loại ở đây
+                if any(not rest_key or rest_key[0] == glued[0] for rest_key, *_ in self.by_first[first]):
+                    found.append((first, 0, glued))
+        return tuple(found)
+
+    def correct(self, text: str) -> str:
+        # Tách token, fold và tra bảng token đầu nhãn đều chạy trong map (C); vòng lặp Python chỉ đi qua
+        # các token có thể mở đầu nhãn, token giá trị (tên, số, địa danh) bị bỏ qua ngay
+        tokens = list(_TOKEN_RE.finditer(text))
+        keys = list(map(fold, _TOKEN_RE.findall(text)))
+        out, last, skip = [], 0, 0
+        for i in itertools.compress(range(len(keys)), map(self._candidates, keys)):
+            if i < skip:
+                continue
+            hit = self._match(text, tokens, keys, i)
+            if hit is not None and hit[0][1] and i + 1 < len(keys):
+                # Cửa sổ bắt đầu sớm một token (vd. "Hà Nội Nơi thường trú") khớp kém hơn nhãn bắt đầu ở token sau
+                after = self._match(text, tokens, keys, i + 1)
+                if after is not None and after[0][1] < hit[0][1]:
+                    hit = None
+            if hit is None:
+                continue
+            _, width, label = hit
+            start, end = tokens[i].start(), tokens[i + width - 1].end()
+            # Dấu câu nhiễu dính sau nhãn (vd. "Date of birth!") không thuộc giá trị
+            end = (_COLON_RE if label in COLON_LABELS else _NOISE_RE).match(text, end).end()
+            out.append(text[last:start])
+            out.append(label)
+            if end < len(text) and not text[end].isspace():
+                out.append(' ')
+            last = end
+            skip = i + width
+        out.append(text[last:])
+        return ''.join(out)
+
+    def _match(self, text, tokens, keys, i):
+        # Kết quả chỉ phụ thuộc vào các token đã fold của cửa sổ nên được lưu đệm: nhãn lặp lại trên mọi thẻ
+        start, end = tokens[i].span()
+        hit = self._window(tuple(keys[i:i + self.width]), len(keys[i]) == end - start)
+        if hit is None:
+            return None
+        score, width, label, glued = hit
+        return score, width, label + ' ' + text[end - glued:end] if glued else label
+
+    def _match_window(self, window, whole):
+        # (điểm, số token, nhãn, số ký tự giá trị dính sau nhãn một từ); whole: token không mất ký tự khi fold
+        key = window[0]
+        best = None
+        for first, dist, glued in self._candidates(key):
+            # Phần ghép của cửa sổ 1, 2, ... token, dùng chung cho mọi nhãn cùng từ đầu; dừng khi đã dài quá
+            # nhãn dài nhất + limit
+            rests, hi = [glued], self.max_hi[first]
+            for k in window[1:]:
+                if len(rests[-1]) > hi:
+                    break
+                rests.append(rests[-1] + k)
+            for rest_key, label, n, limit in self.by_first[first]:
+                if best is not None and -len(first) - len(rest_key) > best[0][0]:
+                    break
+                if not rest_key:
+                    if glued and len(glued) > 1 and whole:
+                        # Nhãn một từ dính liền giá trị (vd. "SexNam")
+                        cand = ((-len(first), dist), 1, label, len(glued))
+                    elif glued:
+                        continue
+                    else:
+                        cand = ((-len(first), dist), 1, label, 0)
+                    best = min(best, cand) if best else cand
+                    continue
+                # Cửa sổ 1..n+1 token: từ dính liền ('Hovà', 'Fullname') làm số token ít hơn số từ của nhãn.
+                # Phần ghép không được dài quá nhãn + limit, và cửa sổ ngắn nhất được ưu tiên khi cùng khoảng
+                # cách, để không nuốt token giá trị đứng sau nhãn.
+                lo, hi = len(rest_key) - limit, len(rest_key) + limit
+                for width, rest in enumerate(rests[:n + 1], 1):
+                    if len(rest) > hi:
+                        break
+                    if len(rest) >= lo:
+                        d = 0 if rest == rest_key else _bounded_distance(rest, rest_key, limit)
+                        if d <= limit:
+                            cand = ((-len(first) - len(rest_key), dist + d), width, label, 0)
+                            if best is None or cand < best:
+                                best = cand
+        return best
+
+
+class Gazetteer:
+    # Sửa địa danh trong Quê quán / Nơi thường trú theo cây đơn vị hành chính tỉnh > huyện > xã: đi từ phần
+    # cuối địa chỉ (cấp tỉnh) vào trong, mỗi phần chỉ so với các đơn vị con của đơn vị vừa khớp.
+    # Chỉ sửa khi tên gần nhất là duy nhất (không tên nào khác cùng khoảng cách). Tên đã có dấu thì bản giữ dấu
+    # cũng phải trong ngưỡng (vd. 'Hồ Chí Mính' được sửa, 'Gia Lâm' không thành 'Gia Lai'); tên trùng đúng với
+    # một huyện/xã không bị sửa thành tỉnh.
+    def __init__(self, names):
+        # names: danh sách tên cùng cấp, hoặc {tên: {tên đơn vị con: {...}}}
+        tree = names if isinstance(names, dict) else dict.fromkeys(names, {})
+        self.names = {}
+        for name in tree:
+            if fold(name):
+                self.names.setdefault(fold(name), []).append(name)
+        self.children = {name: Gazetteer(sub) for name, sub in tree.items() if sub}
+        self.lower = set()
+        for child in self.children.values():
+            self.lower |= set(child.names) | child.lower
+        self.index = SymSpellIndex(self.names, lambda n: 0 if n <= 4 else 1 if n <= 9 else 2)
+        self.find = functools.lru_cache(maxsize=4096)(self._find)
+
+    @classmethod
+    def load(cls, path: str):
+        # Mỗi cấp thụt thêm 2 dấu cách dưới đơn vị cấp trên; file chỉ có tên tỉnh vẫn dùng được
+        tree, stack = {}, []
+        with open(path, encoding='utf-8') as f:
+            for line in f:
+                name = line.strip()
+                if not name or name.startswith('#'):
+                    continue
+                del stack[(len(line) - len(line.lstrip(' '))) // 2:]
+                stack.append((stack[-1] if stack else tree).setdefault(name, {}))
+        return cls(tree)
+
+    def _find(self, name: str):
+        # (tên chuẩn, khoảng cách) nếu tên gần nhất là duy nhất và đủ gần, ngược lại None
+        hits = self.index.matches(fold(name))
+        if not hits or len(self.names[hits[0][0]]) > 1 or len(hits) > 1 and hits[1][1] == hits[0][1]:
+            return None
+        key, d = hits[0]
+        unit = self.names[key][0]
+        limit = self.index.distance(len(key))
+        if d and has_diacritics(name) and edit_distance(_marked(name), _marked(unit), limit) > limit:
+            return None
+        return unit, d
+
+    def correct_address(self, value: str) -> str:
+        if not value:
+            return value
+        parts = value.split(',')
+        level = self
+        for k in range(len(parts) - 1, -1, -1):
+            prefix, name = _ADMIN_PREFIX_RE.match(parts[k].strip()).groups()
+            if level is None or not name:
+                break
+            if level is self and prefix and not _PROVINCE_PREFIX_RE.match(prefix):
+                # Phần cuối có tiền tố huyện/xã: địa chỉ thiếu cấp tỉnh
+                break
+            hit = level.find(name)
+            if hit is None:
+                break
+            unit, d = hit
+            if d and level is self and (fold(name) in self.lower or len(parts) == 1 and not prefix):
+                # Tên huyện/xã viết đúng, hoặc một phần duy nhất không có tiền tố hành chính: không đổi thành tỉnh
+                break
+            if unit != name:
+                part = parts[k]
+                parts[k] = part[:len(part) - len(part.lstrip())] + (prefix or '') + unit
+            level = level.children.get(unit)
+        return ','.join(parts)
+
+
+_corrector = None
+_gazetteer = False
+
+
+def correct_labels(text: str) -> str:
+    global _corrector
+    if _corrector is None:
+        _corrector = LabelCorrector()
+    return _corrector.correct(text)
+
+
+def gazetteer():
+    # Nạp GAZETTEER_PATH lần đầu dùng; không có file thì bỏ qua bước sửa địa danh
+    global _gazetteer
+    if _gazetteer is False:
+        _gazetteer = Gazetteer.load(GAZETTEER_PATH) if os.path.exists(GAZETTEER_PATH) else None
+    return _gazetteer
+
+
+def set_gazetteer(path: str = None, names=None):
+    global _gazetteer
+    _gazetteer = Gazetteer(names) if names is not None else Gazetteer.load(path) if path else None
+
+
+def correct_address(value: str) -> str:
+    g = gazetteer()
+    return g.correct_address(value) if g is not None else value
@@ -0,0 +1,80 @@
+import os
+import threading
+
+# Cấu hình mặc định của mô hình phát hiện SAST và nhận diện SRN
+# (bản cũ: rec_model_dir="inference/SRN_Lastest", rec_char_dict_path="Train/vietnamese/vn_dictionary.txt")
+DEFAULT_CONFIG = dict(
+    det_model_dir="inference/SAST",
+    rec_model_dir="inference/SRN_Final",
+    rec_image_shape="1, 64, 256",
+    rec_char_dict_path="Test/vi_vietnam.txt",
+)
+
+# Các tham số khác truyền thẳng vào PaddleOCR, không ảnh hưởng tới kết quả nhận diện
+_COMMON_KWARGS = dict(
+    use_angle_cls=True,
+    lang='vi',
+    use_gpu=False,
+    det_algorithm="SAST",
+)
+
+# Backend suy luận: 'paddle' (mặc định) hoặc 'onnx' (ONNX Runtime, xem onnx_backend.py).
+# Chọn qua tham số get_engine(backend=..., threads=..., int8=...) hoặc biến môi trường
+# OCR_BACKEND=onnx, OCR_THREADS=4, OCR_INT8=1 để mọi tiến trình con dùng chung cấu hình.
+_BACKEND_KEYS = ('backend', 'threads', 'int8')
+
+_engines = {}
+_lock = threading.Lock()
+
+
+def engine_key(**overrides) -> tuple:
+    # Khóa định danh mô hình: thư mục det/rec, rec_image_shape và bộ ký tự
+    config = {**DEFAULT_CONFIG, **_backend_from_env(), **overrides}
+    if config.get('backend', 'paddle') == 'paddle':
+        # Paddle giữ nguyên khóa cũ để không làm mất bộ nhớ đệm; số luồng đi vào cpu_threads
+        threads = config.get('threads')
+        config = {k: v for k, v in config.items() if k not in _BACKEND_KEYS}
+        if threads:
+            config['cpu_threads'] = int(threads)
+    return tuple(sorted(config.items()))
+
+
+def _backend_from_env() -> dict:
+    backend = os.environ.get('OCR_BACKEND', '')
+    if not backend:
+        return {}
+    return {'backend': backend, 'threads': int(os.environ.get('OCR_THREADS', 0)),
+            'int8': os.environ.get('OCR_INT8', '') not in ('', '0')}
+
+
+def get_engine(**overrides):
+    # Dựng PaddleOCR lần đầu được gọi, dùng chung trong cả tiến trình
+    key = engine_key(**overrides)
+    engine = _engines.get(key)
+    if engine is not None:
+        return engine
+    with _lock:
+        engine = _engines.get(key)
+        if engine is None:
+            config = dict(key)
+            if config.get('backend') == 'onnx':
+                from onnx_backend import build_engine
+                engine = build_engine(_COMMON_KWARGS, config)
+            else:
+                from paddleocr import PaddleOCR
+                engine = PaddleOCR(**_COMMON_KWARGS, **config)
+            engine.model_key = key
+            _engines[key] = engine
+    return engine
+
+
+def warm_up(**overrides):
+    # Nạp mô hình và chạy thử một ảnh trắng để lần nhận diện đầu không bị chậm
+    import numpy as np
+    engine = get_engine(**overrides)
+    engine.ocr(np.full((64, 256, 3), 255, dtype=np.uint8), cls=True)
+    return engine
+
+
+def is_loaded(**overrides) -> bool:
+    return engine_key(**overrides) in _engines
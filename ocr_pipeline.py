@@ -0,0 +1,328 @@
+import time
+
+import cv2
+import numpy as np
+
+from ocr_engine import get_engine
+from image_io import read_image, read_bytes, decode_image
+from ocr_cache import model_id, cache_key
+from card_detect import rectify_card, unwarp_boxes
+from layout import assemble_lines, lines_text
+from doc_types import PARSER_VERSION, extract_scored, weak_fields
+from metrics import timer, incr
+import det_resize
+
+# Số crop mỗi lô nhận diện SRN (ảnh crop luôn được resize về rec_image_shape cố định)
+REC_BATCH_SIZE = 32
+# Số crop rộng nhất mỗi thẻ dùng để thăm dò thẻ có bị lật ngược hay không
+CLS_PROBE = 3
+# Trường có hộp chữ dưới ngưỡng này (hoặc sai định dạng) được nhận diện lại
+REFINE_MIN_SCORE = 0.85
+
+
+def _load(image):
+    if isinstance(image, np.ndarray):
+        return image
+    with timer('decode'):
+        return read_image(image)
+
+
+def _cache_keys(engine, images, variant: str = ''):
+    # Băm nội dung ảnh (bytes của file hoặc mảng đã giải mã) kèm định danh mô hình
+    model = model_id(getattr(engine, 'model_key', None)) + variant
+    keys, loaded = [], []
+    for image in images:
+        if isinstance(image, np.ndarray):
+            keys.append(cache_key(image, model))
+            loaded.append(image)
+        else:
+            data = read_bytes(image)
+            keys.append(cache_key(data, model))
+            loaded.append((data, image))
+    return keys, loaded
+
+
+def info_version(extract_info) -> str:
+    # Thông tin trích xuất trong cache chỉ dùng lại khi cùng hàm trích xuất và cùng PARSER_VERSION
+    name = getattr(extract_info, '__qualname__', type(extract_info).__name__)
+    return f"{getattr(extract_info, '__module__', '')}.{name}@{PARSER_VERSION}"
+
+
+def detect_crops(engine, img):
+    # Phát hiện hộp chữ bằng SAST rồi cắt, nắn thẳng từng hộp theo thứ tự đọc
+    from paddleocr.tools.infer.predict_system import sorted_boxes
+    from paddleocr.tools.infer.utility import get_rotate_crop_image
+
+    dt_boxes, _ = engine.text_detector(img)
+    if dt_boxes is None or len(dt_boxes) == 0:
+        return [], []
+    boxes = sorted_boxes(dt_boxes)
+    crops = [get_rotate_crop_image(img, np.array(box, dtype=np.float32)) for box in boxes]
+    return boxes, crops
+
+
+def detect_adaptive(engine, img, rectified: bool = False, size: int = None):
+    # Phát hiện ở kích thước chọn theo chiều cao chữ (det_resize); quá ít hộp hoặc hộp quá nhỏ thì
+    # thử lại một nấc lớn hơn và giữ lần ra nhiều hộp hơn. Trả về (hộp, crop, thống kê)
+    text_h = None
+    if size is None:
+        size, text_h = det_resize.choose_det_size(img, rectified)
+    stat = {'shape': list(img.shape[:2]), 'rectified': rectified, 'text_h': text_h, 'size': size, 'retry': None}
+    start = time.perf_counter()
+    with det_resize.det_size(engine.text_detector, size):
+        boxes, crops = detect_crops(engine, img)
+    reason = det_resize.looks_wrong(boxes, size, img)
+    bigger = det_resize.next_size(size)
+    if reason and bigger:
+        with det_resize.det_size(engine.text_detector, bigger):
+            more_boxes, more_crops = detect_crops(engine, img)
+        if len(more_boxes) >= len(boxes):
+            boxes, crops, stat['size'] = more_boxes, more_crops, bigger
+        stat['retry'] = reason
+    stat['boxes'] = len(boxes)
+    stat['detect_ms'] = (time.perf_counter() - start) * 1000
+    return boxes, crops, stat
+
+
+def _needs_cls(crop) -> bool:
+    # Hộp gần vuông hoặc đứng: không suy ra được hướng chữ từ hình dạng
+    h, w = crop.shape[:2]
+    return h >= w
+
+
+def classify_selected(engine, cards):
+    # Chỉ chạy bộ phân loại góc trên các crop cần thiết:
+    # - vài crop rộng nhất của mỗi thẻ để phát hiện thẻ bị lật 180°
+    # - các crop gần vuông/đứng
+    # Nếu crop thăm dò của thẻ nào bị lật thì phân loại nốt toàn bộ crop của thẻ đó.
+    classifier = engine.text_classifier
+    selected = []
+    for ci, (_, crops) in enumerate(cards):
+        widest = sorted(range(len(crops)), key=lambda i: -crops[i].shape[1])[:CLS_PROBE]
+        probe = set(widest) | {i for i, c in enumerate(crops) if _needs_cls(c)}
+        selected.extend((ci, i) for i in sorted(probe))
+    if not selected:
+        return
+
+    flipped = set()
+    rotated, cls_res, _ = classifier([cards[ci][1][i] for ci, i in selected])
+    for (ci, i), crop, (label, _) in zip(selected, rotated, cls_res):
+        cards[ci][1][i] = crop
+        if '180' in label:
+            flipped.add(ci)
+
+    done = set(selected)
+    rest = [(ci, i) for ci in sorted(flipped) for i in range(len(cards[ci][1])) if (ci, i) not in done]
+    if rest:
+        rotated, _, _ = classifier([cards[ci][1][i] for ci, i in rest])
+        for (ci, i), crop in zip(rest, rotated):
+            cards[ci][1][i] = crop
+
+
+def recognize(engine, crops, batch_size: int = REC_BATCH_SIZE):
+    # Nhận diện crop của nhiều thẻ theo từng lô cố định kích thước
+    recognizer = engine.text_recognizer
+    recognizer.rec_batch_num = batch_size
+    results = []
+    for start in range(0, len(crops), batch_size):
+        rec_res, _ = recognizer(crops[start:start + batch_size])
+        results.extend(rec_res)
+    return results
+
+
+def tta_variants(crop) -> list:
+    # Các biến thể rẻ của một crop: gốc, thêm viền, tăng tương phản (CLAHE), làm nét
+    pad = cv2.copyMakeBorder(crop, 4, 4, 8, 8, cv2.BORDER_REPLICATE)
+    gray = cv2.cvtColor(crop, cv2.COLOR_BGR2GRAY) if crop.ndim == 3 else crop
+    clahe = cv2.cvtColor(cv2.createCLAHE(2.0, (4, 4)).apply(gray), cv2.COLOR_GRAY2BGR)
+    sharp = cv2.addWeighted(crop, 1.5, cv2.GaussianBlur(crop, (0, 0), 2), -0.5, 0)
+    return [crop, pad, clahe, sharp]
+
+
+def rerecognize(engine, crops, batch_size: int = REC_BATCH_SIZE, strong_engine=None):
+    # Đường mạnh cho vài crop: luôn chạy bộ phân loại góc, nhận diện mọi biến thể TTA trong
+    # chung các lô (và thêm mô hình mạnh hơn nếu có), giữ kết quả có độ tin cậy cao nhất.
+    if getattr(engine, 'text_classifier', None) is not None:
+        crops, _, _ = engine.text_classifier(list(crops))
+    variants = [tta_variants(crop) for crop in crops]
+    res = recognize(engine, [v for vs in variants for v in vs], batch_size)
+    best, pos = [], 0
+    for vs in variants:
+        best.append(max(res[pos:pos + len(vs)], key=lambda r: r[1]))
+        pos += len(vs)
+    if strong_engine is not None:
+        best = [max(a, b, key=lambda r: r[1]) for a, b in zip(best, recognize(strong_engine, crops, batch_size))]
+    return best
+
+
+def refine_result(image, result, engine=None, min_score: float = REFINE_MIN_SCORE,
+                  batch_size: int = REC_BATCH_SIZE, strong_engine=None):
+    # Chỉ nhận diện lại các hộp của trường thiếu, sai định dạng hoặc độ tin cậy thấp, không chạy lại cả thẻ.
+    # Trả về (kết quả OCR, các dòng, thông tin, độ tin cậy từng trường)
+    from paddleocr.tools.infer.utility import get_rotate_crop_image
+
+    lines = assemble_lines(result)
+    info, confidence, index = extract_scored(lines)
+    targets = sorted({i for name in weak_fields(info, confidence, min_score) for i in index.get(name, ())})
+    if not targets:
+        return result, lines, info, confidence
+
+    items = [line for res in result if res for line in res]
+    img = _load(image)
+    with timer('refine'):
+        crops = [get_rotate_crop_image(img, np.array(items[i][0], dtype=np.float32)) for i in targets]
+        best = rerecognize(engine or get_engine(), crops, batch_size, strong_engine)
+    incr('refine_boxes', len(targets))
+    improved = 0
+    for i, (txt, score) in zip(targets, best):
+        if score > items[i][1][1]:
+            items[i] = [items[i][0], (txt, float(score))]
+            improved += 1
+    if not improved:
+        return result, lines, info, confidence
+    incr('refine_improved', improved)
+    result = [items]
+    lines = assemble_lines(result)
+    info, confidence, _ = extract_scored(lines)
+    return result, lines, info, confidence
+
+
+def _detect_card(engine, img, rectify: bool, adaptive: bool = False):
+    # Nắn thẻ về kích thước chuẩn trước khi chạy SAST, rồi đổi tọa độ hộp về ảnh gốc.
+    # Trả về ((hộp, crop), (ảnh đã nắn, ma trận, thống kê của det_resize hoặc None))
+    card, M = img, None
+    if rectify:
+        with timer('rectify'):
+            card, M = rectify_card(img)
+    stat = None
+    with timer('detect'):
+        if adaptive:
+            boxes, crops, stat = detect_adaptive(engine, card, rectified=M is not None)
+        else:
+            boxes, crops = detect_crops(engine, card)
+    return ((unwarp_boxes(boxes, M) if M is not None else boxes), crops), (card, M, stat)
+
+
+def _mean_score(rec_res) -> float:
+    return float(np.mean([score for _, score in rec_res])) if rec_res else 0.0
+
+
+def _retry_low_confidence(engine, cls, batch_size, card, M, stat, boxes, rec_res):
+    # Độ tin cậy trung bình thấp: phát hiện lại một nấc lớn hơn, giữ lần có độ tin cậy cao hơn
+    score = _mean_score(rec_res)
+    bigger = det_resize.next_size(stat['size'])
+    if score >= det_resize.RETRY_MIN_SCORE or stat['retry'] or bigger is None:
+        return boxes, rec_res, score
+    with timer('detect'):
+        new_boxes, crops, retry_stat = detect_adaptive(engine, card, M is not None, size=bigger)
+    stat['detect_ms'] += retry_stat['detect_ms']
+    if cls and crops and getattr(engine, 'text_classifier', None) is not None:
+        with timer('cls'):
+            pair = [(new_boxes, crops)]
+            classify_selected(engine, pair)
+            crops = pair[0][1]
+    with timer('rec'):
+        new_res = recognize(engine, crops, batch_size) if crops else []
+    stat['retry'] = 'score'
+    new_score = _mean_score(new_res)
+    if new_score <= score:
+        return boxes, rec_res, score
+    # detect_adaptive có thể tự thử thêm một nấc nữa: ghi kích thước thực sự đã dùng
+    stat['size'], stat['boxes'] = retry_stat['size'], len(new_boxes)
+    return (unwarp_boxes(new_boxes, M) if M is not None else new_boxes), new_res, new_score
+
+
+def _ocr_cached(images, engine, cls, batch_size, cache, rectify, adaptive=None, refine=False, version=''):
+    adaptive = det_resize.ADAPTIVE if adaptive is None else adaptive
+    results = [None] * len(images)
+    infos = [None] * len(images)
+    keys = None
+    if cache is not None:
+        # refine có khóa riêng: thông tin trích xuất sau refine không lẫn sang lần chạy không refine.
+        # Tắt cls (không xoay chữ ngược) cũng cho kết quả khác; mặc định cls=True giữ khóa cũ
+        variant = (('-rect' if rectify else '') + ('-adaptive' if adaptive else '') + ('-refine' if refine else '')
+                   + ('' if cls else '-nocls'))
+        keys, loaded = _cache_keys(engine, images, variant)
+        pending = []
+        for i, key in enumerate(keys):
+            hit = cache.get(key, version)
+            if hit is not None:
+                results[i], infos[i] = hit
+                incr('cache_hit')
+            else:
+                incr('cache_miss')
+                item = loaded[i]
+                if not isinstance(item, np.ndarray):
+                    with timer('decode'):
+                        item = decode_image(*item)
+                pending.append((i, item))
+    else:
+        pending = [(i, _load(image)) for i, image in enumerate(images)]
+    if not pending:
+        return results, infos, keys
+
+    detected = [_detect_card(engine, img, rectify, adaptive) for _, img in pending]
+    cards = [pair for pair, _ in detected]
+    if cls and getattr(engine, 'text_classifier', None) is not None:
+        with timer('cls'):
+            classify_selected(engine, cards)
+
+    flat = [crop for _, crops in cards for crop in crops]
+    with timer('rec'):
+        rec_res = recognize(engine, flat, batch_size)
+    incr('cards', len(cards))
+    incr('boxes', len(flat))
+
+    drop_score = getattr(engine, 'drop_score', 0.5)
+    pos = 0
+    for (i, img), (boxes, crops), (_, (card, M, stat)) in zip(pending, cards, detected):
+        card_res = rec_res[pos:pos + len(crops)]
+        pos += len(crops)
+        if stat is not None:
+            boxes, card_res, stat['score'] = _retry_low_confidence(engine, cls, batch_size, card, M, stat,
+                                                                    boxes, card_res)
+            det_resize.record(stat)
+        lines = []
+        for box, (txt, score) in zip(boxes, card_res):
+            if score >= drop_score:
+                lines.append([np.asarray(box).tolist(), (txt, float(score))])
+        results[i] = [lines]
+        if refine and lines:
+            # Refine trước khi lưu: kết quả trong cache dưới khóa -refine đã refine, lần sau không chạy lại
+            results[i] = refine_result(img, results[i], engine, batch_size=batch_size)[0]
+        if cache is not None:
+            cache.put(keys[i], results[i])
+    return results, infos, keys
+
+
+def ocr_images(images, engine=None, cls: bool = True, batch_size: int = REC_BATCH_SIZE, cache=None,
+               rectify: bool = True, adaptive: bool = None, refine: bool = False):
+    # Giống ocr.ocr(img, cls=True) cho từng ảnh, nhưng gom crop của mọi thẻ
+    # vào chung các lô nhận diện rồi trả kết quả về đúng thẻ.
+    # Nếu có cache (OcrCache), ảnh đã từng nhận diện sẽ không chạy lại Paddle.
+    # adaptive: chọn kích thước SAST theo từng ảnh (det_resize), None = theo OCR_ADAPTIVE_DET
+    # refine=True: nhận diện lại các hộp của trường kém tin cậy (refine_result); ảnh trúng cache không refine lại
+    return _ocr_cached(images, engine or get_engine(), cls, batch_size, cache, rectify, adaptive, refine)[0]
+
+
+def ocr_and_extract(images, extract_info, engine=None, cls: bool = True, batch_size: int = REC_BATCH_SIZE,
+                    cache=None, rectify: bool = True, refine: bool = False, adaptive: bool = None):
+    # Trả về [(kết quả OCR, văn bản, thông tin trích xuất)], dùng lại cả extract_info đã lưu trong cache.
+    # extract_info nhận danh sách dòng theo thứ tự đọc (layout.assemble_lines), không phải chuỗi.
+    # refine=True: nhận diện lại các hộp của trường kém tin cậy trước khi trích xuất (refine_result).
+    engine = engine or get_engine()
+    version = info_version(extract_info)
+    results, infos, keys = _ocr_cached(images, engine, cls, batch_size, cache, rectify, adaptive, refine, version)
+    out = []
+    for i, result in enumerate(results):
+        with timer('layout'):
+            lines = assemble_lines(result)
+        full_text = lines_text(lines)
+        info = infos[i]
+        if info is None and lines:
+            with timer('parse'):
+                info = extract_info(lines)
+            if cache is not None:
+                cache.set_info(keys[i], info, version)
+        out.append((result, full_text, info))
+    return out
@@ -0,0 +1,260 @@
+import argparse
+import asyncio
+import json
+import multiprocessing
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+import metrics
+
+MAX_BODY = 20 * 1024 * 1024
+
+# Trạng thái của tiến trình OCR con (mô hình nạp sẵn một lần)
+_worker = {}
+
+
+def _init_worker(rec_batch: int):
+    from ocr_engine import warm_up
+    # Mẫu thời gian của tiến trình con được gửi về cùng kết quả để gộp ở /metrics
+    metrics.enable()
+    metrics.metrics.forward = True
+    _worker['ocr'] = warm_up()
+    _worker['rec_batch'] = rec_batch
+
+
+def _process_batch(blobs: list):
+    # Chạy trong tiến trình con: cả nhóm ảnh đi chung các lô nhận diện.
+    # Trả về (kết quả từng ảnh, mẫu thời gian mới của tiến trình con)
+    import numpy as np
+    from image_io import decode_image
+    from ocr_pipeline import ocr_and_extract
+    from doc_types import extract
+
+    out = [None] * len(blobs)
+    images, index = [], []
+    for i, blob in enumerate(blobs):
+        try:
+            with metrics.timer('decode'):
+                images.append(decode_image(np.frombuffer(blob, dtype=np.uint8), "upload"))
+            index.append(i)
+        except ValueError as e:
+            out[i] = {'error': str(e)}
+    if images:
+        results = ocr_and_extract(images, extract, _worker['ocr'], batch_size=_worker['rec_batch'])
+        for i, (_, text, info) in zip(index, results):
+            out[i] = {'text': text, 'info': info} if text else {'error': 'Không phát hiện ra chữ'}
+    return out, metrics.metrics.drain()
+
+
+class OcrServer:
+    # Dịch vụ HTTP asyncio: gom các yêu cầu đến trong vài ms thành một lô nhận diện,
+    # hàng đợi có giới hạn, đầy thì trả 503 để bên gọi thử lại sau.
+    def __init__(self, workers: int = 2, max_batch: int = 8, batch_window: float = 0.005,
+                 max_queue: int = 64, rec_batch: int = 32, executor=None, process=_process_batch):
+        self.workers = workers
+        self.max_batch = max_batch
+        self.batch_window = batch_window
+        self.max_queue = max_queue
+        self.rec_batch = rec_batch
+        self.executor = executor
+        self.process = process
+        # Chỉ dựng lại pool do máy chủ tự tạo; executor truyền vào do bên gọi quản lý
+        self._own_executor = executor is None
+        self.stats = {'requests': 0, 'rejected': 0, 'batches': 0, 'images': 0, 'restarts': 0}
+        self._queue = None
+        self._slots = None
+        self._batcher = None
+        self._server = None
+
+    async def start(self, host: str = '127.0.0.1', port: int = 8000):
+        if self.executor is None:
+            self.executor = self._new_executor()
+            # Nạp mô hình ở mọi tiến trình trước khi nhận yêu cầu
+            loop = asyncio.get_running_loop()
+            await asyncio.gather(*(loop.run_in_executor(self.executor, self.process, [])
+                                   for _ in range(self.workers)))
+        self._queue = asyncio.Queue(self.max_queue)
+        self._slots = asyncio.Semaphore(self.workers)
+        self._batcher = asyncio.create_task(self._batch_loop())
+        self._server = await asyncio.start_server(self._handle, host, port)
+        return self._server
+
+    def _new_executor(self):
+        # spawn: tiến trình con không thừa hưởng socket của các kết nối đang mở (pool dựng lại khi đang
+        # phục vụ sẽ giữ kết nối không đóng được) và các luồng của vòng lặp sự kiện
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'),
+                                   initializer=_init_worker, initargs=(self.rec_batch,))
+
+    async def close(self):
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+        if self._batcher is not None:
+            self._batcher.cancel()
+        if self.executor is not None:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+
+    async def submit(self, data: bytes) -> dict:
+        # Ném asyncio.QueueFull khi hàng đợi đầy
+        future = asyncio.get_running_loop().create_future()
+        self._queue.put_nowait((data, future))
+        return await future
+
+    async def _batch_loop(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._queue.get()]
+            deadline = loop.time() + self.batch_window
+            while len(batch) < self.max_batch:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+            # Mỗi tiến trình con chỉ nhận một lô tại một thời điểm
+            await self._slots.acquire()
+            asyncio.create_task(self._run_batch(batch))
+
+    async def _run_batch(self, batch):
+        loop = asyncio.get_running_loop()
+        executor = self.executor
+        try:
+            self.stats['batches'] += 1
+            self.stats['images'] += len(batch)
+            results, stage_metrics = await loop.run_in_executor(executor, self.process, [data for data, _ in batch])
+            metrics.metrics.merge(stage_metrics)
+            for (_, future), result in zip(batch, results):
+                if not future.done():
+                    future.set_result(result)
+        except BrokenProcessPool as e:
+            # Một tiến trình con chết (hết bộ nhớ, lỗi thư viện native): chỉ lô này báo lỗi, các lô sau
+            # chạy trên pool mới. Lô khác đang chạy cùng pool cũng nhận lỗi này nhưng chỉ dựng lại một lần.
+            if self._own_executor and self.executor is executor:
+                self.executor = self._new_executor()
+                self.stats['restarts'] += 1
+                executor.shutdown(wait=False, cancel_futures=True)
+            for _, future in batch:
+                if not future.done():
+                    future.set_result({'error': f'{type(e).__name__}: {e}'})
+        except Exception as e:
+            for _, future in batch:
+                if not future.done():
+                    future.set_result({'error': f'{type(e).__name__}: {e}'})
+        finally:
+            self._slots.release()
+
+    async def _handle(self, reader, writer):
+        try:
+            request_line = (await reader.readline()).decode('latin-1').split()
+            headers = {}
+            while True:
+                line = await reader.readline()
+                if line in (b'\r\n', b'\n', b''):
+                    break
+                name, _, value = line.decode('latin-1').partition(':')
+                headers[name.strip().lower()] = value.strip()
+            if len(request_line) < 2:
+                return
+            method, path = request_line[0], request_line[1]
+            length = int(headers.get('content-length', 0))
+            if length > MAX_BODY:
+                await self._respond(writer, 413, {'error': 'Ảnh quá lớn'})
+                return
+            body = await reader.readexactly(length) if length else b''
+
+            if method == 'GET' and path == '/health':
+                await self._respond(writer, 200, {'status': 'ok'})
+            elif method == 'GET' and path == '/stats':
+                await self._respond(writer, 200, {**self.stats, 'queued': self._queue.qsize()})
+            elif method == 'GET' and path == '/metrics':
+                await self._respond_text(writer, 200, metrics.metrics.to_prometheus())
+            elif method == 'POST' and path == '/extract':
+                await self._extract(writer, headers, body)
+            else:
+                await self._respond(writer, 404, {'error': 'Không tìm thấy'})
+        except (asyncio.IncompleteReadError, ConnectionError, ValueError):
+            pass
+        finally:
+            writer.close()
+
+    async def _extract(self, writer, headers, body):
+        self.stats['requests'] += 1
+        data = _read_upload(headers.get('content-type', ''), body)
+        if not data:
+            await self._respond(writer, 400, {'error': 'Thiếu ảnh'})
+            return
+        start = time.perf_counter()
+        try:
+            result = await self.submit(data)
+        except asyncio.QueueFull:
+            self.stats['rejected'] += 1
+            await self._respond(writer, 503, {'error': 'Máy chủ đang bận'}, {'Retry-After': '1'})
+            return
+        elapsed = time.perf_counter() - start
+        metrics.metrics.observe('request', elapsed)
+        result['elapsed_ms'] = round(elapsed * 1000, 1)
+        await self._respond(writer, 422 if 'error' in result else 200, result)
+
+    @staticmethod
+    async def _respond(writer, status: int, payload: dict, extra_headers: dict = None):
+        body = json.dumps(payload, ensure_ascii=False).encode('utf-8')
+        await OcrServer._write(writer, status, body, 'application/json; charset=utf-8', extra_headers)
+
+    @staticmethod
+    async def _respond_text(writer, status: int, text: str):
+        await OcrServer._write(writer, status, text.encode('utf-8'), 'text/plain; version=0.0.4; charset=utf-8')
+
+    @staticmethod
+    async def _write(writer, status: int, body: bytes, content_type: str, extra_headers: dict = None):
+        reasons = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 413: 'Payload Too Large',
+                   422: 'Unprocessable Entity', 503: 'Service Unavailable'}
+        head = [f'HTTP/1.1 {status} {reasons.get(status, "")}',
+                f'Content-Type: {content_type}',
+                f'Content-Length: {len(body)}', 'Connection: close']
+        head += [f'{k}: {v}' for k, v in (extra_headers or {}).items()]
+        writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+        await writer.drain()
+
+
+def _read_upload(content_type: str, body: bytes) -> bytes:
+    # Nhận ảnh dạng thân yêu cầu thô (image/*) hoặc phần đầu tiên của multipart/form-data
+    if not content_type.startswith('multipart/form-data'):
+        return body
+    boundary = content_type.partition('boundary=')[2].strip('"')
+    if not boundary:
+        return b''
+    for part in body.split(b'--' + boundary.encode('latin-1')):
+        head, sep, data = part.partition(b'\r\n\r\n')
+        if sep and b'filename=' in head:
+            return data[:-2] if data.endswith(b'\r\n') else data
+    return b''
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Dịch vụ HTTP trích xuất thông tin CCCD")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('-j', '--workers', type=int, default=2, help="Số tiến trình OCR nạp sẵn mô hình")
+    parser.add_argument('--max-batch', type=int, default=8, help="Số ảnh tối đa mỗi lô")
+    parser.add_argument('--batch-window-ms', type=float, default=5.0, help="Thời gian chờ gom lô (ms)")
+    parser.add_argument('--max-queue', type=int, default=64, help="Số yêu cầu chờ tối đa trước khi trả 503")
+    args = parser.parse_args(argv)
+
+    async def serve():
+        server = OcrServer(args.workers, args.max_batch, args.batch_window_ms / 1000, args.max_queue)
+        await server.start(args.host, args.port)
+        print(f"✅ Đang phục vụ tại http://{args.host}:{args.port} "
+              "(POST /extract, GET /health, GET /stats, GET /metrics)")
+        try:
+            await asyncio.Event().wait()
+        finally:
+            await server.close()
+
+    asyncio.run(serve())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,106 @@
+import itertools
+import queue
+import threading
+
+from PyQt6.QtCore import QThread, pyqtSignal
+
+from ocr_engine import warm_up
+
+
+class JobCancelled(Exception):
+    pass
+
+
+class OcrWorker(QThread):
+    # Luồng nền chạy OCR theo hàng đợi để vòng lặp sự kiện Qt không bị chặn.
+    # process(image, progress) là hàm xử lý một ảnh, progress(text) báo tiến độ;
+    # kết quả trả về được gửi qua tín hiệu job_finished.
+    engine_ready = pyqtSignal()
+    job_started = pyqtSignal(int)
+    job_progress = pyqtSignal(int, str)
+    job_finished = pyqtSignal(int, object)
+    job_failed = pyqtSignal(int, str)
+    job_cancelled = pyqtSignal(int)
+    queue_changed = pyqtSignal(int)
+
+    def __init__(self, process, parent=None):
+        super().__init__(parent)
+        self._process = process
+        self._queue = queue.Queue()
+        self._ids = itertools.count(1)
+        self._cancelled = set()
+        self._lock = threading.Lock()
+        self._current = None
+        self._stopping = False
+
+    def submit(self, image, *args) -> int:
+        job_id = next(self._ids)
+        self._queue.put((job_id, image, args))
+        self.queue_changed.emit(self.pending())
+        return job_id
+
+    def pending(self) -> int:
+        return self._queue.qsize()
+
+    def cancel(self, job_id: int):
+        # Job đang chạy sẽ bị bỏ kết quả ở mốc tiến độ kế tiếp
+        with self._lock:
+            self._cancelled.add(job_id)
+
+    def cancel_all(self):
+        with self._lock:
+            while True:
+                try:
+                    job_id, _, _ = self._queue.get_nowait()
+                except queue.Empty:
+                    break
+                self.job_cancelled.emit(job_id)
+            if self._current is not None:
+                self._cancelled.add(self._current)
+        self.queue_changed.emit(0)
+
+    def stop(self):
+        self._stopping = True
+        self.cancel_all()
+        self._queue.put(None)
+        self.wait()
+
+    def _check(self, job_id: int):
+        with self._lock:
+            if job_id in self._cancelled or self._stopping:
+                raise JobCancelled()
+
+    def run(self):
+        try:
+            warm_up()
+            self.engine_ready.emit()
+        except Exception as e:
+            self.job_failed.emit(0, f"Không nạp được mô hình: {e}")
+
+        while True:
+            item = self._queue.get()
+            if item is None:
+                break
+            job_id, image, args = item
+            self.queue_changed.emit(self.pending())
+
+            def progress(text, job_id=job_id):
+                self._check(job_id)
+                self.job_progress.emit(job_id, text)
+
+            with self._lock:
+                self._current = job_id
+            try:
+                self._check(job_id)
+                self.job_started.emit(job_id)
+                result = self._process(image, progress, *args)
+                self._check(job_id)
+                self.job_finished.emit(job_id, result)
+            except JobCancelled:
+                self.job_cancelled.emit(job_id)
+            except Exception as e:
+                self.job_failed.emit(job_id, f"{type(e).__name__}: {e}")
+            finally:
+                with self._lock:
+                    self._current = None
+                    self._cancelled.discard(job_id)
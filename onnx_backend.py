@@ -0,0 +1,210 @@
+import argparse
+import os
+import subprocess
+import sys
+import time
+
+import numpy as np
+
+from ocr_correct import edit_distance
+
+# Mô hình ONNX xuất từ chính các thư mục inference của Paddle:
+# inference/SAST -> inference/onnx/SAST.onnx, bản lượng tử hóa INT8 -> SAST.int8.onnx
+ONNX_DIR = 'inference/onnx'
+# Mô hình phân loại góc mặc định của PaddleOCR (tự tải về lần chạy Paddle đầu tiên)
+DEFAULT_CLS_DIR = os.path.expanduser('~/.paddleocr/whl/cls/ch_ppocr_mobile_v2.0_cls_infer')
+
+# Tham số SRN cố định trong TextRecognizer của PaddleOCR
+SRN_NUM_HEADS = 8
+SRN_MAX_TEXT_LENGTH = 25
+
+
+def onnx_path(model_dir: str, int8: bool = False) -> str:
+    name = os.path.basename(os.path.normpath(model_dir))
+    return os.path.join(ONNX_DIR, name + ('.int8.onnx' if int8 else '.onnx'))
+
+
+def export_model(model_dir: str, save_file: str = None, opset: int = 11) -> str:
+    # Chuyển thư mục inference Paddle (inference.pdmodel/.pdiparams) sang ONNX bằng paddle2onnx
+    save_file = save_file or onnx_path(model_dir)
+    os.makedirs(os.path.dirname(save_file) or '.', exist_ok=True)
+    name = 'model' if os.path.exists(os.path.join(model_dir, 'model.pdmodel')) else 'inference'
+    subprocess.run(['paddle2onnx', '--model_dir', model_dir,
+                    '--model_filename', f'{name}.pdmodel', '--params_filename', f'{name}.pdiparams',
+                    '--save_file', save_file, '--opset_version', str(opset),
+                    '--enable_onnx_checker', 'True'], check=True)
+    return save_file
+
+
+def quantize_model(src: str, dst: str = None) -> str:
+    # Lượng tử hóa động INT8: trọng số MatMul/Conv lưu int8, kích hoạt lượng tử hóa lúc chạy
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+    dst = dst or src[:-len('.onnx')] + '.int8.onnx'
+    quantize_dynamic(src, dst, weight_type=QuantType.QInt8)
+    return dst
+
+
+def make_session(path: str, threads: int = 0, inter_threads: int = 1):
+    # threads=0: để ONNX Runtime tự chọn theo số lõi; chạy nhiều tiến trình thì nên đặt nhỏ
+    import onnxruntime as ort
+    if not os.path.exists(path):
+        raise FileNotFoundError(f"Không tìm thấy mô hình ONNX: {path}")
+    opts = ort.SessionOptions()
+    opts.intra_op_num_threads = threads
+    opts.inter_op_num_threads = inter_threads
+    opts.execution_mode = ort.ExecutionMode.ORT_SEQUENTIAL
+    opts.graph_optimization_level = ort.GraphOptimizationLevel.ORT_ENABLE_ALL
+    return ort.InferenceSession(path, opts, providers=['CPUExecutionProvider'])
+
+
+def srn_constant_inputs(image_shape) -> list:
+    # Các đầu vào phụ của SRN (vị trí và mặt nạ attention), giống TextRecognizer.srn_other_inputs
+    _, h, w = image_shape
+    feature_dim = int((h / 8) * (w / 8))
+    n = SRN_MAX_TEXT_LENGTH
+    encoder_word_pos = np.arange(feature_dim, dtype=np.int64).reshape(1, feature_dim, 1)
+    gsrm_word_pos = np.arange(n, dtype=np.int64).reshape(1, n, 1)
+    ones = np.ones((1, 1, n, n))
+    bias1 = np.tile(np.triu(ones, 1), [1, SRN_NUM_HEADS, 1, 1]).astype(np.float32) * -1e9
+    bias2 = np.tile(np.tril(ones, -1), [1, SRN_NUM_HEADS, 1, 1]).astype(np.float32) * -1e9
+    return [encoder_word_pos, gsrm_word_pos, bias1, bias2]
+
+
+class SrnSession:
+    # PaddleOCR chỉ đưa ảnh vào phiên ONNX của SRN; bổ sung các đầu vào phụ theo kích thước lô
+    def __init__(self, session, image_shape):
+        self.session = session
+        names = [i.name for i in session.get_inputs()]
+        self._extra = dict(zip(names[1:], srn_constant_inputs(image_shape)))
+
+    def get_inputs(self):
+        return self.session.get_inputs()
+
+    def get_outputs(self):
+        return self.session.get_outputs()
+
+    def run(self, output_names, input_dict):
+        n = next(iter(input_dict.values())).shape[0]
+        feed = dict(input_dict)
+        for name, value in self._extra.items():
+            feed.setdefault(name, np.repeat(value, n, axis=0))
+        return self.session.run(output_names, feed)
+
+
+def _attach(predictor, session):
+    predictor.predictor = session
+    predictor.input_tensor = session.get_inputs()[0]
+
+
+def build_engine(common: dict, config: dict):
+    # Dựng PaddleOCR ở chế độ use_onnx với mô hình đã xuất, rồi thay phiên ONNX Runtime
+    # bằng phiên có giới hạn luồng; giao diện engine (text_detector, text_recognizer...) giữ nguyên.
+    from paddleocr import PaddleOCR
+
+    config = dict(config)
+    config.pop('backend', None)
+    threads = int(config.pop('threads', 0))
+    int8 = bool(config.pop('int8', False))
+    paths = {
+        'det_model_dir': onnx_path(config.pop('det_model_dir'), int8),
+        'rec_model_dir': onnx_path(config.pop('rec_model_dir'), int8),
+        'cls_model_dir': onnx_path(config.pop('cls_model_dir', None) or DEFAULT_CLS_DIR, int8),
+    }
+    engine = PaddleOCR(**common, **config, **paths, use_onnx=True)
+    _attach(engine.text_detector, make_session(paths['det_model_dir'], threads))
+    rec = make_session(paths['rec_model_dir'], threads)
+    if engine.text_recognizer.rec_algorithm == 'SRN':
+        rec = SrnSession(rec, engine.text_recognizer.rec_image_shape)
+    _attach(engine.text_recognizer, rec)
+    if hasattr(engine, 'text_classifier'):
+        _attach(engine.text_classifier, make_session(paths['cls_model_dir'], threads))
+    return engine
+
+
+def parity(images, reference, candidate, batch_size: int = 32) -> dict:
+    # So sánh hai engine trên cùng các crop (phát hiện bằng engine tham chiếu) và trên toàn trình:
+    # tỉ lệ dòng trùng khớp, CER, tỉ lệ trường trích xuất giống nhau và thời gian mỗi ảnh.
+    from image_io import read_image
+    from ocr_pipeline import detect_crops, recognize, ocr_and_extract
+    from cccd_parser import extract
+
+    crops = []
+    for image in images:
+        img = read_image(image) if isinstance(image, str) else image
+        crops.extend(detect_crops(reference, img)[1])
+    rec = {}
+    for name, engine in (('reference', reference), ('candidate', candidate)):
+        start = time.perf_counter()
+        rec[name] = recognize(engine, crops, batch_size)
+        rec[name + '_s'] = time.perf_counter() - start
+    same = sum(1 for (a, _), (b, _) in zip(rec['reference'], rec['candidate']) if a == b)
+    errors = sum(edit_distance(a, b) for (a, _), (b, _) in zip(rec['reference'], rec['candidate']))
+    chars = sum(len(a) for a, _ in rec['reference']) or 1
+
+    full = {}
+    for name, engine in (('reference', reference), ('candidate', candidate)):
+        start = time.perf_counter()
+        full[name] = ocr_and_extract(images, extract, engine, batch_size=batch_size)
+        full[name + '_s'] = time.perf_counter() - start
+    fields = total = 0
+    for (_, _, a), (_, _, b) in zip(full['reference'], full['candidate']):
+        # Một bên không trích xuất được (None): mọi trường của bên kia tính là lệch
+        a, b = a or {}, b or {}
+        for key in set(a) | set(b):
+            total += 1
+            fields += a.get(key) == b.get(key)
+
+    n = len(images) or 1
+    return {
+        'crops': len(crops),
+        'line_match': same / len(crops) if crops else 1.0,
+        'cer': errors / chars,
+        'field_match': fields / total if total else 1.0,
+        'rec_ms_per_crop': {k: rec[k + '_s'] * 1000 / (len(crops) or 1) for k in ('reference', 'candidate')},
+        'ms_per_image': {k: full[k + '_s'] * 1000 / n for k in ('reference', 'candidate')},
+    }
+
+
+def main(argv=None):
+    from ocr_engine import DEFAULT_CONFIG
+
+    parser = argparse.ArgumentParser(description="Xuất, lượng tử hóa và kiểm tra mô hình ONNX Runtime")
+    sub = parser.add_subparsers(dest='cmd', required=True)
+    p = sub.add_parser('export', help="Xuất SAST, SRN và mô hình góc sang ONNX (cần paddle2onnx)")
+    p.add_argument('--cls-model-dir', default=DEFAULT_CLS_DIR)
+    p.add_argument('--int8', action='store_true', help="Tạo thêm bản lượng tử hóa INT8")
+    p = sub.add_parser('parity', help="So sánh kết quả ONNX với Paddle trên các ảnh mẫu")
+    p.add_argument('images', nargs='+')
+    p.add_argument('--threads', type=int, default=0)
+    p.add_argument('--int8', action='store_true')
+    p.add_argument('--max-cer', type=float, default=0.02, help="CER tối đa chấp nhận được")
+    args = parser.parse_args(argv)
+
+    if args.cmd == 'export':
+        for model_dir in (DEFAULT_CONFIG['det_model_dir'], DEFAULT_CONFIG['rec_model_dir'], args.cls_model_dir):
+            path = export_model(model_dir)
+            print(f"✅ {model_dir} -> {path}")
+            if args.int8:
+                print(f"✅ {path} -> {quantize_model(path)}")
+        return 0
+
+    from ocr_engine import get_engine
+    from batch_ocr import iter_images
+
+    images = list(iter_images(args.images))
+    reference = get_engine(backend='paddle')
+    candidate = get_engine(backend='onnx', threads=args.threads, int8=args.int8)
+    report = parity(images, reference, candidate)
+    print(f"Crop: {report['crops']}  dòng trùng {report['line_match']:.1%}  CER {report['cer']:.2%}  "
+          f"trường trùng {report['field_match']:.1%}")
+    for name in ('reference', 'candidate'):
+        print(f"{name:9s} rec {report['rec_ms_per_crop'][name]:.1f} ms/crop  "
+              f"toàn trình {report['ms_per_image'][name]:.0f} ms/ảnh")
+    if report['cer'] > args.max_cer:
+        print(f"❌ CER vượt ngưỡng {args.max_cer:.2%}", file=sys.stderr)
+        return 1
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,191 @@
+import argparse
+import csv
+import json
+import re
+import sqlite3
+import threading
+import time
+
+from ocr_correct import fold
+
+DEFAULT_STORE_PATH = "ho_so.sqlite"
+
+# Cột riêng của file xuất (không phải trường thông tin), bỏ qua khi nhập CSV
+_EXPORT_ONLY = ('file', 'text', 'error', 'mode', 'page', 'card', 'row', 'col')
+_ID_RE = re.compile(r'(?<!\d)(\d{12})(?!\d)')
+_DATE_RE = re.compile(r'^\s*(\d{1,2})[/-](\d{1,2})[/-](\d{4})\s*$')
+
+
+def name_key(name) -> str:
+    # Họ tên không dấu, bỏ khoảng trắng/ký tự lạ: 'Nguyễn  Văn An' == 'NGUYEN VAN AN'
+    return fold(name) if name else ''
+
+
+def date_key(value) -> str:
+    # Ngày về dạng dd/mm/yyyy có số 0 đứng đầu; không đúng dạng thì trả về rỗng
+    m = _DATE_RE.match(value or '')
+    return f"{int(m.group(1)):02d}/{int(m.group(2)):02d}/{m.group(3)}" if m else ''
+
+
+def _one_digit_off(cccd: str) -> list:
+    # Các số CCCD khác đúng một chữ số (OCR đọc nhầm một số), tra bằng chỉ mục trong một câu IN
+    return [cccd[:i] + d + cccd[i + 1:] for i in range(len(cccd)) for d in '0123456789' if d != cccd[i]]
+
+
+class RecordStore:
+    # Kho hồ sơ đã trích xuất trên SQLite: mỗi người một bản ghi, chỉ mục theo số CCCD và theo
+    # họ tên chuẩn hóa + ngày sinh để tra trùng trong O(log n) thay vì dò lại file CSV đã xuất.
+    def __init__(self, path: str = DEFAULT_STORE_PATH):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, timeout=30, check_same_thread=False)
+        self._conn.execute("PRAGMA journal_mode=WAL")
+        self._conn.execute("""CREATE TABLE IF NOT EXISTS records (
+            id INTEGER PRIMARY KEY,
+            cccd TEXT,
+            name_key TEXT,
+            dob TEXT,
+            doc_type TEXT,
+            info TEXT NOT NULL,
+            source TEXT,
+            created REAL NOT NULL,
+            updated REAL NOT NULL)""")
+        self._conn.execute("CREATE UNIQUE INDEX IF NOT EXISTS idx_records_cccd ON records(cccd) "
+                           "WHERE cccd IS NOT NULL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_records_person ON records(name_key, dob)")
+        self._conn.commit()
+
+    @staticmethod
+    def _row(row) -> dict:
+        return {'id': row[0], 'info': json.loads(row[1]), 'source': row[2], 'created': row[3], 'updated': row[4]}
+
+    def _select(self, where: str, params) -> list:
+        return self._conn.execute(f"SELECT id, info, source, created, updated FROM records WHERE {where}",
+                                  params).fetchall()
+
+    def _find(self, info: dict, near: bool):
+        cccd = info.get('CCCD') or None
+        if cccd:
+            rows = self._select("cccd = ?", (cccd,))
+            if rows:
+                return self._row(rows[0]), 'cccd'
+        person = name_key(info.get('Họ và tên')), date_key(info.get('Ngày sinh'))
+        if all(person):
+            rows = self._select("name_key = ? AND dob = ?", person)
+            # Cùng họ tên + ngày sinh nhưng khác hẳn số CCCD thì là người khác
+            rows = [r for r in rows if not cccd or not json.loads(r[1]).get('CCCD')]
+            if rows:
+                return self._row(rows[0]), 'person'
+        if near and cccd and cccd.isdigit():
+            variants = _one_digit_off(cccd)
+            rows = self._select(f"cccd IN ({','.join('?' * len(variants))})", variants)
+            if rows:
+                return self._row(rows[0]), 'cccd~1'
+        return None, None
+
+    def find(self, info: dict, near: bool = True):
+        # Trả về (bản ghi đã lưu, cách khớp: 'cccd' | 'person' | 'cccd~1') hoặc (None, None).
+        # near=True: tìm cả số CCCD lệch một chữ số (gần trùng)
+        with self._lock:
+            return self._find(info, near)
+
+    def find_in_text(self, text: str):
+        # Tra nhanh các dãy 12 số trong văn bản OCR trước khi trích xuất; thẻ đã có thì dùng luôn bản đã lưu
+        numbers = list(dict.fromkeys(_ID_RE.findall(text or '')))
+        if not numbers:
+            return None
+        with self._lock:
+            rows = self._select(f"cccd IN ({','.join('?' * len(numbers))})", numbers)
+        return self._row(rows[0]) if rows else None
+
+    def get(self, cccd: str):
+        with self._lock:
+            rows = self._select("cccd = ?", (cccd,))
+        return self._row(rows[0]) if rows else None
+
+    def put(self, info: dict, source: str = None, near: bool = False):
+        # Thêm bản ghi, hoặc gộp vào bản ghi trùng (giữ giá trị đã lưu, chỉ bổ sung trường còn trống).
+        # Trả về (bản ghi sau khi lưu, cách khớp hoặc None nếu là bản ghi mới)
+        info = {k: v for k, v in info.items() if v not in (None, '')}
+        now = time.time()
+        with self._lock:
+            stored, how = self._find(info, near)
+            if stored is None:
+                merged = info
+                cur = self._conn.execute(
+                    "INSERT INTO records (cccd, name_key, dob, doc_type, info, source, created, updated) "
+                    "VALUES (?, ?, ?, ?, ?, ?, ?, ?)", self._columns(merged) + (source, now, now))
+                record_id, created = cur.lastrowid, now
+            else:
+                merged = {**stored['info'], **{k: v for k, v in info.items() if k not in stored['info']}}
+                record_id, created = stored['id'], stored['created']
+                if merged != stored['info']:
+                    self._conn.execute(
+                        "UPDATE records SET cccd = ?, name_key = ?, dob = ?, doc_type = ?, info = ?, updated = ? "
+                        "WHERE id = ?", self._columns(merged) + (now, record_id))
+                source = stored['source']
+            self._conn.commit()
+        return {'id': record_id, 'info': merged, 'source': source, 'created': created, 'updated': now}, how
+
+    @staticmethod
+    def _columns(info: dict) -> tuple:
+        return (info.get('CCCD') or None, name_key(info.get('Họ và tên')), date_key(info.get('Ngày sinh')),
+                info.get('Loại giấy tờ'), json.dumps(info, ensure_ascii=False))
+
+    def import_csv(self, path: str) -> dict:
+        # Nhập file CSV đã xuất (giao diện hoặc batch_ocr); dòng trùng được gộp, dòng lỗi/trống bị bỏ
+        counts = {'added': 0, 'merged': 0, 'skipped': 0}
+        with open(path, newline='', encoding='utf-8-sig') as f:
+            for row in csv.DictReader(f):
+                if row.get('error'):
+                    counts['skipped'] += 1
+                    continue
+                info = {k: v for k, v in row.items() if k and k not in _EXPORT_ONLY and v}
+                if not info.get('CCCD') and not (info.get('Họ và tên') and info.get('Ngày sinh')):
+                    counts['skipped'] += 1
+                    continue
+                _, how = self.put(info, source=row.get('file') or path)
+                counts['merged' if how else 'added'] += 1
+        return counts
+
+    def count(self) -> int:
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM records").fetchone()[0]
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Kho hồ sơ đã trích xuất (SQLite): nhập CSV, tra theo CCCD")
+    parser.add_argument('--db', default=DEFAULT_STORE_PATH, help="File SQLite của kho")
+    sub = parser.add_subparsers(dest='command', required=True)
+    p_import = sub.add_parser('import', help="Nhập các file CSV đã xuất")
+    p_import.add_argument('files', nargs='+')
+    p_find = sub.add_parser('find', help="Tra theo số CCCD (kể cả lệch một chữ số)")
+    p_find.add_argument('cccd')
+    args = parser.parse_args(argv)
+
+    store = RecordStore(args.db)
+    try:
+        if args.command == 'import':
+            for path in args.files:
+                c = store.import_csv(path)
+                print(f"{path}: thêm {c['added']}, gộp {c['merged']}, bỏ qua {c['skipped']}")
+            print(f"✅ Kho có {store.count()} hồ sơ")
+        else:
+            record, how = store.find({'CCCD': args.cccd})
+            if record is None:
+                print("Không có trong kho.")
+                return 1
+            print(f"#{record['id']} (khớp {how}):")
+            for key, value in record['info'].items():
+                print(f"  {key}: {value}")
+    finally:
+        store.close()
+    return 0
+
+
+if __name__ == "__main__":
+    raise SystemExit(main())
@@ -0,0 +1,171 @@
+import cv2
+import numpy as np
+
+from card_detect import CANONICAL_SIZE, CARD_ASPECT, order_quad, rectify_card, unwarp_boxes, warp_quad
+from image_io import read_image
+from metrics import timer, incr
+
+# File nhiều trang, đọc từng trang khi cần
+PAGE_EXTS = ('.tif', '.tiff', '.pdf')
+# Độ phân giải dựng trang PDF (thẻ CCCD ~ 1000 px chiều ngang ở 300 dpi)
+PDF_DPI = 300
+# Ảnh trang được thu nhỏ về chiều rộng này trước khi tìm thẻ
+SHEET_DETECT_WIDTH = 1000
+# Mỗi thẻ chiếm khoảng 1/15 trang A4; chặn vùng quá nhỏ (chữ, logo) và quá lớn (cả trang)
+MIN_CARD_AREA = 0.015
+MAX_CARD_AREA = 0.5
+MAX_CARDS = 8
+# Điểm ảnh lệch màu nền (nắp máy scan) quá ngưỡng này thì thuộc về thẻ
+BACKGROUND_DIFF = 18
+
+
+def page_count(path: str) -> int:
+    lower = path.lower()
+    if lower.endswith('.pdf'):
+        import fitz  # PyMuPDF
+        with fitz.open(path) as doc:
+            return doc.page_count
+    if lower.endswith(('.tif', '.tiff')):
+        from PIL import Image
+        with Image.open(path) as im:
+            return getattr(im, 'n_frames', 1)
+    return 1
+
+
+def read_page(path: str, index: int = 0, dpi: int = PDF_DPI) -> np.ndarray:
+    # Chỉ giải mã đúng một trang (BGR), không nạp cả file nhiều trang vào bộ nhớ
+    lower = path.lower()
+    if lower.endswith('.pdf'):
+        import fitz
+        with fitz.open(path) as doc:
+            pix = doc.load_page(index).get_pixmap(dpi=dpi)
+        img = np.frombuffer(pix.samples, dtype=np.uint8).reshape(pix.height, pix.width, pix.n)
+        return cv2.cvtColor(img, cv2.COLOR_RGBA2BGR if pix.n == 4 else cv2.COLOR_RGB2BGR)
+    if lower.endswith(('.tif', '.tiff')):
+        from PIL import Image
+        with Image.open(path) as im:
+            im.seek(index)
+            return cv2.cvtColor(np.asarray(im.convert('RGB')), cv2.COLOR_RGB2BGR)
+    return read_image(path)
+
+
+def iter_page_refs(paths):
+    # (đường dẫn, số trang) của từng trang; tiến trình xử lý tự đọc trang của mình
+    for path in paths:
+        for index in range(page_count(path)):
+            yield path, index
+
+
+def iter_pages(path: str, dpi: int = PDF_DPI):
+    for index in range(page_count(path)):
+        yield index, read_page(path, index, dpi)
+
+
+def _reading_order(quads) -> list:
+    # Sắp thẻ theo hàng (tâm dọc lệch nhau dưới nửa chiều cao thẻ) rồi theo cột; trả về [(quad, hàng, cột)]
+    if not quads:
+        return []
+    centers = np.array([q.mean(axis=0) for q in quads])
+    heights = np.array([min(np.linalg.norm(q[3] - q[0]), np.linalg.norm(q[1] - q[0])) for q in quads])
+    order = np.argsort(centers[:, 1], kind='stable')
+    rows, current = [], [order[0]]
+    for i in order[1:]:
+        if centers[i, 1] - centers[current[-1], 1] > 0.5 * np.median(heights):
+            rows.append(current)
+            current = []
+        current.append(i)
+    rows.append(current)
+    out = []
+    for r, row in enumerate(rows, 1):
+        for c, i in enumerate(sorted(row, key=lambda i: centers[i, 0]), 1):
+            out.append((quads[i], r, c))
+    return out
+
+
+def find_sheet_cards(small: np.ndarray, aspect_tol: float = 0.25) -> list:
+    # Thẻ trên trang scan thường sáng gần bằng nền nên cạnh Canny rất yếu (khác ảnh chụp thẻ trên bàn tối):
+    # tách theo độ lệch so với màu nền ước lượng từ viền trang, đóng hình thái để mỗi thẻ thành một khối,
+    # rồi lấy hình chữ nhật bao nhỏ nhất của các khối có diện tích và tỉ lệ giống thẻ. Lớn trước.
+    img = small if small.ndim == 3 else cv2.cvtColor(small, cv2.COLOR_GRAY2BGR)
+    h, w = img.shape[:2]
+    border = np.concatenate([img[:4].reshape(-1, 3), img[-4:].reshape(-1, 3),
+                             img[:, :4].reshape(-1, 3), img[:, -4:].reshape(-1, 3)])
+    background = np.median(border, axis=0).astype(np.int16)
+    diff = np.abs(img.astype(np.int16) - background).max(axis=2)
+    mask = (diff > BACKGROUND_DIFF).astype(np.uint8) * 255
+    k = max(3, w // 100)
+    mask = cv2.morphologyEx(mask, cv2.MORPH_CLOSE, cv2.getStructuringElement(cv2.MORPH_RECT, (k, k)))
+    mask = cv2.morphologyEx(mask, cv2.MORPH_OPEN, cv2.getStructuringElement(cv2.MORPH_RECT, (k, k)))
+
+    contours, _ = cv2.findContours(mask, cv2.RETR_EXTERNAL, cv2.CHAIN_APPROX_SIMPLE)
+    found = []
+    for c in contours:
+        rect = cv2.minAreaRect(c)
+        rw, rh = rect[1]
+        area = rw * rh
+        if not MIN_CARD_AREA * w * h <= area <= MAX_CARD_AREA * w * h or min(rw, rh) == 0:
+            continue
+        if abs(max(rw, rh) / min(rw, rh) - CARD_ASPECT) / CARD_ASPECT > aspect_tol:
+            continue
+        # Khối phải lấp gần kín hình chữ nhật bao (loại hai thẻ dính nhau thành hình chữ L)
+        if cv2.contourArea(c) < 0.85 * area:
+            continue
+        found.append((area, order_quad(cv2.boxPoints(rect))))
+    found.sort(key=lambda item: -item[0])
+    return [quad for _, quad in found]
+
+
+def split_sheet(page: np.ndarray, max_cards: int = MAX_CARDS, size=CANONICAL_SIZE) -> list:
+    # Tìm các thẻ trên trang scan, nắn từng thẻ về size.
+    # Trả về [(ảnh thẻ, {'card', 'row', 'col', 'quad'})] theo thứ tự đọc; trang chỉ có một thẻ vẫn trả về một phần tử.
+    # Không thấy vùng nào cỡ thẻ (ảnh chụp một thẻ chiếm gần hết khung) thì dùng card_detect.rectify_card.
+    scale = min(1.0, SHEET_DETECT_WIDTH / page.shape[1])
+    small = cv2.resize(page, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA) if scale < 1.0 else page
+    quads = find_sheet_cards(small)[:max_cards]
+    cards = []
+    for k, (quad, row, col) in enumerate(_reading_order([q / scale for q in quads]), 1):
+        card, _ = warp_quad(page, quad, size)
+        cards.append((card, {'card': k, 'row': row, 'col': col, 'quad': quad.round().astype(int).tolist()}))
+    if not cards:
+        card, M = rectify_card(page, size)
+        if M is not None:
+            quad = unwarp_boxes([[[0, 0], [size[0] - 1, 0], [size[0] - 1, size[1] - 1], [0, size[1] - 1]]], M)[0]
+            cards.append((card, {'card': 1, 'row': 1, 'col': 1, 'quad': quad.round().astype(int).tolist()}))
+    return cards
+
+
+def scan_pages(refs, extract_info, engine=None, batch_size: int = None, max_cards: int = MAX_CARDS,
+               dpi: int = PDF_DPI) -> list:
+    # Tách thẻ trên các trang (đường dẫn, số trang) rồi nhận diện mọi thẻ chung các lô SRN.
+    # Trả về một bản ghi cho mỗi thẻ: {'file', 'page', 'card', 'row', 'col', 'text', ...thông tin}
+    from ocr_pipeline import REC_BATCH_SIZE, ocr_and_extract
+
+    cards, tags = [], []
+    for path, index in refs:
+        with timer('decode'):
+            page = read_page(path, index, dpi)
+        with timer('rectify'):
+            found = split_sheet(page, max_cards)
+        if not found:
+            tags.append({'file': path, 'page': index + 1, 'error': 'Không tìm thấy thẻ trên trang'})
+            continue
+        for card, pos in found:
+            cards.append(card)
+            tags.append({'file': path, 'page': index + 1, 'card': pos['card'], 'row': pos['row'], 'col': pos['col']})
+        del page
+    incr('sheet_cards', len(cards))
+
+    # Thẻ đã được nắn khi tách nên bỏ qua bước tìm thẻ trong ocr_and_extract
+    out = iter(ocr_and_extract(cards, extract_info, engine, batch_size=batch_size or REC_BATCH_SIZE,
+                               rectify=False) if cards else [])
+    records = []
+    for tag in tags:
+        if 'error' in tag:
+            records.append(tag)
+            continue
+        _, text, info = next(out)
+        record = {**tag, 'text': text}
+        record.update(info or {})
+        record['error'] = None if text or info else 'Không phát hiện ra chữ'
+        records.append(record)
+    return records
@@ -0,0 +1,334 @@
+import queue
+import threading
+import time
+import multiprocessing as mp
+from multiprocessing import resource_tracker
+from multiprocessing.shared_memory import SharedMemory
+
+import numpy as np
+
+import metrics
+from metrics import timer, incr
+
+# Thứ tự các công đoạn, mỗi công đoạn là một nhóm tiến trình riêng nối với nhau bằng hàng đợi có giới hạn:
+#   decode: đọc + nắn thẻ, detect: SAST (+ phân loại góc), rec: SRN, parse: ghép dòng + trích xuất
+STAGE_NAMES = ('decode', 'detect', 'rec', 'parse')
+DEFAULT_STAGE_WORKERS = {'decode': 1, 'detect': 2, 'rec': 1, 'parse': 1}
+# Số việc tối đa chờ trước mỗi công đoạn (nhân với số tiến trình của công đoạn đó)
+QUEUE_PER_WORKER = 4
+# Công đoạn nhận diện chờ thêm chừng này giây để gom crop của các thẻ khác vào cùng lô
+REC_GATHER_S = 0.01
+# Chu kỳ kiểm tra tiến trình công đoạn chết bất thường (lỗi native, hết bộ nhớ)
+WATCH_INTERVAL_S = 0.5
+# Đã có tiến trình chết mà quá chừng này giây không có bản ghi nào về thì coi dây chuyền đã treo
+CRASH_STALL_S = 10.0
+
+
+def parse_stage_workers(spec: str) -> dict:
+    # 'decode=2,detect=3,rec=1' -> {'decode': 2, 'detect': 3, 'rec': 1, 'parse': 1}
+    workers = dict(DEFAULT_STAGE_WORKERS)
+    for part in filter(None, (p.strip() for p in (spec or '').split(','))):
+        name, _, n = part.partition('=')
+        if name not in workers or not n.isdigit() or int(n) < 1:
+            raise ValueError(f"Cấu hình công đoạn không hợp lệ: {part} (dạng decode=2,detect=2,rec=1,parse=1)")
+        workers[name] = int(n)
+    return workers
+
+
+def share(arrays):
+    # Chép các mảng uint8 vào một khối shared_memory; qua hàng đợi chỉ gửi (tên khối, [(hình dạng, vị trí)]).
+    # Tiến trình nhận khối chịu trách nhiệm giải phóng (release).
+    if not arrays:
+        return None
+    arrays = [np.ascontiguousarray(a, dtype=np.uint8) for a in arrays]
+    layout, offset = [], 0
+    for a in arrays:
+        layout.append((a.shape, offset))
+        offset += a.nbytes
+    shm = SharedMemory(create=True, size=max(offset, 1))
+    for a, (shape, start) in zip(arrays, layout):
+        np.ndarray(shape, np.uint8, shm.buf, start)[...] = a
+    name = shm.name
+    shm.close()
+    return name, layout
+
+
+def attach(ref):
+    # Trả về (khối, [mảng]) - mảng trỏ thẳng vào vùng nhớ chung, không chép
+    shm = SharedMemory(name=ref[0])
+    return shm, [np.ndarray(shape, np.uint8, shm.buf, start) for shape, start in ref[1]]
+
+
+def release(shm):
+    # Hủy khối sau khi dùng xong; mảng còn trỏ tới thì vùng nhớ được thu hồi khi mảng bị xóa
+    try:
+        shm.close()
+    except BufferError:
+        pass
+    shm.unlink()
+
+
+def _error(seq: int, path: str, e: Exception) -> tuple:
+    return 'record', seq, {'file': path, 'error': f'{type(e).__name__}: {e}'}
+
+
+def _stage_loop(in_q, out_q, results, with_metrics, handle):
+    # Vòng lặp chung của một tiến trình công đoạn: nhận việc tới khi gặp None, lỗi của từng ảnh
+    # được gửi thẳng về tiến trình chính thành bản ghi lỗi; thoát thì gửi số đo thời gian về.
+    if with_metrics:
+        metrics.enable()
+        metrics.metrics.forward = True
+    while True:
+        item = in_q.get()
+        if item is None:
+            break
+        try:
+            handle(item, in_q, out_q, results)
+        except Exception as e:
+            results.put(_error(item[0], item[1], e))
+    results.put(('metrics', metrics.metrics.drain()))
+
+
+def _decode(item, in_q, out_q, results, rectify=True):
+    from card_detect import rectify_card
+    from image_io import read_image
+
+    seq, path = item
+    with timer('decode'):
+        img = read_image(path)
+    M = None
+    if rectify:
+        with timer('rectify'):
+            img, M = rectify_card(img)
+    out_q.put((seq, path, share([img]), M))
+
+
+def _detect(item, in_q, out_q, results, cls=True):
+    import det_resize
+    from card_detect import unwarp_boxes
+    from ocr_engine import get_engine
+    from ocr_pipeline import classify_selected, detect_adaptive, detect_crops
+
+    seq, path, ref, M = item
+    engine = get_engine()
+    shm, (card,) = attach(ref)
+    try:
+        with timer('detect'):
+            if det_resize.ADAPTIVE:
+                # Kích thước SAST theo từng thẻ; ở dây chuyền chỉ thử lại theo số/cỡ hộp, không theo độ tin cậy
+                boxes, crops, stat = detect_adaptive(engine, card, rectified=M is not None)
+                det_resize.record(stat)
+            else:
+                boxes, crops = detect_crops(engine, card)
+    finally:
+        del card
+        release(shm)
+    if cls and crops and getattr(engine, 'text_classifier', None) is not None:
+        cards = [(boxes, crops)]
+        with timer('cls'):
+            classify_selected(engine, cards)
+        crops = cards[0][1]
+    boxes = unwarp_boxes(boxes, M) if M is not None else boxes
+    out_q.put((seq, path, [np.asarray(b).tolist() for b in boxes], share(crops)))
+
+
+def _rec(item, in_q, out_q, results, batch_size=32):
+    # Gom crop của nhiều thẻ (từ mọi tiến trình detect) vào chung lô SRN
+    from ocr_engine import get_engine
+    from ocr_pipeline import recognize
+
+    engine = get_engine()
+    cards, count = [item], len(item[2])
+    while count < batch_size:
+        try:
+            more = in_q.get(timeout=REC_GATHER_S)
+        except queue.Empty:
+            break
+        if more is None:
+            # Trả lại tín hiệu dừng cho vòng lặp chính của tiến trình
+            in_q.put(None)
+            break
+        cards.append(more)
+        count += len(more[2])
+
+    attached, flat = [], []
+    try:
+        for seq, path, boxes, ref in cards:
+            if ref:
+                shm, crops = attach(ref)
+                attached.append(shm)
+                flat.extend(crops)
+                del crops
+        with timer('rec'):
+            rec_res = recognize(engine, flat, batch_size) if flat else []
+    except Exception as e:
+        # Lỗi của cả lô: báo cho từng thẻ trong lô
+        for card in cards:
+            results.put(_error(card[0], card[1], e))
+        return
+    finally:
+        del flat
+        for shm in attached:
+            release(shm)
+    incr('cards', len(cards))
+    incr('boxes', len(rec_res))
+
+    drop_score = getattr(engine, 'drop_score', 0.5)
+    pos = 0
+    for seq, path, boxes, _ in cards:
+        lines = [[box, (txt, float(score))] for box, (txt, score) in zip(boxes, rec_res[pos:pos + len(boxes)])
+                 if score >= drop_score]
+        pos += len(boxes)
+        out_q.put((seq, path, [lines]))
+
+
+def _parse(item, in_q, out_q, results, extract_info=None):
+    from layout import assemble_lines, lines_text
+
+    seq, path, result = item
+    with timer('layout'):
+        lines = assemble_lines(result)
+    info = None
+    if lines:
+        with timer('parse'):
+            info = extract_info(lines)
+    text = lines_text(lines)
+    record = {'file': path, 'text': text, 'mode': 'staged'}
+    record.update(info or {})
+    record['error'] = None if text or info else 'Không phát hiện ra chữ'
+    results.put(('record', seq, record))
+
+
+def _worker_main(name, in_q, out_q, results, with_metrics, options):
+    handle = {'decode': _decode, 'detect': _detect, 'rec': _rec, 'parse': _parse}[name]
+    if name == 'parse':
+        from doc_types import extract
+        options = {'extract_info': extract, **options}
+    elif name in ('detect', 'rec'):
+        # Nạp mô hình trước khi nhận việc đầu tiên
+        from ocr_engine import get_engine
+        get_engine()
+    _stage_loop(in_q, out_q, results, with_metrics,
+                lambda item, i, o, r: handle(item, i, o, r, **options))
+
+
+def iter_staged(paths, stage_workers: dict = None, batch_size: int = 32, rectify: bool = True, cls: bool = True,
+                with_metrics: bool = False):
+    # Chạy các công đoạn song song theo kiểu dây chuyền: trong khi một thẻ đang SAST thì thẻ sau đang được
+    # giải mã, thẻ trước đang SRN/trích xuất. Ảnh giữa các công đoạn đi qua shared_memory, không pickle.
+    # Trả về từng bản ghi {'file', 'text', ...thông tin, 'error'} theo thứ tự hoàn thành.
+    workers = {**DEFAULT_STAGE_WORKERS, **(stage_workers or {})}
+    options = {'decode': {'rectify': rectify}, 'detect': {'cls': cls}, 'rec': {'batch_size': batch_size},
+               'parse': {}}
+    # Mọi tiến trình con dùng chung một resource tracker để khối nhớ tạo ở công đoạn này,
+    # hủy ở công đoạn sau không bị báo rò rỉ; tiến trình chết giữa chừng thì tracker dọn hộ.
+    resource_tracker.ensure_running()
+    ctx = mp.get_context()
+    queues = [ctx.Queue(maxsize=QUEUE_PER_WORKER * workers[name]) for name in STAGE_NAMES]
+    results = ctx.Queue()
+    groups = []
+    for k, name in enumerate(STAGE_NAMES):
+        out_q = queues[k + 1] if k + 1 < len(queues) else results
+        procs = [ctx.Process(target=_worker_main, name=f'ocr-{name}-{i}', daemon=True,
+                             args=(name, queues[k], out_q, results, with_metrics, options[name]))
+                 for i in range(workers[name])]
+        for p in procs:
+            p.start()
+        groups.append(procs)
+
+    # Việc đã đưa vào dây chuyền mà chưa có bản ghi: {seq: đường dẫn}. Tiến trình con chết giữa chừng
+    # thì việc của nó không bao giờ về, nên tiến trình chính phải tự theo dõi để không mất bản ghi.
+    pending = {}
+    items = enumerate(paths)
+    stop = threading.Event()
+
+    def put(q, item):
+        # put có thời hạn để luồng cấp việc thoát được khi dây chuyền bị hủy (hàng đợi đầy, không ai nhận)
+        while not stop.is_set():
+            try:
+                q.put(item, timeout=WATCH_INTERVAL_S)
+                return True
+            except queue.Full:
+                pass
+        return False
+
+    def feed():
+        for seq, path in items:
+            pending[seq] = path
+            if not put(queues[0], (seq, path)):
+                return
+        # Dừng lần lượt từng công đoạn sau khi công đoạn trước đã xong hết việc
+        for k, procs in enumerate(groups):
+            for _ in procs:
+                if not put(queues[k], None):
+                    return
+            for p in procs:
+                while p.is_alive() and not stop.is_set():
+                    p.join(WATCH_INTERVAL_S)
+        results.put(None)
+
+    def crashed():
+        # Tiến trình công đoạn đã thoát với mã lỗi (bị kill vì hết bộ nhớ, lỗi native, không nạp được mô hình)
+        return next((p for procs in groups for p in procs if p.exitcode not in (None, 0)), None)
+
+    def stalled(idle: float) -> bool:
+        # Hủy dây chuyền khi cả một công đoạn đã thoát (việc phía trước không còn ai nhận), hoặc khi
+        # tiến trình chết giữ khóa hàng đợi khiến các tiến trình còn sống cũng đứng yên
+        stage_gone = any(all(p.exitcode is not None for p in procs) and any(p.exitcode for p in procs)
+                         for procs in groups)
+        return stage_gone or idle > CRASH_STALL_S
+
+    def handle(item):
+        if item[0] == 'metrics':
+            metrics.metrics.merge(item[1])
+            return None
+        pending.pop(item[1], None)
+        return item[2]
+
+    feeder = threading.Thread(target=feed, name='ocr-staged-feed', daemon=True)
+    feeder.start()
+    dead, aborted = None, False
+    try:
+        last = time.monotonic()
+        while True:
+            try:
+                item = results.get(timeout=WATCH_INTERVAL_S)
+            except queue.Empty:
+                dead = crashed()
+                if dead is not None and stalled(time.monotonic() - last):
+                    aborted = True
+                    break
+                continue
+            if item is None:
+                break
+            last = time.monotonic()
+            record = handle(item)
+            if record is not None:
+                yield record
+        if aborted:
+            # Hủy cả dây chuyền: nhận nốt bản ghi đã xong, mọi việc còn lại thành bản ghi lỗi
+            stop.set()
+            feeder.join()
+            while True:
+                try:
+                    item = results.get(timeout=WATCH_INTERVAL_S)
+                except queue.Empty:
+                    break
+                record = handle(item) if item is not None else None
+                if record is not None:
+                    yield record
+            for seq, path in items:
+                pending[seq] = path
+        # Việc của tiến trình đã chết không bao giờ về: báo lỗi thay vì bỏ sót bản ghi
+        dead = dead or crashed()
+        reason = (f'Tiến trình {dead.name} dừng đột ngột (exitcode {dead.exitcode})' if dead is not None
+                  else 'Không nhận được kết quả từ dây chuyền')
+        for seq in sorted(pending):
+            yield {'file': pending.pop(seq), 'error': reason}
+    finally:
+        stop.set()
+        for procs in groups:
+            for p in procs:
+                if p.is_alive():
+                    p.terminate()
+        feeder.join(timeout=1)
@@ -0,0 +1,24 @@
+from benchmark import _timed, compare
+
+
+def _report(throughput, config=None, accuracy=0.9):
+    return {'scenarios': {'parser': {'config': config or {'n': 200, 'seed': 0}, 'throughput': throughput,
+                                     'accuracy': {'all': accuracy}}}}
+
+
+def test_compare_refuses_different_config():
+    problems = compare(_report(1000), _report(1000, {'n': 2000, 'seed': 0}))
+    assert len(problems) == 1 and 'cấu hình' in problems[0]
+
+
+def test_compare_reports_regressions():
+    assert compare(_report(950), _report(1000)) == []
+    assert 'throughput' in compare(_report(800), _report(1000))[0]
+    assert 'accuracy' in compare(_report(1000, accuracy=0.8), _report(1000))[0]
+
+
+def test_timed_uses_median_run():
+    outputs, latencies, total = _timed(lambda x: x * 2, [1, 2, 3], repeat=3)
+    assert outputs == [2, 4, 6]
+    assert len(latencies) == 9
+    assert total <= sum(latencies)
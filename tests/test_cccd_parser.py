@@ -0,0 +1,21 @@
+import random
+
+import pytest
+
+from bench_parser import SAMPLES, check_parity, mutate
+from cccd_parser import CccdExtractor, parse_cccd_text
+
+
+def _corpus(seed=0, variants=200):
+    # Cùng corpus mặc định với bench_parser.py
+    rng = random.Random(seed)
+    return SAMPLES + [mutate(rng.choice(SAMPLES), rng) for _ in range(variants)]
+
+
+def test_extractor_matches_parse_cccd_text():
+    assert check_parity(CccdExtractor(), _corpus()) == []
+
+
+@pytest.mark.parametrize('text', SAMPLES)
+def test_extractor_matches_on_samples(text):
+    assert CccdExtractor().extract(text) == parse_cccd_text(text)
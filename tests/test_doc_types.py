@@ -0,0 +1,28 @@
+import pytest
+
+from doc_types import extract
+
+CMND = ("CHỨNG MINH NHÂN DÂN\nSố 012345678\nHọ tên NGUYỄN VĂN AN\nSinh ngày 01-02-1990\n"
+        "Nguyên quán Đông Anh, Hà Nội\nNơi ĐKHK thường trú {address}")
+GPLX = ("GIẤY PHÉP LÁI XE / DRIVER'S LICENSE\nSố/No: 790123456789\nHọ tên/Full name: LÊ VĂN BÌNH\n"
+        "Ngày sinh/Date of birth: 03/04/1985\nQuốc tịch/Nationality: VIỆT NAM\n"
+        "Nơi cư trú/Address: Số 10 Lê Lợi, Quận 1\nTP. Hồ Chí Minh\nHạng/Class: B2")
+
+
+@pytest.mark.parametrize('address, expected', [
+    ("Số 5 Phố Huế, Hai Bà Trưng\nHà Nội", "Số 5 Phố Huế, Hai Bà Trưng Hà Nội"),
+    ("Thôn Số 3, Xã An Lạc\nHà Nội", "Thôn Số 3, Xã An Lạc Hà Nội"),
+])
+def test_cmnd_house_number_is_not_id_label(address, expected):
+    info = extract(CMND.format(address=address))
+    assert info['Loại giấy tờ'] == 'cmnd'
+    assert info['CMND'] == '012345678'
+    assert info['Nơi thường trú'] == expected
+
+
+def test_gplx_house_number_is_not_id_label():
+    info = extract(GPLX)
+    assert info['Loại giấy tờ'] == 'gplx'
+    assert info['Số GPLX'] == '790123456789'
+    assert info['Nơi cư trú'] == "Số 10 Lê Lợi, Quận 1 TP. Hồ Chí Minh"
+    assert info['Hạng'] == 'B2'
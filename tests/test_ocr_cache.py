@@ -0,0 +1,50 @@
+import sqlite3
+
+from ocr_cache import OcrCache
+
+
+def test_info_is_reused_only_for_same_version(tmp_path):
+    cache = OcrCache(str(tmp_path / 'cache.sqlite'))
+    cache.put('k', [[]])
+    cache.set_info('k', {'CCCD': '001'}, 'doc_types.extract@1')
+    assert cache.get('k', 'doc_types.extract@1') == ([[]], {'CCCD': '001'})
+    assert cache.get('k', 'doc_types.extract@2') == ([[]], None)
+    cache.close()
+
+
+def test_old_cache_file_is_upgraded(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    conn = sqlite3.connect(path)
+    conn.execute("CREATE TABLE ocr_cache (key TEXT PRIMARY KEY, result TEXT NOT NULL, info TEXT, "
+                 "size INTEGER NOT NULL, last_used REAL NOT NULL)")
+    conn.execute("INSERT INTO ocr_cache VALUES ('k', '[[]]', '{\"CCCD\": \"001\"}', 10, 0)")
+    conn.commit()
+    conn.close()
+    cache = OcrCache(path)
+    assert cache.get('k') == ([[]], None)
+    cache.close()
+
+
+def _last_used(path, key):
+    conn = sqlite3.connect(path)
+    try:
+        return conn.execute("SELECT last_used FROM ocr_cache WHERE key = ?", (key,)).fetchone()[0]
+    finally:
+        conn.close()
+
+
+def test_lru_touches_are_batched(tmp_path):
+    path = str(tmp_path / 'cache.sqlite')
+    cache = OcrCache(path)
+    cache.put('a', [[]])
+    cache.put('b', [[]])
+    before = _last_used(path, 'a')
+    assert cache.get('a') == ([[]], None)
+    # Đọc không ghi xuống file; lần ghi kế tiếp mang theo last_used đã gom
+    assert _last_used(path, 'a') == before
+    cache.put('c', [[]])
+    assert _last_used(path, 'a') > before
+    before = _last_used(path, 'b')
+    cache.get('b')
+    cache.close()
+    assert _last_used(path, 'b') > before
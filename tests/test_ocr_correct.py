@@ -0,0 +1,108 @@
+import pytest
+
+from cccd_parser import parse_cccd_text
+import ocr_correct
+from ocr_correct import Gazetteer, correct_labels
+
+PROVINCES = ['Hà Nội', 'Hà Nam', 'Gia Lai', 'Hồ Chí Minh', 'Bắc Ninh', 'Nam Định', 'Vĩnh Phúc']
+
+
+@pytest.fixture
+def gazetteer():
+    return Gazetteer(PROVINCES)
+
+
+@pytest.mark.parametrize('value', [
+    '12 Lê Lợi, Gia Lâm',
+    'Đông Dư, Gia Lâm',
+    'Huyện Gia Lâm',
+    'Phố Huế, Hà Nội',
+])
+def test_well_formed_district_is_kept(gazetteer, value):
+    assert gazetteer.correct_address(value) == value
+
+
+@pytest.mark.parametrize('value, expected', [
+    ('12 Lê Lợi, Ha Noi', '12 Lê Lợi, Hà Nội'),
+    ('Phố Huế, Tỉnh Gia Lal', 'Phố Huế, Tỉnh Gia Lai'),
+    ('Xã An, TP. Hồ Chí Mính', 'Xã An, TP. Hồ Chí Minh'),
+    ('Hồ Chí Mính', 'Hồ Chí Minh'),
+    ('Đông Anh, Hà Nọi', 'Đông Anh, Hà Nội'),
+    ('Bắc Nính', 'Bắc Ninh'),
+    ('Vĩnh Phuc', 'Vĩnh Phúc'),
+])
+def test_province_is_corrected(gazetteer, value, expected):
+    assert gazetteer.correct_address(value) == expected
+
+
+def test_ambiguous_name_is_kept(gazetteer):
+    # 'Ha Nom' cách 'Hà Nội' và 'Hà Nam' cùng một lỗi
+    assert gazetteer.correct_address('12 Lê Lợi, Ha Nom') == '12 Lê Lợi, Ha Nom'
+
+
+TREE = '''# thử
+Hà Nội
+  Đông Anh
+    Uy Nỗ
+    Kim Nỗ
+  Gia Lâm
+Gia Lai
+  Pleiku
+'''
+
+
+def test_levels_are_corrected_inside_parent(tmp_path):
+    path = tmp_path / 'gazetteer.txt'
+    path.write_text(TREE, encoding='utf-8')
+    g = Gazetteer.load(str(path))
+    assert g.correct_address('Thôn Đông, Xã Uy Nô, Dong Anh, Ha Noi') == 'Thôn Đông, Xã Uy Nỗ, Đông Anh, Hà Nội'
+    # Tên huyện viết đúng không bị đổi thành tỉnh gần giống
+    assert g.correct_address('12 Lê Lợi, Gia Lam') == '12 Lê Lợi, Gia Lam'
+    # Huyện chỉ so với các huyện của tỉnh đã khớp
+    assert g.correct_address('Pleiku, Hà Nội') == 'Pleiku, Hà Nội'
+
+
+def test_default_gazetteer_found_from_any_directory(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(ocr_correct, '_gazetteer', False)
+    assert ocr_correct.correct_address('Dong Anh, Ha Noi') == 'Đông Anh, Hà Nội'
+
+
+# Mọi lỗi OCR trong danh sách regex cũ của fix_common_ocr_errors: (văn bản, nhãn chuẩn, giá trị giữ nguyên).
+# Bỏ mẫu cũ 'date of expiry' -> 'Date of birth' vì đó là lỗi của danh sách cũ.
+OLD_PATTERNS = [
+    ('Place of orign: Hà Nội', 'Place of origin', 'Hà Nội'),
+    ('Independence - Freadom - Happiness', 'Freedom', 'Happiness'),
+    ('Hovà tên Full name LÊ AN', 'Họ và tên Full name', 'LÊ AN'),
+    ('HO VÀ TÊN FULL NAME LÊ AN', 'Họ và tên Full name', 'LÊ AN'),
+    ('ho va ten fullname LÊ AN', 'Họ và tên Full name', 'LÊ AN'),
+    ('Noi thuong tru Place of residence: Xã An', 'Place of residence', 'Xã An'),
+    ('Date of binth: 01/01/1990', 'Date of birth', '01/01/1990'),
+    ('Date of bint: 01/01/1990', 'Date of birth', '01/01/1990'),
+    ('Date of birth! 01/01/1990', 'Date of birth', '01/01/1990'),
+    ('Date of birth, 01/01/1990', 'Date of birth', '01/01/1990'),
+    ('Sex.Nam', 'Sex', 'Nam'),
+    ('SexNam', 'Sex', 'Nam'),
+    ('Sex Nu', 'Sex', 'Nu'),
+    ('Quoc tich Natiohality: Việt Nam', 'Nationality', 'Việt Nam'),
+    ('Place of ferginn: Hà Nội', 'Place of origin', 'Hà Nội'),
+    ('Place of origin: Hà Nội', 'Place of origin', 'Hà Nội'),
+    ('Place of forgin: Hà Nội', 'Place of origin', 'Hà Nội'),
+    ('Place of forgins: Hà Nội', 'Place of origin', 'Hà Nội'),
+    ('Place of tri residence: Xã An', 'Place of residence', 'Xã An'),
+    ('Date afexpiry: 01/01/2030', 'Date of expiry', '01/01/2030'),
+]
+
+
+@pytest.mark.parametrize('text, label, value', OLD_PATTERNS)
+def test_old_patterns_are_corrected(text, label, value):
+    out = correct_labels(text)
+    assert label in out
+    assert out.endswith(value)
+
+
+def test_glued_label_keeps_following_value():
+    # Cửa sổ khớp nhãn không được nuốt token giá trị sau nhãn
+    assert correct_labels('Hovà tên Fullname AN') == 'Họ và tên Full name AN'
+    info = parse_cccd_text('Hovà tên Fullname LÊ AN\nNgày sinh Date of birth: 01/01/1990')
+    assert info['Họ và tên'] == 'LÊ AN'
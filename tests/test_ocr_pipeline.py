@@ -0,0 +1,72 @@
+import numpy as np
+
+import det_resize
+import ocr_pipeline
+from ocr_pipeline import ocr_and_extract, ocr_images
+
+
+class FakeEngine:
+    model_key = ('det', 'rec', 'dict', '3,48,320')
+
+
+class FakeCache:
+    # Mọi khóa đều trúng cache với kết quả OCR cho trước (mặc định rỗng); ghi lại các khóa đã tra và thông tin đã lưu
+    def __init__(self, result=None):
+        self.keys, self.infos = [], {}
+        self.result = result or [[]]
+
+    def get(self, key, info_version=''):
+        self.keys.append(key)
+        return self.result, self.infos.get((key, info_version))
+
+    def set_info(self, key, info, info_version=''):
+        self.infos[key, info_version] = info
+
+
+def test_refine_uses_its_own_cache_key():
+    cache = FakeCache()
+    image = np.zeros((4, 4, 3), np.uint8)
+    ocr_and_extract([image], lambda lines: {}, FakeEngine(), cache=cache)
+    ocr_and_extract([image], lambda lines: {}, FakeEngine(), cache=cache, refine=True)
+    plain, refined = cache.keys
+    assert plain != refined
+    assert refined.split(':')[0].endswith('-refine')
+
+
+def test_cache_hit_is_not_refined_again(monkeypatch):
+    # Kết quả dưới khóa -refine đã được refine trước khi lưu
+    def fail(*args, **kwargs):
+        raise AssertionError('refine_result chạy lại trên kết quả trong cache')
+
+    monkeypatch.setattr(ocr_pipeline, 'refine_result', fail)
+    cached = [[[[[0, 0], [10, 0], [10, 5], [0, 5]], ('NGUYỄN VĂN AN', 0.4)]]]
+    image = np.zeros((4, 4, 3), np.uint8)
+    assert ocr_images([image], FakeEngine(), cache=FakeCache(cached), refine=True) == [cached]
+    (result, text, _), = ocr_and_extract([image], lambda lines: {}, FakeEngine(), cache=FakeCache(cached), refine=True)
+    assert (result, text) == (cached, 'NGUYỄN VĂN AN')
+
+
+def test_cls_is_part_of_cache_key():
+    cache = FakeCache()
+    image = np.zeros((4, 4, 3), np.uint8)
+    ocr_images([image], FakeEngine(), cache=cache)
+    ocr_images([image], FakeEngine(), cache=cache, cls=False)
+    with_cls, without_cls = cache.keys
+    assert with_cls != without_cls
+
+
+def test_retry_records_size_actually_used(monkeypatch):
+    # Lần phát hiện lại ở nấc lớn hơn tự thử thêm một nấc nữa (looks_wrong) và giữ kết quả ở nấc đó
+    small, bigger = det_resize.DET_SIZES[0], det_resize.DET_SIZES[1]
+    used = det_resize.next_size(bigger)
+
+    def detect(engine, card, rectified, size=None):
+        assert size == bigger
+        return [[[0, 0], [1, 0], [1, 1], [0, 1]]], [np.zeros((2, 8, 3), np.uint8)], {'size': used, 'detect_ms': 1.0}
+
+    monkeypatch.setattr(ocr_pipeline, 'detect_adaptive', detect)
+    monkeypatch.setattr(ocr_pipeline, 'recognize', lambda engine, crops, batch_size: [('AN', 0.99)])
+    stat = {'size': small, 'retry': None, 'detect_ms': 0.0}
+    _, rec_res, score = ocr_pipeline._retry_low_confidence(FakeEngine(), False, 8, None, None, stat, [], [('A', 0.1)])
+    assert (rec_res, score) == ([('AN', 0.99)], 0.99)
+    assert stat['size'] == used
@@ -0,0 +1,123 @@
+import asyncio
+import json
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from ocr_server import OcrServer
+
+
+def _stub_process(blobs):
+    # Thay cho _process_batch (không cần mô hình): trả lại nội dung ảnh làm văn bản
+    return [{'text': b.decode(), 'info': {'size': len(b)}} for b in blobs], {}
+
+
+async def _request(port, method, path, body=b'', content_type='image/jpeg'):
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    head = [f'{method} {path} HTTP/1.1', 'Host: 127.0.0.1', f'Content-Length: {len(body)}']
+    if body:
+        head.append(f'Content-Type: {content_type}')
+    writer.write(('\r\n'.join(head) + '\r\n\r\n').encode('latin-1') + body)
+    await writer.drain()
+    response = await reader.read()
+    writer.close()
+    status_line, _, rest = response.partition(b'\r\n')
+    headers, _, payload = rest.partition(b'\r\n\r\n')
+    return int(status_line.split()[1]), headers.decode('latin-1'), json.loads(payload)
+
+
+def _crash_process(blobs):
+    # Tiến trình con chết giữa lô (vd. hết bộ nhớ) khi gặp ảnh 'crash'
+    if b'crash' in blobs:
+        os._exit(1)
+    return _stub_process(blobs)
+
+
+class _PoolServer(OcrServer):
+    # Pool tiến trình thật nhưng không nạp mô hình
+    def _new_executor(self):
+        return ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+
+
+def _serve(test, server_class=OcrServer, **options):
+    # Chạy test(server, port) trên máy chủ thật ở 127.0.0.1, cổng ngẫu nhiên
+    async def run():
+        options.setdefault('process', _stub_process)
+        if server_class is OcrServer:
+            options['executor'] = ThreadPoolExecutor(2)
+        server = server_class(**options)
+        await server.start('127.0.0.1', 0)
+        try:
+            await test(server, server._server.sockets[0].getsockname()[1])
+        finally:
+            await server.close()
+    asyncio.run(run())
+
+
+def test_health():
+    async def run(server, port):
+        status, _, payload = await _request(port, 'GET', '/health')
+        assert (status, payload) == (200, {'status': 'ok'})
+    _serve(run)
+
+
+def test_extract_raw_body():
+    async def run(server, port):
+        status, headers, payload = await _request(port, 'POST', '/extract', 'ảnh thẻ'.encode())
+        assert status == 200
+        assert 'application/json' in headers
+        assert payload['text'] == 'ảnh thẻ'
+        assert payload['info'] == {'size': len('ảnh thẻ'.encode())}
+        assert 'elapsed_ms' in payload
+    _serve(run)
+
+
+def test_extract_multipart():
+    async def run(server, port):
+        body = (b'--XYZ\r\nContent-Disposition: form-data; name="note"\r\n\r\nbo qua\r\n'
+                b'--XYZ\r\nContent-Disposition: form-data; name="image"; filename="cccd.jpg"\r\n'
+                b'Content-Type: image/jpeg\r\n\r\nIMAGEDATA\r\n--XYZ--\r\n')
+        status, _, payload = await _request(port, 'POST', '/extract', body, 'multipart/form-data; boundary=XYZ')
+        assert status == 200
+        assert payload['text'] == 'IMAGEDATA'
+        status, _, payload = await _request(port, 'POST', '/extract', b'--XYZ--\r\n',
+                                            'multipart/form-data; boundary=XYZ')
+        assert status == 400
+    _serve(run)
+
+
+def test_full_queue_returns_503():
+    release = threading.Event()
+
+    def blocking_process(blobs):
+        release.wait(10)
+        return _stub_process(blobs)
+
+    async def run(server, port):
+        # Một tiến trình, hàng đợi một chỗ: lô đầu giữ tiến trình, ảnh thứ hai chờ chỗ, ảnh thứ ba nằm
+        # trong hàng đợi, các ảnh sau bị từ chối
+        tasks = []
+        for i in range(3):
+            tasks.append(asyncio.create_task(_request(port, 'POST', '/extract', f'img{i}'.encode())))
+            await asyncio.sleep(0.1)
+        status, headers, payload = await _request(port, 'POST', '/extract', b'img3')
+        assert status == 503
+        assert 'Retry-After: 1' in headers
+        assert server.stats['rejected'] == 1
+        release.set()
+        done = await asyncio.gather(*tasks)
+        assert [s for s, _, _ in done] == [200, 200, 200]
+    _serve(run, workers=1, max_queue=1, batch_window=0.001, process=blocking_process)
+
+
+def test_broken_pool_fails_only_its_batch():
+    async def run(server, port):
+        status, _, payload = await _request(port, 'POST', '/extract', b'crash')
+        assert status == 422
+        assert payload['error'].startswith('BrokenProcessPool')
+        # Pool được dựng lại, các yêu cầu sau chạy bình thường
+        status, _, payload = await _request(port, 'POST', '/extract', b'img')
+        assert (status, payload['text']) == (200, 'img')
+        assert server.stats['restarts'] == 1
+    _serve(run, _PoolServer, workers=1, batch_window=0.001, process=_crash_process)
@@ -0,0 +1,45 @@
+import multiprocessing as mp
+import os
+
+import pytest
+
+import staged_pipeline
+from staged_pipeline import _stage_loop, iter_staged
+
+# Công đoạn giả được thay bằng monkeypatch, chỉ tiến trình con tạo bằng fork mới thấy
+pytestmark = pytest.mark.skipif(mp.get_start_method() != 'fork', reason="cần start method fork")
+
+
+def _fake_worker(name, in_q, out_q, results, with_metrics, options):
+    # Thay cho các công đoạn thật (không cần mô hình): chuyển thẳng việc sang công đoạn sau,
+    # ảnh tên 'crash-<công đoạn>' làm tiến trình của công đoạn đó chết như khi hết bộ nhớ
+    def handle(item, i, o, r):
+        seq, path = item[:2]
+        if path == f'crash-{name}':
+            os._exit(137)
+        if name == 'parse':
+            r.put(('record', seq, {'file': path, 'error': None}))
+        else:
+            o.put((seq, path))
+    _stage_loop(in_q, out_q, results, with_metrics, handle)
+
+
+@pytest.fixture
+def fake_stages(monkeypatch):
+    monkeypatch.setattr(staged_pipeline, '_worker_main', _fake_worker)
+
+
+def test_all_records_are_returned(fake_stages):
+    paths = [f'img{i}.jpg' for i in range(10)]
+    records = list(iter_staged(paths))
+    assert sorted(r['file'] for r in records) == sorted(paths)
+    assert not any(r['error'] for r in records)
+
+
+@pytest.mark.parametrize('stage, workers', [('decode', 1), ('detect', 2), ('parse', 1)])
+def test_crashed_worker_turns_into_error_records(fake_stages, stage, workers):
+    paths = [f'img{i}.jpg' for i in range(4)] + [f'crash-{stage}'] + [f'img{i}.jpg' for i in range(4, 9)]
+    records = list(iter_staged(paths, {stage: workers}))
+    assert sorted(r['file'] for r in records) == sorted(paths)
+    errors = {r['file']: r['error'] for r in records if r['error']}
+    assert 'exitcode 137' in errors['crash-' + stage]
@@ -0,0 +1,14 @@
+import pytest
+
+from zone_ocr import VALIDATORS, _clean
+
+
+@pytest.mark.parametrize('text, expected', [
+    ('Không thời hạn', 'Không thời hạn'),
+    ('Date of expiry: Không thời hạn', 'Không thời hạn'),
+    ('Date of expiry: 01 / 02/2030', '01/02/2030'),
+])
+def test_expiry_value_is_valid(text, expected):
+    value = _clean('Ngày hết hạn', text)
+    assert value == expected
+    assert VALIDATORS['Ngày hết hạn'].fullmatch(value)
@@ -0,0 +1,126 @@
+import re
+
+from ocr_engine import get_engine
+from ocr_pipeline import REC_BATCH_SIZE, recognize, ocr_and_extract
+from image_io import read_image
+from card_detect import rectify_card
+from metrics import timer, incr
+
+# Vùng của từng trường trên mặt trước thẻ CCCD đã nắn về CANONICAL_SIZE,
+# theo tỉ lệ (x0, y0, x1, y1). Trường nhiều dòng có nhiều vùng, ghép theo thứ tự.
+ZONES = {
+    'CCCD': [(0.40, 0.37, 0.82, 0.47)],
+    'Họ và tên': [(0.28, 0.51, 0.98, 0.58)],
+    'Ngày sinh': [(0.58, 0.57, 0.82, 0.63)],
+    'Giới tính': [(0.50, 0.63, 0.62, 0.69)],
+    'Quốc tịch': [(0.78, 0.63, 0.98, 0.69)],
+    'Quê quán': [(0.28, 0.74, 0.98, 0.81)],
+    'Nơi thường trú': [(0.28, 0.81, 0.98, 0.88), (0.28, 0.88, 0.98, 0.96)],
+    'Ngày hết hạn': [(0.02, 0.88, 0.27, 0.96)],
+}
+
+# Giá trị hợp lệ của từng trường; trường không có mẫu chỉ cần khác rỗng
+VALIDATORS = {
+    'CCCD': re.compile(r'\d{12}'),
+    'Ngày sinh': re.compile(r'[0-3]\d/[01]\d/\d{4}'),
+    'Giới tính': re.compile(r'(?i)nam|nữ|nu'),
+    'Ngày hết hạn': re.compile(r'[0-3]\d/[01]\d/\d{4}|(?i:không thời hạn)'),
+}
+
+# Nhãn in sẵn có thể lọt vào vùng cắt, bỏ đi trước khi kiểm tra
+_LABEL_RE = re.compile(r'^.*?(?:Full name|Date of birth|Sex|Nationality|Place of origin|'
+                       r'Place of residence|Date of expiry)\s*[:.]?\s*', re.IGNORECASE)
+
+
+def crop_zones(card):
+    h, w = card.shape[:2]
+    crops, index = [], []
+    for field, zones in ZONES.items():
+        for x0, y0, x1, y1 in zones:
+            crops.append(card[int(y0 * h):int(y1 * h), int(x0 * w):int(x1 * w)])
+            index.append(field)
+    return crops, index
+
+
+def _clean(field: str, text: str) -> str:
+    if field == 'CCCD':
+        return re.sub(r'\D', '', text)
+    text = _LABEL_RE.sub('', text).strip()
+    if field in ('Ngày sinh', 'Ngày hết hạn') and re.fullmatch(r'[\d/ ]+', text):
+        # Chỉ bỏ khoảng trắng trong ngày tháng ('01 / 02/2030'), giữ nguyên 'Không thời hạn'
+        text = text.replace(' ', '')
+    if field == 'Giới tính':
+        return text.capitalize()
+    if field == 'Quốc tịch':
+        return text.title()
+    return text
+
+
+def _assemble(index, rec_res, min_score: float):
+    # Ghép kết quả theo trường, trả về (thông tin, độ tin cậy thấp nhất, hợp lệ?)
+    parts, scores = {}, {}
+    for field, (txt, score) in zip(index, rec_res):
+        if txt.strip():
+            parts.setdefault(field, []).append(txt.strip())
+        scores[field] = min(scores.get(field, 1.0), float(score))
+    info = {}
+    ok = True
+    for field in ZONES:
+        value = _clean(field, " ".join(parts.get(field, [])))
+        info[field] = value or None
+        validator = VALIDATORS.get(field)
+        if not value or scores.get(field, 0.0) < min_score or (validator and not validator.fullmatch(value)):
+            ok = False
+    return info, min(scores.values(), default=0.0), ok
+
+
+def zone_extract(images, engine=None, min_score: float = 0.8, batch_size: int = REC_BATCH_SIZE):
+    # Nhận diện trực tiếp các vùng trường trên thẻ đã nắn, không chạy SAST.
+    # Trả về [(thông tin hoặc None, độ tin cậy)]; None nghĩa là cần chạy đường đầy đủ.
+    engine = engine or get_engine()
+    all_crops, owners = [], []
+    for i, image in enumerate(images):
+        if not hasattr(image, 'shape'):
+            with timer('decode'):
+                image = read_image(image)
+        with timer('rectify'):
+            card, M = rectify_card(image)
+        if M is None:
+            continue
+        crops, index = crop_zones(card)
+        all_crops.extend(crops)
+        owners.extend((i, field) for field in index)
+
+    with timer('rec'):
+        rec_res = recognize(engine, all_crops, batch_size) if all_crops else []
+    per_card = {}
+    for (i, field), res in zip(owners, rec_res):
+        per_card.setdefault(i, ([], []))
+        per_card[i][0].append(field)
+        per_card[i][1].append(res)
+
+    out = []
+    for i in range(len(images)):
+        if i not in per_card:
+            out.append((None, 0.0))
+            continue
+        info, score, ok = _assemble(*per_card[i], min_score)
+        out.append((info if ok else None, score))
+    return out
+
+
+def extract_with_zones(images, extract_info, engine=None, min_score: float = 0.8,
+                       batch_size: int = REC_BATCH_SIZE, cache=None):
+    # Đường nhanh theo vùng; thẻ có độ tin cậy thấp mới chạy lại ocr.ocr đầy đủ.
+    # Trả về [(văn bản OCR hoặc None, thông tin, 'zone' | 'full')]
+    engine = engine or get_engine()
+    zone_res = zone_extract(images, engine, min_score, batch_size)
+    fallback = [i for i, (info, _) in enumerate(zone_res) if info is None]
+    incr('zone_ok', len(images) - len(fallback))
+    incr('zone_fallback', len(fallback))
+    full = ocr_and_extract([images[i] for i in fallback], extract_info, engine,
+                           batch_size=batch_size, cache=cache) if fallback else []
+    out = [(None, info, 'zone') for info, _ in zone_res]
+    for i, (_, text, info) in zip(fallback, full):
+        out[i] = (text, info, 'full')
+    return out